@@ -1,8 +1,13 @@
 # look in numpy for functions
 # functions should be able to handle inputs of Variable and regular python
 # numbers
+import contextlib
 import numpy as np
-from .variables import Variable, unary_user_function
+from .variables import Variable
+from .compiler import TraceVariable
+from .operators import (SIN, COS, TAN, ARCSIN, ARCCOS, ARCTAN, SINH, COSH,
+                        TANH, ARCSINH, ARCCOSH, ARCTANH, EXP, LOG, LOG10,
+                        LOG2, SQRT, LOGISTIC, UnaryOperator)
 
 # arithmetic
 def add(x, y):
@@ -277,7 +282,7 @@ def sin(x):
     >>> np.sin(0)
     0.0
     """
-    return unary_user_function(lambda x: np.sin(x), lambda x: np.cos(x))(x)
+    return SIN(x)
 
 def cos(x):
     """Returns trigonometric cos of x, can be used to calculate cos of
@@ -316,7 +321,7 @@ def cos(x):
     >>> np.cos(0)
     1.0
     """
-    return unary_user_function(lambda x: np.cos(x), lambda x: -np.sin(x))(x)
+    return COS(x)
 
 def tan(x):
     """Returns trigonometric tan of x, can be used to calculate tan of
@@ -353,7 +358,7 @@ def tan(x):
     >>> np.tan(0)
     0.0
     """
-    return unary_user_function(lambda x: np.tan(x), lambda x: 1/np.cos(x)**2)(x)
+    return TAN(x)
 
 def arcsin(x):
     """Returns trigonometric arcsin of x, can be used to calculate arcsin of
@@ -404,8 +409,7 @@ def arcsin(x):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = -1, upper = 1)
-    return  unary_user_function(lambda x: np.arcsin(x), lambda x: 1/np.sqrt(1-x**2))(x)
+    return _checked(ARCSIN, x, lower = -1, upper = 1)
 
 def arccos(x):
     """Returns trigonometric arccos of x, can be used to calculate arccos of
@@ -456,8 +460,7 @@ def arccos(x):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = -1, upper = 1)
-    return unary_user_function(lambda x: np.arccos(x), lambda x: -1/np.sqrt(1-x**2))(x)
+    return _checked(ARCCOS, x, lower = -1, upper = 1)
 
 def arctan(x):
     """Returns trigonometric arctan of x, can be used to calculate arctan of
@@ -495,7 +498,7 @@ def arctan(x):
     >>> np.arctan(0)
     0.0
     """
-    return unary_user_function(lambda x: np.arctan(x), lambda x: 1.0/(1+x**2))(x)
+    return ARCTAN(x)
 
 # hyperbolic functions
 def sinh(x):
@@ -533,7 +536,7 @@ def sinh(x):
     >>> np.sinh(0)
     0.0
     """
-    return unary_user_function(lambda x: np.sinh(x), lambda x: np.cosh(x))(x)
+    return SINH(x)
 
 def cosh(x):
     """Returns hyberbolic cosh of x, can be used to calculate cosh of
@@ -571,7 +574,7 @@ def cosh(x):
     >>> np.cosh(0)
     1.0
     """
-    return unary_user_function(lambda x: np.cosh(x), lambda x: np.sinh(x))(x)
+    return COSH(x)
 
 def tanh(x):
     """Returns hyberbolic tanh of x, can be used to calculate tanh of
@@ -609,7 +612,7 @@ def tanh(x):
     >>> np.tanh(0)
     0.0
     """
-    return unary_user_function(lambda x: np.tanh(x), lambda x: 1/np.cosh(x)**2)(x)
+    return TANH(x)
 
 def arcsinh(x):
     """Returns hyberbolic inverse arcsinh of x, can be used to calculate
@@ -646,7 +649,7 @@ def arcsinh(x):
     >>> np.arcsinh(0)
     0.0
     """
-    return unary_user_function(lambda x: np.arcsinh(x), lambda x: 1/np.sqrt(x**2+1))(x)
+    return ARCSINH(x)
 
 def arccosh(x):
     """Returns hyberbolic inverse arccosh of x, can be used to calculate
@@ -697,8 +700,7 @@ def arccosh(x):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = 1)
-    return unary_user_function(lambda x: np.arccosh(x), lambda x: 1/np.sqrt(x**2-1))(x)
+    return _checked(ARCCOSH, x, lower = 1)
 
 def arctanh(x):
     """Returns hyberbolic inverse arccosh of x, can be used to calculate
@@ -748,8 +750,7 @@ def arctanh(x):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = -1, upper = 1)
-    return unary_user_function(lambda x: np.arctanh(x), lambda x: 1.0/(1-x**2))(x)
+    return _checked(ARCTANH, x, lower = -1, upper = 1)
 
 # exponentials and logarithms
 def exp(x):
@@ -788,7 +789,7 @@ def exp(x):
     >>> np.exp(0)
     1.0
     """
-    return unary_user_function(lambda x: np.exp(x), lambda x: np.exp(x))(x)
+    return EXP(x)
 
 def log(x, base=np.exp(1)):
     """Returns logarithm of x with any base (defaults to natural logarithm),
@@ -840,8 +841,9 @@ def log(x, base=np.exp(1)):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = 0)
-    return unary_user_function(lambda x: np.log(x)/np.log(base), lambda x: 1/(x*np.log(base)))(x)
+    if base == np.e:
+        return _checked(LOG, x, lower = 0)
+    return _checked(LOG, x, lower = 0)/np.log(base)
 
 def exp2(x):
     """Returns 2 to the power of x, can be used to calculate
@@ -929,8 +931,7 @@ def log10(x):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = 0)
-    return unary_user_function(lambda x: np.log10(x), lambda x: 1/(x*np.log(10)))(x)
+    return _checked(LOG10, x, lower = 0)
 
 def log2(x):
     """Returns logarithm to the base 2 of x, can be used to calculate
@@ -981,8 +982,7 @@ def log2(x):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = 0)
-    return unary_user_function(lambda x: np.log2(x), lambda x: 1/(x*np.log(2)))(x)
+    return _checked(LOG2, x, lower = 0)
 
 # miscellaneous
 def sqrt(x):
@@ -1033,8 +1033,7 @@ def sqrt(x):
     ...     print(e)
     math domain error
     """
-    _check_input(x, lower = 0, lower_inclusive = True)
-    return unary_user_function(lambda x: np.sqrt(x), lambda x: 1/(2*sqrt(x)))(x)
+    return _checked(SQRT, x, lower = 0, lower_inclusive = True)
 
 def logistic(x):
     """Returns square root of x, can be used to calculate
@@ -1071,27 +1070,147 @@ def logistic(x):
     >>> x.der
     {'a': 0.25}
     """
-    return unary_user_function(lambda x: 1/(1+np.exp(-x)), lambda x: np.exp(x)/(1+np.exp(x))**2)(x)
+    return LOGISTIC(x)
 
-def _check_input(x, lower = None, upper = None, lower_inclusive = False, upper_inclusive = False):
+# what functions do with inputs outside of their domain, see domain_policy
+DOMAIN_POLICIES = ('raise', 'nan', 'mask', 'off')
+_domain = {'policy': 'raise'}
+_GUARDS = {}
+
+
+def set_domain_policy(policy):
+    """Sets what AD_numpy functions do with inputs outside of their domain
+    (e.g. log of a negative number) and returns the previous policy
+
+    INPUTS
+    =======
+    policy: str, one of
+        - 'raise' : raise ValueError('math domain error') (default)
+        - 'nan'   : the out-of-domain elements of the result, and their
+          derivatives, are NaN
+        - 'mask'  : the out-of-domain elements of the result, and their
+          derivatives, are 0, so that a sum over a batch ignores them
+        - 'off'   : no check, the NumPy functions are applied as they are,
+          returning NaN with a RuntimeWarning
+
+    NOTES
+    =====
+    Array values are checked element by element. Inputs that are all in the
+    domain go straight to the function, whatever the policy.
+    """
+    if policy not in DOMAIN_POLICIES:
+        raise ValueError("{} is not a valid domain policy, should be one of {}"
+                         .format(policy, DOMAIN_POLICIES))
+    previous = _domain['policy']
+    _domain['policy'] = policy
+    return previous
+
+
+def get_domain_policy():
+    """Returns the current domain policy, see set_domain_policy"""
+    return _domain['policy']
+
+
+@contextlib.contextmanager
+def domain_policy(policy):
+    """Context manager setting the domain policy, see set_domain_policy
+
+    EXAMPLES
+    =========
+    >>> import numpy
+    >>> import automin.autodiff.AD_numpy as np
+    >>> from automin.autodiff.variables import Variable
+    >>> x = Variable('x', numpy.array([4., -1.]))
+    >>> with np.domain_policy('mask'):
+    ...     y = np.sqrt(x)
+    >>> y.val
+    array([2., 0.])
+    >>> y.der
+    {'x': array([0.25, 0.  ])}
+    """
+    previous = set_domain_policy(policy)
     try:
-        val = x.val
-    except AttributeError:
-        val = x
+        yield
+    finally:
+        set_domain_policy(previous)
+
+
+def _check_input(x, lower = None, upper = None, lower_inclusive = False, upper_inclusive = False):
+    """Returns whether the elements of x are outside of the domain bounded
+    by lower and upper, as a boolean (array), or None when they are all in
+    the domain. Bounds are excluded from the domain if they are inclusive."""
+    val = x
+    # unwrap nested variables, e.g. reverse nodes holding forward Variables
+    while hasattr(val, 'val'):
+        val = val.val
+    if isinstance(val, (int, float, np.number)):
+        # plain comparisons are much faster than going through arrays
+        bad = ((lower is not None and (val <= lower if lower_inclusive else val < lower)) or
+               (upper is not None and (val >= upper if upper_inclusive else val > upper)))
+        return True if bad else None
+    val = np.asarray(val)
+    bad = np.zeros(val.shape, dtype=bool)
     if lower is not None:
-        if lower_inclusive:
-            if val <= lower:
-                raise ValueError('math domain error')
-        else:
-            if val < lower:
-                raise ValueError('math domain error')
+        bad |= (val <= lower) if lower_inclusive else (val < lower)
     if upper is not None:
-        if upper_inclusive:
-            if val >= upper:
-                raise ValueError('math domain error')
-        else:
-            if val > upper:
+        bad |= (val >= upper) if upper_inclusive else (val > upper)
+    return bad if bad.any() else None
+
+
+def _guard(op, policy, bounds):
+    """UnaryOperator applying op with the domain policy to every value it
+    receives, so that the policy also holds when a compiled plan is replayed
+    at other points. Built once per operator, policy and bounds, a tuple of
+    the arguments of _check_input after x."""
+    key = (op, policy, bounds)
+    if key in _GUARDS:
+        return _GUARDS[key]
+    lower, upper = bounds[:2]
+    # a point inside the domain, where op is evaluated instead of bad elements
+    if lower is None:
+        safe = upper - 1
+    elif upper is None:
+        safe = lower + 1
+    else:
+        safe = (lower + upper) / 2
+
+    def masked(fn, fill):
+        def apply(x):
+            bad = _check_input(x, *bounds)
+            if bad is None:
+                return fn(x)
+            keep = 1. - np.asarray(bad, dtype=float)
+            return fn(x*keep + safe*(1-keep)) * np.where(bad, fill, 1.)
+        return apply
+
+    if policy == 'raise':
+        def fn(x):
+            if _check_input(x, *bounds) is not None:
                 raise ValueError('math domain error')
+            return op.fn(x)
+        guard = UnaryOperator(fn, op.fn_der, op.name)
+    else:
+        fill = np.nan if policy == 'nan' else 0.
+        guard = UnaryOperator(masked(op, fill), masked(op.fn_der, fill), op.name)
+    _GUARDS[key] = guard
+    return guard
+
+
+def _checked(op, x, lower = None, upper = None, lower_inclusive = False, upper_inclusive = False):
+    """applies the UnaryOperator op to x with the domain policy"""
+    policy = _domain['policy']
+    if policy == 'off':
+        return op(x)
+    bounds = (lower, upper, lower_inclusive, upper_inclusive)
+    if isinstance(x, TraceVariable):
+        # the plan may be replayed outside of the domain, so the check is
+        # recorded with the operation
+        return _guard(op, policy, bounds)(x)
+    if _check_input(x, *bounds) is None:
+        return op(x)
+    if policy == 'raise':
+        raise ValueError('math domain error')
+    return _guard(op, policy, bounds)(x)
 
 
 if __name__ == "__main__":
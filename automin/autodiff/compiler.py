@@ -0,0 +1,532 @@
+"""Trace-and-compile of scalar objectives into flat evaluation plans.
+
+The objective is run once on TraceVariable inputs. Every operator applied to
+a TraceVariable appends one entry to a linear list of operations, so the
+resulting plan can then be replayed with plain NumPy values, forwards for the
+value and backwards for the gradient, without calling the objective again or
+building Variable objects.
+
+A plan is only valid if the objective applies the same operations whatever
+its inputs are. Tracing therefore fails with a TraceError as soon as the
+objective branches on, compares, converts or reads (.val) one of the traced
+values.
+"""
+import numpy as np
+from .operators import NEG, ADD, SUB, MUL, DIV, POW, SUM
+from .reverse import _unbroadcast
+
+
+class TraceError(TypeError):
+    """raised when an objective cannot be compiled into a fixed plan"""
+
+
+class Trace(object):
+    def __init__(self, n_inputs):
+        """Linear record of the operations applied to traced inputs
+
+        NOTES
+        =====
+        Nodes are numbered in order of creation: the inputs come first, then
+        constants and operation results as they appear. ops[k] is a tuple
+        (node, op, args) with the node it defines, the operator applied and
+        the nodes of its operands. consts maps constant nodes to their value
+        and shapes maps the nodes of ops to the shape of their value at the
+        trace point.
+        """
+        self.n_inputs = n_inputs
+        self.n_nodes = n_inputs
+        self.ops = []
+        self.consts = {}
+        self.shapes = {}
+
+    def constant(self, val):
+        node = self.n_nodes
+        self.n_nodes += 1
+        self.consts[node] = val
+        return node
+
+    def record(self, op, args, val):
+        node = self.n_nodes
+        self.n_nodes += 1
+        self.ops.append((node, op, args))
+        self.shapes[node] = np.shape(val)
+        return TraceVariable(self, node, val)
+
+
+class TraceVariable(object):
+    __slots__ = ('trace', 'node', 'value')
+
+    def __init__(self, trace, node, value):
+        """Placeholder value recorded on a Trace
+
+        INPUTS
+        =======
+        trace: Trace on which the operations are recorded
+        node: int, number of the node on the trace
+        value: numeric, value at the point used for tracing
+
+        NOTES
+        =====
+        Unlike Variable, reading val raises a TraceError: an objective that
+        looks at the value of its inputs may take a different path elsewhere.
+        """
+        self.trace = trace
+        self.node = node
+        self.value = value
+
+    def __repr__(self):
+        return "TraceVariable node: {}, Value: {}".format(self.node, self.value)
+
+    def _apply_unary(self, op):
+        """records a UnaryOperator applied to this node"""
+        return self.trace.record(op, (self.node,), op.fn(self.value))
+
+    @classmethod
+    def _apply_binary(cls, op, x1, x2):
+        """records a BinaryOperator applied to x1 and x2, at least one of
+        which is a TraceVariable. Plain operands become constant nodes."""
+        trace = x1.trace if isinstance(x1, cls) else x2.trace
+        args = []
+        vals = []
+        for x in (x1, x2):
+            if isinstance(x, cls):
+                if x.trace is not trace:
+                    raise ValueError('operands are recorded on different traces')
+                args.append(x.node)
+                vals.append(x.value)
+            else:
+                args.append(trace.constant(x))
+                vals.append(x)
+        return trace.record(op, tuple(args), op.fn(*vals))
+
+    def _data_dependent(self, *args):
+        raise TraceError('the objective depends on the value of its inputs '
+                         'through Python control flow and cannot be compiled')
+
+    val = property(_data_dependent)
+    __bool__ = __float__ = __int__ = __index__ = __complex__ = _data_dependent
+    __eq__ = __ne__ = __lt__ = __le__ = __gt__ = __ge__ = _data_dependent
+    __hash__ = object.__hash__
+
+    def sum(self, axis=None, **kwargs):
+        """records the sum of all the elements, also called by numpy.sum"""
+        if axis is not None and np.ndim(self.value) > 1:
+            raise TraceError('only sums over all the axes can be compiled')
+        return SUM(self)
+
+    def mean(self, axis=None, **kwargs):
+        """records the mean of all the elements, also called by numpy.mean"""
+        return self.sum(axis) / np.size(self.value)
+
+    def __pos__(self):
+        return self
+
+    def __neg__(self):
+        return NEG(self)
+
+    def __add__(self, other):
+        return ADD(self, other)
+
+    def __radd__(self, other):
+        return ADD(other, self)
+
+    def __sub__(self, other):
+        return SUB(self, other)
+
+    def __rsub__(self, other):
+        return SUB(other, self)
+
+    def __mul__(self, other):
+        return MUL(self, other)
+
+    def __rmul__(self, other):
+        return MUL(other, self)
+
+    def __truediv__(self, other):
+        return DIV(self, other)
+
+    def __rtruediv__(self, other):
+        return DIV(other, self)
+
+    def __pow__(self, other):
+        return POW(self, other)
+
+    def __rpow__(self, other):
+        return POW(other, self)
+
+
+class CompiledFunction(object):
+    def __init__(self, trace, output):
+        """Replays a Trace with NumPy values
+
+        INPUTS
+        =======
+        trace: Trace of the objective
+        output: TraceVariable returned by the objective, or a plain value if
+            the objective does not depend on its inputs
+        """
+        self.n_inputs = trace.n_inputs
+        self.n_nodes = trace.n_nodes
+        self.ops = trace.ops
+        self.consts = trace.consts
+        self.output = output.node if isinstance(output, TraceVariable) else None
+        self.constant = None if self.output is not None else output
+        # node values before the replay: constants filled in, the rest unset
+        self._init = [None] * self.n_nodes
+        for node, val in self.consts.items():
+            self._init[node] = val
+        # (node, fn, arg1, arg2) forwards and (node, arg1, der1, arg2, der2)
+        # backwards, with arg2 None for unary operators and der None for
+        # constant operands, whose partial derivative is not needed
+        self._forward_plan = []
+        self._backward_plan = []
+        for node, op, args in self.ops:
+            if len(args) == 1:
+                self._forward_plan.append((node, op.fn, args[0], None))
+                self._backward_plan.append((node, args[0], op.fn_der, None, None))
+            else:
+                a, b = args
+                self._forward_plan.append((node, op.fn, a, b))
+                self._backward_plan.append(
+                    (node, a, None if a in self.consts else op.fn_der_x1,
+                     b, None if b in self.consts else op.fn_der_x2))
+        self._backward_plan.reverse()
+
+    def __len__(self):
+        return len(self.ops)
+
+    def _forward(self, x):
+        vals = list(self._init)
+        vals[:self.n_inputs] = x
+        for node, fn, a, b in self._forward_plan:
+            if b is None:
+                vals[node] = fn(vals[a])
+            else:
+                vals[node] = fn(vals[a], vals[b])
+        return vals
+
+    def __call__(self, *x):
+        """value of the objective at the inputs x"""
+        if self.output is None:
+            return self.constant
+        return self._forward(x)[self.output]
+
+    def value_and_grad(self, x):
+        """Returns the value and the gradient of the objective at x
+
+        RETURNS
+        ========
+        val: numeric, value of the objective
+        grad: numpy array with the same length as x. If each x_n is an array
+            of shape (B,), grad has shape (B, len(x)).
+        """
+        if len(x) != self.n_inputs:
+            raise ValueError('expected {} inputs, got {}'.format(self.n_inputs, len(x)))
+        if self.output is None:
+            return self.constant, np.zeros(np.shape(x[0]) + (self.n_inputs,))
+        vals = self._forward(x)
+        out = vals[self.output]
+        adjoints = [None] * self.n_nodes
+        adjoints[self.output] = np.ones_like(out) if np.ndim(out) else 1.
+        for node, a, der_a, b, der_b in self._backward_plan:
+            adj = adjoints[node]
+            if adj is None:
+                continue
+            if b is None:
+                partial = adj * der_a(vals[a])
+                adjoints[a] = partial if adjoints[a] is None else adjoints[a] + partial
+                continue
+            if der_a is not None:
+                partial = adj * der_a(vals[a], vals[b])
+                adjoints[a] = partial if adjoints[a] is None else adjoints[a] + partial
+            if der_b is not None:
+                partial = adj * der_b(vals[a], vals[b])
+                adjoints[b] = partial if adjoints[b] is None else adjoints[b] + partial
+        grad = adjoints[:self.n_inputs]
+        if not np.ndim(out):
+            grad = [0. if g is None else g for g in grad]
+            for idx, g in enumerate(grad):
+                if isinstance(g, np.ndarray) and g.ndim:
+                    # a sum over data arrays leaves array adjoints on scalar inputs
+                    grad[idx] = _unbroadcast(g, np.shape(x[idx]))
+            return out, np.array(grad, dtype=float)
+        for idx, g in enumerate(grad):
+            shape = np.shape(x[idx])
+            grad[idx] = (np.zeros(shape) if g is None else
+                         np.broadcast_to(_unbroadcast(g, shape), shape))
+        return out, np.stack(grad, axis=-1)
+
+    def grad(self, x):
+        """gradient of the objective at x, see value_and_grad"""
+        return self.value_and_grad(x)[1]
+
+    def value_and_directional(self, x, s):
+        """Returns the value of the objective at x and its derivative along
+        the direction s, from one forward replay carrying the tangent s
+
+        RETURNS
+        ========
+        val: numeric, value of the objective
+        slope: numeric, the gradient at x dotted with s
+
+        NOTES
+        =====
+        Every node carries one tangent value next to its value, so the cost
+        does not grow with the number of inputs, unlike value_and_grad.
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.compiler import compile
+        >>> plan = compile(lambda x, y: 100*(y-x**2)**2 + (1-x)**2, 2)
+        >>> plan.value_and_directional([1., 2.], [1., 1.])
+        (100.0, -200.0)
+        """
+        if len(x) != self.n_inputs or len(s) != self.n_inputs:
+            raise ValueError('expected {} inputs, got {}'.format(self.n_inputs, len(x)))
+        if self.output is None:
+            return self.constant, 0.
+        vals = list(self._init)
+        vals[:self.n_inputs] = x
+        tangents = [None] * self.n_nodes
+        tangents[:self.n_inputs] = s
+        # the backward plan holds the partial derivatives in reverse order
+        for (node, fn, a, b), (_, _, der_a, _, der_b) in zip(self._forward_plan,
+                                                             reversed(self._backward_plan)):
+            if b is None:
+                vals[node] = val = fn(vals[a])
+                t = tangents[a]
+                if t is not None:
+                    t = der_a(vals[a]) * t
+            else:
+                vals[node] = val = fn(vals[a], vals[b])
+                t = None
+                if der_a is not None and tangents[a] is not None:
+                    t = der_a(vals[a], vals[b]) * tangents[a]
+                if der_b is not None and tangents[b] is not None:
+                    partial = der_b(vals[a], vals[b]) * tangents[b]
+                    t = partial if t is None else t + partial
+            if t is not None and np.ndim(t) > np.ndim(val):
+                # a sum over data arrays reduces the tangent as well
+                t = np.sum(t)
+            tangents[node] = t
+        t = tangents[self.output]
+        return vals[self.output], 0. if t is None else t
+
+
+def _key(ref):
+    """hashable key of a node reference, constants compare by value"""
+    kind, val = ref
+    if kind == 'c' and np.ndim(val):
+        return ('a', id(val))
+    return ref
+
+
+def _is(ref, val):
+    return ref[0] == 'c' and not np.ndim(ref[1]) and ref[1] == val
+
+
+def _filled(val, shape):
+    """constant val broadcast to shape, a plain number for scalars"""
+    return val if shape == () else np.full(shape, float(val))
+
+
+def _identity(op, refs, shape=()):
+    """result of op when an algebraic identity applies to its operands,
+    as a node reference, or None. shape is the shape of the result, which a
+    constant replacing it keeps."""
+    if len(refs) == 1:
+        return None
+    a, b = refs
+    if op is ADD:
+        if _is(a, 0):
+            return b
+        if _is(b, 0):
+            return a
+    elif op is SUB:
+        if _is(b, 0):
+            return a
+        if a == b:
+            return ('c', _filled(0, shape))
+    elif op is MUL:
+        if _is(a, 0) or _is(b, 0):
+            return ('c', _filled(0, shape))
+        if _is(a, 1):
+            return b
+        if _is(b, 1):
+            return a
+    elif op is DIV:
+        if _is(b, 1):
+            return a
+    elif op is POW:
+        if _is(b, 1):
+            return a
+        if _is(b, 0):
+            return ('c', _filled(1, shape))
+    return None
+
+
+def simplify_trace(trace, output):
+    """Returns an equivalent, smaller trace and its output
+
+    INPUTS
+    =======
+    trace: Trace of the objective
+    output: TraceVariable returned by the objective, or a plain value
+
+    RETURNS
+    ========
+    trace: new Trace
+    output: TraceVariable on the new trace, or a plain value if the
+        objective turned out not to depend on its inputs
+
+    NOTES
+    =====
+    Three passes over the op list:
+        - constant folding: operations whose operands are all constants, and
+          algebraic identities (x+0, x*1, x*0, x-x, x**1, x**0, ...), are
+          replaced by their result. A folded identity keeps the shape of
+          the node it replaces, e.g. 0*x is an array of zeros when x is an
+          array at the trace point
+        - common subexpression elimination: an operation applied to the same
+          operands as an earlier one (up to the order of the operands of +
+          and *) reuses its node
+        - dead code elimination: operations the output does not depend on,
+          e.g. branches folded to a constant, are dropped
+    The identities assume finite values, e.g. 0*x is folded to 0 even
+    though it is nan when x is inf.
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.compiler import Trace, TraceVariable, simplify_trace
+    >>> trace = Trace(2)
+    >>> x, y = TraceVariable(trace, 0, 1.), TraceVariable(trace, 1, 2.)
+    >>> out = (x*y)**2 + 3*(y*x) + 0*x
+    >>> len(trace.ops)
+    7
+    >>> new, new_out = simplify_trace(trace, out)
+    >>> len(new.ops)
+    4
+    """
+    if not isinstance(output, TraceVariable):
+        return trace, output
+    # every old node refers to ('n', node on the new trace) or ('c', value)
+    refs = {idx: ('n', idx) for idx in range(trace.n_inputs)}
+    for node, val in trace.consts.items():
+        refs[node] = ('c', val)
+    folded = Trace(trace.n_inputs)
+    seen = {}
+    for node, op, args in trace.ops:
+        args = [refs[a] for a in args]
+        if all(kind == 'c' for kind, _ in args):
+            refs[node] = ('c', op.fn(*[val for _, val in args]))
+            continue
+        shape = trace.shapes.get(node, ())
+        ref = _identity(op, args, shape)
+        if ref is not None:
+            refs[node] = ref
+            continue
+        keys = [_key(a) for a in args]
+        if op is ADD or op is MUL:
+            keys.sort()
+        key = (op, tuple(keys))
+        if key not in seen:
+            seen[key] = folded.record(op, tuple(args), None).node
+            folded.shapes[seen[key]] = shape
+        refs[node] = ('n', seen[key])
+    kind, out = refs[output.node]
+    if kind == 'c':
+        return Trace(trace.n_inputs), out
+    return _prune(folded, out)
+
+
+def _prune(folded, output):
+    """drops the operations output does not depend on and numbers the
+    remaining nodes, turning constant operands into constant nodes"""
+    live = {output}
+    for node, op, args in reversed(folded.ops):
+        if node in live:
+            live.update(val for kind, val in args if kind == 'n')
+    trace = Trace(folded.n_inputs)
+    nodes = {idx: idx for idx in range(folded.n_inputs)}
+    consts = {}
+    for node, op, args in folded.ops:
+        if node not in live:
+            continue
+        new_args = []
+        for ref in args:
+            kind, val = ref
+            if kind == 'n':
+                new_args.append(nodes[val])
+            else:
+                key = _key(ref)
+                if key not in consts:
+                    consts[key] = trace.constant(val)
+                new_args.append(consts[key])
+        nodes[node] = trace.record(op, tuple(new_args), None).node
+        trace.shapes[nodes[node]] = folded.shapes[node]
+    return trace, TraceVariable(trace, nodes[output], None)
+
+
+def compile(fn, n_inputs, x=None, simplify=True, trusted=False):
+    """Traces fn once and returns a CompiledFunction that evaluates it and
+    its gradient by replaying the recorded operations
+
+    INPUTS
+    =======
+    fn: callable object, scalar function of n_inputs variables built from
+        Variable arithmetic and AD_numpy functions
+    n_inputs: int, number of inputs of fn
+    x: array-like (optional), point at which fn is traced, defaults to ones.
+    simplify: bool (optional), whether to fold constants and remove repeated
+        and unused operations from the plan (see simplify_trace)
+    trusted: bool (optional). By default the plan checks the domain of
+        AD_numpy functions at every replay, with the domain policy (see
+        AD_numpy.set_domain_policy) in effect when fn is traced: the policy
+        is part of the plan, and setting another one afterwards does not
+        change it. A trusted plan leaves the checks out and applies the raw
+        NumPy functions, which return NaN out of their domain.
+
+    RETURNS
+    ========
+    plan: CompiledFunction
+
+    NOTES
+    =====
+    Raises TraceError if fn branches on, compares, converts or reads (.val)
+    the value of an input, since the recorded operations would then only be
+    valid near x.
+    Values fn reads from elsewhere (e.g. data held by a closure) are frozen
+    at trace time.
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.compiler import compile
+    >>> import automin.autodiff.AD_numpy as anp
+    >>> f = lambda x, y: 100*(y-x**2)**2 + (1-x)**2
+    >>> plan = compile(f, 2)
+    >>> plan(1., 2.)
+    100.0
+    >>> plan.grad([1., 2.])
+    array([-400.,  200.])
+    >>> try:
+    ...     compile(lambda x: x if x > 0 else -x, 1)
+    ... except TypeError as e:
+    ...     print(e)
+    the objective depends on the value of its inputs through Python control flow and cannot be compiled
+    """
+    if x is None:
+        x = np.ones(n_inputs)
+    if len(x) != n_inputs:
+        raise ValueError('expected {} inputs, got {}'.format(n_inputs, len(x)))
+    trace = Trace(n_inputs)
+    inputs = [TraceVariable(trace, idx, x_n) for idx, x_n in enumerate(x)]
+    if trusted:
+        # imported here, AD_numpy itself imports this module
+        from .AD_numpy import domain_policy
+        with domain_policy('off'):
+            output = fn(*inputs)
+    else:
+        output = fn(*inputs)
+    if simplify:
+        trace, output = simplify_trace(trace, output)
+    return CompiledFunction(trace, output)
@@ -0,0 +1,109 @@
+"""Second derivatives by forward-over-reverse automatic differentiation.
+
+The objective is recorded on a reverse-mode Tape whose node values are
+forward-mode Variables. The backward sweep then propagates forward-mode
+adjoints: the value of each input's adjoint is the gradient and its tangent
+is the directional derivative of the gradient along the forward seeds.
+Seeding the inputs with one direction v gives the Hessian-vector product
+H v for the cost of a few function evaluations, without forming H.
+"""
+import numpy as np
+from .reverse import Tape, ReverseVariable
+from .variables import Variable, _scope
+
+
+def _forward_over_reverse(fn, inner, var_names):
+    """reverse sweep over forward Variables, returns the input adjoints"""
+    tape = Tape()
+    variables = [tape.variable(name, v) for name, v in zip(var_names, inner)]
+    out = fn(*variables)
+    if not isinstance(out, ReverseVariable):
+        return [0] * len(variables)
+    adjoints = tape.backward(out)
+    return [_reduce(adjoints[v.index], np.shape(x.val))
+            if v.index < len(adjoints) and adjoints[v.index] is not None
+            else 0 for v, x in zip(variables, inner)]
+
+
+def _reduce(adjoint, shape):
+    """sums an adjoint, value and tangent, over the axes that were broadcast
+    against an input of the given shape, e.g. by a sum over a data array"""
+    ndim = np.ndim(getattr(adjoint, 'val', adjoint))
+    if ndim <= len(shape):
+        return adjoint
+    axes = tuple(range(ndim - len(shape)))
+    if isinstance(adjoint, Variable):
+        return adjoint.sum(axis=axes)
+    return np.sum(adjoint, axis=axes)
+
+
+def _split(adjoint, width):
+    """value and tangent of an adjoint, which is a plain number when the
+    gradient component does not depend on the inputs"""
+    try:
+        return adjoint.val, adjoint.tangent[..., :width]
+    except AttributeError:
+        return adjoint, np.zeros(width)
+
+
+def hvp(fn, x, v, var_names=None):
+    """Returns the gradient and the Hessian-vector product of fn at x
+
+    INPUTS
+    =======
+    fn: callable object, scalar function of len(x) variables built from
+        Variable arithmetic and AD_numpy functions
+    x: array-like, point at which the derivatives are evaluated
+    v: array-like, direction with the same length as x
+    var_names: list of str (optional), names of the input variables
+
+    RETURNS
+    ========
+    grad: numpy array, gradient of fn at x
+    Hv: numpy array, product of the Hessian of fn at x with v
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.hessian import hvp
+    >>> f = lambda x, y: x**3 + x*y**2
+    >>> g, Hv = hvp(f, [1., 2.], [1., 0.])
+    >>> g
+    array([7., 4.])
+    >>> Hv
+    array([6., 4.])
+    """
+    if var_names is None:
+        var_names = ['x'+str(idx) for idx in range(len(x))]
+    # all inputs share one forward slot holding their component of v
+    deps = np.ones(1, dtype=bool)
+    inner = [Variable._from_tangent(name, x_n, np.array([v_n], dtype=float), deps)
+             for name, x_n, v_n in zip(var_names, x, v)]
+    adjoints = _forward_over_reverse(fn, inner, var_names)
+    grad, Hv = zip(*[_split(adj, 1) for adj in adjoints])
+    return np.array(grad, dtype=float), np.array(Hv, dtype=float)[:, 0]
+
+
+def hessian(fn, x, var_names=None):
+    """Returns the full Hessian matrix of fn at x from one reverse sweep over
+    forward Variables seeded with the identity
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.hessian import hessian
+    >>> f = lambda x, y: x**3 + x*y**2
+    >>> hessian(f, [1., 2.])
+    array([[6., 4.],
+           [4., 2.]])
+    """
+    if var_names is None:
+        var_names = ['x'+str(idx) for idx in range(len(x))]
+    with _scope(var_names):
+        inner = [Variable(name, x_n) for name, x_n in zip(var_names, x)]
+        adjoints = _forward_over_reverse(fn, inner, var_names)
+        rows = []
+        for adj in adjoints:
+            try:
+                rows.append(adj.gradient(var_names))
+            except AttributeError:
+                rows.append(np.zeros(len(var_names)))
+    return np.array(rows, dtype=float)
@@ -0,0 +1,155 @@
+"""Differentiable primitives shared by the forward and reverse modes.
+
+Every primitive is built once, at import time, as an operator object that
+holds the function and its partial derivatives. The Variable dunder methods
+and the AD_numpy functions dispatch through these objects instead of building
+new closures on every call, and each AD mode only implements how to
+propagate derivatives through an operator (``_apply_unary`` and
+``_apply_binary``).
+
+The derivatives of the primitives are themselves written with operators, so
+they can be differentiated again (e.g. by a reverse sweep over forward-mode
+values to get Hessian-vector products).
+"""
+import numpy as np
+
+# registry of the named primitives, keyed by operator name
+OPERATORS = {}
+
+# plain numeric inputs skip the dispatch to an AD mode
+_NUMERIC = (int, float, complex, np.number, np.ndarray)
+
+
+class UnaryOperator(object):
+    def __init__(self, fn, fn_der, name=None):
+        """Differentiable function of one input
+
+        INPUTS
+        =======
+        fn: function that takes in one input
+        fn_der: function that takes in one input, the derivative of fn
+        name: str (optional), name under which the operator is registered
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.operators import UnaryOperator
+        >>> from automin.autodiff.variables import Variable
+        >>> import numpy as np
+        >>> square = UnaryOperator(lambda x: x**2, lambda x: 2*x)
+        >>> square(Variable('a', 3)).der
+        {'a': 6}
+        >>> square(3)
+        9
+        """
+        self.fn = fn
+        self.fn_der = fn_der
+        self.name = name
+
+    def __repr__(self):
+        return "UnaryOperator({})".format(self.name)
+
+    def __call__(self, x):
+        if isinstance(x, _NUMERIC):
+            return self.fn(x)
+        try:
+            apply = x._apply_unary
+        except AttributeError:
+            return self.fn(x)
+        return apply(self)
+
+
+class BinaryOperator(object):
+    def __init__(self, fn, fn_der_x1, fn_der_x2, name=None):
+        """Differentiable function of two inputs
+
+        INPUTS
+        =======
+        fn: function that takes in two inputs
+        fn_der_x1: function that takes in two inputs, the derivative of fn
+            with respect to x1
+        fn_der_x2: function that takes in two inputs, the derivative of fn
+            with respect to x2
+        name: str (optional), name under which the operator is registered
+        """
+        self.fn = fn
+        self.fn_der_x1 = fn_der_x1
+        self.fn_der_x2 = fn_der_x2
+        self.name = name
+
+    def __repr__(self):
+        return "BinaryOperator({})".format(self.name)
+
+    def __call__(self, x1, x2):
+        try:
+            apply = x1._apply_binary
+        except AttributeError:
+            try:
+                apply = x2._apply_binary
+            except AttributeError:
+                return self.fn(x1, x2)
+        return apply(self, x1, x2)
+
+
+def _register(op):
+    OPERATORS[op.name] = op
+    return op
+
+
+def unary(name, fn, fn_der):
+    """Builds and registers a UnaryOperator"""
+    return _register(UnaryOperator(fn, fn_der, name))
+
+
+def binary(name, fn, fn_der_x1, fn_der_x2):
+    """Builds and registers a BinaryOperator"""
+    return _register(BinaryOperator(fn, fn_der_x1, fn_der_x2, name))
+
+
+# arithmetic
+NEG = unary('neg', lambda x: -x, lambda x: -1)
+ADD = binary('add', lambda x,y: x+y, lambda x,y: 1, lambda x,y: 1)
+SUB = binary('sub', lambda x,y: x-y, lambda x,y: 1, lambda x,y: -1)
+MUL = binary('mul', lambda x,y: x*y, lambda x,y: y, lambda x,y: x)
+DIV = binary('truediv', lambda x,y: x/y, lambda x,y: 1/y, lambda x,y: -x/(y**2))
+POW = binary('pow', lambda x,y: x**y, lambda x,y: y*(x**(y-1)), lambda x,y: x**y*LOG(x))
+
+# trigonometric functions
+SIN = unary('sin', np.sin, lambda x: COS(x))
+COS = unary('cos', np.cos, lambda x: -SIN(x))
+TAN = unary('tan', np.tan, lambda x: 1/COS(x)**2)
+ARCSIN = unary('arcsin', np.arcsin, lambda x: 1/SQRT(1-x**2))
+ARCCOS = unary('arccos', np.arccos, lambda x: -1/SQRT(1-x**2))
+ARCTAN = unary('arctan', np.arctan, lambda x: 1.0/(1+x**2))
+
+# hyperbolic functions
+SINH = unary('sinh', np.sinh, lambda x: COSH(x))
+COSH = unary('cosh', np.cosh, lambda x: SINH(x))
+TANH = unary('tanh', np.tanh, lambda x: 1/COSH(x)**2)
+ARCSINH = unary('arcsinh', np.arcsinh, lambda x: 1/SQRT(x**2+1))
+ARCCOSH = unary('arccosh', np.arccosh, lambda x: 1/SQRT(x**2-1))
+ARCTANH = unary('arctanh', np.arctanh, lambda x: 1.0/(1-x**2))
+
+# exponents and logarithms
+EXP = unary('exp', np.exp, lambda x: EXP(x))
+LOG = unary('log', np.log, lambda x: 1/x)
+LOG10 = unary('log10', np.log10, lambda x: 1/(x*np.log(10)))
+LOG2 = unary('log2', np.log2, lambda x: 1/(x*np.log(2)))
+
+# miscellaneous
+SQRT = unary('sqrt', np.sqrt, lambda x: 1/(2*SQRT(x)))
+LOGISTIC = unary('logistic', lambda x: 1/(1+EXP(-x)), lambda x: EXP(x)/(1+EXP(x))**2)
+
+# reductions: the derivative of a sum of an array is an array of ones, so the
+# reverse sweeps spread its adjoint over every summed element even when the
+# array was itself broadcast from scalars (x + data)
+def _sum_der(x):
+    if isinstance(x, np.ndarray):
+        return np.ones_like(x)
+    if np.ndim(getattr(x, 'val', x)):
+        # a forward Variable holding an array, as in Hessian sweeps: the ones
+        # are a Variable too, so that NumPy does not turn the products of
+        # adjoints with it into object arrays
+        return 0*x + 1
+    return 1
+
+SUM = unary('sum', np.sum, _sum_der)
@@ -0,0 +1,283 @@
+import numpy as np
+from .operators import NEG, ADD, SUB, MUL, DIV, POW, SUM
+
+
+class Tape(object):
+    def __init__(self):
+        """Records every elementary operation applied to its ReverseVariable
+        nodes, so that the whole gradient can be recovered with a single
+        backward sweep
+
+        NOTES
+        =====
+        Each entry of the tape stores the indices of the parent nodes and the
+        local partial derivatives of the node with respect to each parent.
+        Input variables are entries without parents.
+        """
+        self.parents = []
+        self.partials = []
+        self.names = []
+
+    def __len__(self):
+        return len(self.parents)
+
+    def variable(self, name, val):
+        """Returns a new input ReverseVariable recorded on this tape
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.reverse import Tape
+        >>> tape = Tape()
+        >>> a = tape.variable('a', 2)
+        >>> a
+        ReverseVariable name: a, Value: 2
+        """
+        return self.record(val, (), (), name)
+
+    def record(self, val, parents, partials, name=None):
+        self.parents.append(parents)
+        self.partials.append(partials)
+        self.names.append(name)
+        return ReverseVariable(self, len(self.parents) - 1, val, name)
+
+    def backward(self, out):
+        """Returns the adjoint of every node on the tape w.r.t. out
+
+        INPUTS
+        =======
+        out: ReverseVariable recorded on this tape
+
+        RETURNS
+        ========
+        adjoints: list, adjoints[i] is d(out)/d(node i), or None if out does
+            not depend on node i
+        """
+        adjoints = [None] * (out.index + 1)
+        adjoints[out.index] = np.ones_like(out.val) if np.ndim(out.val) else 1
+        for idx in range(out.index, -1, -1):
+            adj = adjoints[idx]
+            if adj is None:
+                continue
+            for parent, partial in zip(self.parents[idx], self.partials[idx]):
+                if adjoints[parent] is None:
+                    adjoints[parent] = adj * partial
+                else:
+                    adjoints[parent] = adjoints[parent] + adj * partial
+        return adjoints
+
+
+class ReverseVariable(object):
+    __slots__ = ('tape', 'index', 'val', 'name')
+
+    def __init__(self, tape, index, val, name=None):
+        """Node of a reverse-mode computational graph
+
+        INPUTS
+        =======
+        tape: Tape on which this node is recorded
+        index: int, position of the node on the tape
+        val: numeric, value of the node
+        name: str (optional), name of the node if it is an input variable
+        """
+        self.tape = tape
+        self.index = index
+        self.val = val
+        self.name = name
+
+    def __repr__(self):
+        return ("ReverseVariable name: {}, Value: {}"
+                .format(self.name, self.val))
+
+    def jacobian(self):
+        """Returns jacobian of variable, computed by one backward sweep
+
+        RETURNS
+        ========
+        value: dict
+
+        NOTES
+        =====
+        POST:
+            - returns jacobian as a dictionary where keys are the names of the
+            input variables this variable depends on
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.reverse import Tape
+        >>> import pprint
+        >>> tape = Tape()
+        >>> a = tape.variable('a', 2)
+        >>> b = tape.variable('b', 3)
+        >>> x = a*b + a
+        >>> pprint.pprint(x.jacobian())
+        {'a': 4, 'b': 2}
+        """
+        adjoints = self.tape.backward(self)
+        return {self.tape.names[idx]: adj for idx, adj in enumerate(adjoints)
+                if adj is not None and self.tape.names[idx] is not None}
+
+    def partial_der(self, dep_var):
+        """Returns partial derivative of a variable w.r.t. another variable.
+
+        INPUTS
+        =======
+        dep_var: ReverseVariable recorded on the same tape
+
+        RETURNS
+        ========
+        value: numeric, element-wise for lists, arrays, or similar structures
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.reverse import Tape
+        >>> tape = Tape()
+        >>> a = tape.variable('a', 2)
+        >>> x = 4*a
+        >>> x.partial_der(a)
+        4
+        """
+        try:
+            adjoints = self.tape.backward(self)
+            if dep_var.index >= len(adjoints) or adjoints[dep_var.index] is None:
+                return 0
+            return _unbroadcast(adjoints[dep_var.index], np.shape(dep_var.val))
+        except AttributeError:
+            print("input is not a Variable")
+
+    def _apply_unary(self, op):
+        """applies a UnaryOperator and records the node on the tape"""
+        # op (rather than op.fn) lets the value itself be a forward Variable
+        return self.tape.record(op(self.val), (self.index,), (op.fn_der(self.val),))
+
+    @classmethod
+    def _apply_binary(cls, op, x1, x2):
+        """applies a BinaryOperator to x1 and x2, at least one of which is a
+        ReverseVariable, and records the node on their tape. Only the partial
+        derivatives w.r.t. the ReverseVariable operands are evaluated."""
+        x1_node = isinstance(x1, cls)
+        x2_node = isinstance(x2, cls)
+        x1_val = x1.val if x1_node else x1
+        x2_val = x2.val if x2_node else x2
+        if x1_node and x2_node and x1.tape is not x2.tape:
+            raise ValueError('operands are recorded on different tapes')
+        tape = x1.tape if x1_node else x2.tape
+        parents = []
+        partials = []
+        if x1_node:
+            parents.append(x1.index)
+            partials.append(op.fn_der_x1(x1_val, x2_val))
+        if x2_node:
+            parents.append(x2.index)
+            partials.append(op.fn_der_x2(x1_val, x2_val))
+        return tape.record(op.fn(x1_val, x2_val), tuple(parents), tuple(partials))
+
+    def sum(self, axis=None, **kwargs):
+        """sum of all the elements, also called by numpy.sum"""
+        if axis is not None and np.ndim(self.val) > 1:
+            raise ValueError('ReverseVariable only supports sums over all the axes')
+        return SUM(self)
+
+    def mean(self, axis=None, **kwargs):
+        """mean of all the elements, also called by numpy.mean"""
+        return self.sum(axis) / np.size(self.val)
+
+    def __pos__(self):
+        return self
+
+    def __neg__(self):
+        return NEG(self)
+
+    def __add__(self, other):
+        return ADD(self, other)
+
+    __radd__ = __add__
+
+    def __sub__(self, other):
+        return SUB(self, other)
+
+    def __rsub__(self, other):
+        return SUB(other, self)
+
+    def __mul__(self, other):
+        return MUL(self, other)
+
+    __rmul__ = __mul__
+
+    def __truediv__(self, other):
+        return DIV(self, other)
+
+    def __rtruediv__(self, other):
+        return DIV(other, self)
+
+    def __pow__(self, other):
+        return POW(self, other)
+
+    def __rpow__(self, other):
+        return POW(other, self)
+
+
+def value_and_grad(fn, x, var_names):
+    """Returns the value and the gradient of fn at x from one forward pass
+    recording a tape and one backward sweep
+
+    INPUTS
+    =======
+    fn: callable object, scalar function of len(x) variables
+    x: array-like, point at which the gradient is evaluated
+    var_names: list of str, names of the input variables
+
+    RETURNS
+    ========
+    val: numeric, value of fn at x
+    grad: numpy array with the same length as x. If each x_n is an array of
+        shape (B,), grad has shape (B, len(x)).
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.reverse import value_and_grad
+    >>> f = lambda x, y: 100*(y-x**2)**2 + (1-x)**2
+    >>> value_and_grad(f, [1., 2.], ['x0', 'x1'])
+    (100.0, array([-400.,  200.]))
+    """
+    tape = Tape()
+    variables = [tape.variable(name, x_n) for name, x_n in zip(var_names, x)]
+    out = fn(*variables)
+    if not isinstance(out, ReverseVariable):
+        # objective does not depend on its inputs
+        return out, np.zeros(np.shape(variables[0].val) + (len(variables),))
+    adjoints = tape.backward(out)
+    grad = []
+    for var in variables:
+        shape = np.shape(var.val)
+        if var.index >= len(adjoints) or adjoints[var.index] is None:
+            grad.append(np.zeros(shape))
+        else:
+            grad.append(np.broadcast_to(
+                _unbroadcast(adjoints[var.index], shape), shape))
+    # inputs holding a batch of values give one gradient row per element
+    return out.val, np.stack(grad, axis=-1)
+
+
+def grad(fn, x, var_names):
+    """Returns the gradient of fn at x using reverse mode, see value_and_grad
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.reverse import grad
+    >>> f = lambda x, y: 100*(y-x**2)**2 + (1-x)**2
+    >>> grad(f, [1., 2.], ['x0', 'x1'])
+    array([-400.,  200.])
+    """
+    return value_and_grad(fn, x, var_names)[1]
+
+
+def _unbroadcast(adj, shape):
+    """sums an adjoint over the axes that were broadcast in the forward pass"""
+    adj_shape = np.shape(adj)
+    if adj_shape == shape:
+        return adj
+    adj = np.sum(adj, axis=tuple(range(len(adj_shape) - len(shape))))
+    axes = tuple(i for i, n in enumerate(shape) if n == 1 and np.shape(adj)[i] != 1)
+    if axes:
+        adj = np.sum(adj, axis=axes, keepdims=True)
+    return adj
@@ -1,17 +1,138 @@
+import contextlib
 import numpy as np
+from .operators import (UnaryOperator, BinaryOperator,
+                        NEG, ADD, SUB, MUL, DIV, POW, SUM)
+
+# shared registry of input variable names; every tangent vector is indexed
+# by the slot of the input variable it is the derivative with respect to.
+# Evaluations register their inputs in a _scope, so that the registry, and
+# with it the length of every tangent, does not grow from one call to the next
+_SLOTS = {}
+_NAMES = []
+
+
+def _register(name):
+    """returns the slot of an input variable name, registering it if needed"""
+    try:
+        return _SLOTS[name]
+    except KeyError:
+        _SLOTS[name] = len(_NAMES)
+        _NAMES.append(name)
+        return _SLOTS[name]
+
+
+@contextlib.contextmanager
+def _scope(names):
+    """Context manager registering the input names of one evaluation and
+    yielding their slots
+
+    NOTES
+    =====
+    The names registered inside the scope, by _scope or by Variables built
+    in it, are removed from the registry when it closes. Tangents seeded
+    inside are then as long as the names registered before the scope, usually
+    none, plus the inputs of the evaluation, whatever the evaluations before.
+    Variables built inside should not outlive the scope: their slots are
+    reused by the next one.
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.variables import _scope, _NAMES
+    >>> with _scope(['u', 'v']) as slots:
+    ...     len(_NAMES) - slots[0]
+    2
+    >>> 'u' in _NAMES
+    False
+    """
+    start = len(_NAMES)
+    try:
+        yield [_register(name) for name in names]
+    finally:
+        for name in _NAMES[start:]:
+            del _SLOTS[name]
+        del _NAMES[start:]
+
 
 class Variable(object):
+    # objectives create one Variable per elementary operation, slots keep
+    # each node to a fixed-size object without an instance dict
+    __slots__ = ('val', '_name', 'tangent', 'deps')
+
     def __init__(self, name, val, der = None, primitive = True):
+        """Forward-mode variable
+
+        NOTES
+        =====
+        Derivatives are stored densely: tangent is an array of shape
+        np.shape(val) + (number of registered input names,) whose last axis is
+        indexed by the shared variable registry, and deps is a boolean mask of
+        the registered inputs the variable depends on. der is a dict view of
+        both, kept for compatibility.
+        """
         self.val = val
+        self.name = name
         if primitive:
-            self.name = name
-            try:
-                self.der = {name : np.ones(val.shape)}
-            except AttributeError:
-                self.der = {name : 1}
+            slot = _register(name)
+            self.deps = np.zeros(len(_NAMES), dtype=bool)
+            self.deps[slot] = True
+            self.tangent = np.zeros(np.shape(val) + (len(_NAMES),),
+                                    dtype=np.result_type(val, 1))
+            self.tangent[..., slot] = 1
         else:
-            self.name = name
-            self.der = der
+            slots = [_register(k) for k in der]
+            self.deps = np.zeros(len(_NAMES), dtype=bool)
+            self.deps[slots] = True
+            self.tangent = np.zeros(np.shape(val) + (len(_NAMES),),
+                                    dtype=np.result_type(val, *der.values()))
+            for slot, d in zip(slots, der.values()):
+                self.tangent[..., slot] = d
+
+    @classmethod
+    def _from_tangent(cls, name, val, tangent, deps):
+        """builds a non-primitive variable directly from its dense tangent"""
+        var = cls.__new__(cls)
+        var.val = val
+        var._name = name
+        var.tangent = tangent
+        var.deps = deps
+        return var
+
+    @property
+    def name(self):
+        """name of the variable; the name f(inputs) of an intermediate
+        variable is only built the first time it is read"""
+        if self._name is None:
+            self._name = _node_name(self.deps)
+        return self._name
+
+    @name.setter
+    def name(self, name):
+        self._name = name
+
+    @property
+    def der(self):
+        """dict of partial derivatives keyed by input name"""
+        return {_NAMES[slot]: _item(self.tangent[..., slot])
+                for slot in np.flatnonzero(self.deps)}
+
+    def gradient(self, var_names):
+        """Returns the partial derivatives w.r.t. the named inputs as an array
+        of shape np.shape(val) + (len(var_names),)
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.variables import Variable
+        >>> a = Variable('a', 2)
+        >>> b = Variable('b', 3)
+        >>> x = a*b
+        >>> x.gradient(['b', 'a'])
+        array([2, 3])
+        """
+        slots = np.array([_register(name) for name in var_names], dtype=int)
+        tangent = self.tangent
+        if slots.size and slots.max() >= tangent.shape[-1]:
+            tangent, _ = _pad(tangent, self.deps, len(_NAMES))
+        return tangent[..., slots]
 
     def __repr__(self):
         """
@@ -55,9 +176,13 @@ class Variable(object):
         input is not a Variable
         """
         try:
-            return self.der.get(dep_var.name,0)
+            slot = _SLOTS.get(dep_var.name)
         except AttributeError:
             print("input is not a Variable")
+            return
+        if slot is None or slot >= len(self.deps) or not self.deps[slot]:
+            return 0
+        return _item(self.tangent[..., slot])
 
     def jacobian(self):
         """Returns jacobian of variable
@@ -84,47 +209,70 @@ class Variable(object):
         """
         return self.der
 
+    def _apply_unary(self, op):
+        """propagates the tangent through a UnaryOperator"""
+        if op is SUM:
+            # e.g. a reverse-mode sum over forward Variables in Hessian sweeps
+            return self.sum()
+        tangent = _scale(self.tangent, op.fn_der(self.val))
+        return Variable._from_tangent(None, op.fn(self.val), tangent, self.deps)
+
+    @classmethod
+    def _apply_binary(cls, op, x1, x2):
+        """propagates the tangents of x1 and x2 through a BinaryOperator"""
+        # get dep variables and variables
+        x1_val, x2_val, tangent1, tangent2, deps1, deps2 = _unpack_vars(x1, x2)
+        # calculate derivative: df/dx1*dx1/dy + df/dx2*dx2/dy, only for the
+        # operands that are variables
+        if tangent1 is not None:
+            tangent1 = _scale(tangent1, op.fn_der_x1(x1_val, x2_val))
+        if tangent2 is not None:
+            tangent2 = _scale(tangent2, op.fn_der_x2(x1_val, x2_val))
+        if tangent1 is None:
+            tangent, deps = tangent2, deps2
+        elif tangent2 is None:
+            tangent, deps = tangent1, deps1
+        else:
+            if len(deps1) < len(deps2):
+                tangent1, deps1 = _pad(tangent1, deps1, len(deps2))
+            elif len(deps2) < len(deps1):
+                tangent2, deps2 = _pad(tangent2, deps2, len(deps1))
+            tangent, deps = tangent1 + tangent2, deps1 | deps2
+        # return new variable
+        return cls._from_tangent(None, op.fn(x1_val, x2_val), tangent, deps)
+
     def __pos__(self):
-        return Variable(self.name, self.val, der, False)
+        return Variable._from_tangent(self._name, self.val, self.tangent, self.deps)
 
     def __neg__(self):
-        neg = unary_user_function(lambda x: -x, lambda x: -1)
-        return neg(self)
+        return NEG(self)
 
     def __add__(self, other):
-        add = binary_user_function(lambda x,y: x+y, lambda x,y: 1, lambda x,y: 1)
-        return add(self, other)
+        return ADD(self, other)
 
     __radd__ = __add__
 
     def __sub__(self, other):
-        sub = binary_user_function(lambda x,y: x-y, lambda x,y: 1, lambda x,y: -1)
-        return sub(self, other)
+        return SUB(self, other)
 
     def __rsub__(self, other):
-        sub = binary_user_function(lambda x,y: x-y, lambda x,y: 1, lambda x,y: -1)
-        return sub(other, self)
+        return SUB(other, self)
 
     def __mul__(self, other):
-        mul = binary_user_function(lambda x,y: x*y, lambda x,y: y, lambda x,y: x)
-        return mul(self, other)
+        return MUL(self, other)
     __rmul__ = __mul__
 
     def __truediv__(self, other):
-        div = binary_user_function(lambda x,y: x/y, lambda x,y: 1/y, lambda x,y: -x/(y**2))
-        return div(self, other)
+        return DIV(self, other)
 
     def __rtruediv__(self, other):
-        div = binary_user_function(lambda x,y: x/y, lambda x,y: 1/y, lambda x,y: -x/(y**2))
-        return div(other,self)
+        return DIV(other,self)
 
     def __pow__(self, other):
-        pow = binary_user_function(lambda x,y: x**y, lambda x,y: y*(x**(y-1)), lambda x,y: x**y*np.log(x))
-        return pow(self, other)
+        return POW(self, other)
 
     def __rpow__(self, other):
-        pow = binary_user_function(lambda x,y: x**y, lambda x,y: y*(x**(y-1)), lambda x,y: x**y*np.log(x))
-        return pow(other,self)
+        return POW(other,self)
 
     def __eq__(self, other):
         try:
@@ -141,6 +289,32 @@ class Variable(object):
         else:
             return True
 
+    def sum(self, axis=None, **kwargs):
+        """Sum of the elements of an array-valued variable over the given
+        axes (all by default), also called by numpy.sum
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.variables import Variable
+        >>> import numpy as np
+        >>> a = Variable('a', 2.)
+        >>> x = np.sum(np.array([1., 2., 3.])*a**2)
+        >>> x.val, x.der
+        (24.0, {'a': 24.0})
+        """
+        axes = _axes(axis, np.ndim(self.val))
+        # the tangent of a scalar broadcast against an array is not expanded
+        tangent = np.broadcast_to(self.tangent, np.shape(self.val) + np.shape(self.tangent)[-1:])
+        return Variable._from_tangent(self._name, np.sum(self.val, axis=axes),
+                                      np.sum(tangent, axis=axes), self.deps)
+
+    def mean(self, axis=None, **kwargs):
+        """Mean of the elements of an array-valued variable over the given
+        axes (all by default), also called by numpy.mean"""
+        axes = _axes(axis, np.ndim(self.val))
+        count = int(np.prod([np.shape(self.val)[ax] for ax in axes]))
+        return self.sum(axis=axes) / count
+
     def dot(self, other):
         matmul = binary_user_function(lambda x,y: x.dot(y), lambda x,y: y*(x**(y-1)), lambda x,y: x**y*np.log(x))
 
@@ -159,7 +333,7 @@ def unary_user_function(fn, fn_der):
 
     RETURNS
     ========
-    AD_fn: function that takes in one input
+    AD_fn: UnaryOperator, callable that takes in one input
        Mathematical function that can be applied to the variable class
 
     NOTES
@@ -189,13 +363,7 @@ def unary_user_function(fn, fn_der):
     >>> ad_sec(2)
     -2.402997961722381
     """
-    def AD_fn(x):
-        try:
-            name = 'f('+','.join(x.der.keys())+')'
-            return Variable(name, fn(x.val), {k:v*fn_der(x.val) for (k,v) in x.der.items()}, False)
-        except AttributeError:
-            return fn(x)
-    return AD_fn
+    return UnaryOperator(fn, fn_der)
 
 def binary_user_function(fn, fn_der_x1, fn_der_x2):
     """Given a function and its derivative, returns an original function that
@@ -213,7 +381,7 @@ def binary_user_function(fn, fn_der_x1, fn_der_x2):
 
     RETURNS
     ========
-    AD_fn: function that takes in two inputs
+    AD_fn: BinaryOperator, callable that takes in two inputs
        Mathematical function that can be applied to the variable class
 
     NOTES
@@ -227,44 +395,58 @@ def binary_user_function(fn, fn_der_x1, fn_der_x2):
          - returns a function AD_fn that has a single input
          - AD_fn should work on numeric types as well as on variable class
     """
-    def AD_fn(x1, x2):
-        # get dep variables and variables
-        x1_val, x2_val, der1, der2 = _unpack_vars(x1, x2)
-        dep_vars = set(der1).union(der2)
-        #calculate derivative
-        der = {}
-        for dep_var in dep_vars:
-            # df/dx1*dx1/dy
-            dep_var_der1 = der1.get(dep_var, 0)
-            if dep_var_der1 != 0:
-                partial_x1 = fn_der_x1(x1_val,x2_val) * dep_var_der1
-            else:
-                partial_x1 = 0
-            # df/dx2*dx2/dy
-            dep_var_der2 = der2.get(dep_var, 0)
-            if dep_var_der2 != 0:
-                partial_x2 = fn_der_x2(x1_val,x2_val) * dep_var_der2
-            else:
-                partial_x2 = 0
-            der[dep_var] = partial_x1 + partial_x2
-        # get function name
-        name = 'f('+','.join(der.keys())+')'
-        # return new variable
-        return Variable(name, fn(x1_val,x2_val), der, False)
-    return AD_fn
+    return BinaryOperator(fn, fn_der_x1, fn_der_x2)
 
 def _unpack_vars(x1, x2):
-    """gets the dependent variables and values of variables"""
+    """gets the values, tangents and dependency masks of variables"""
     try:
-        der1 = x1.der
+        tangent1 = x1.tangent
+        deps1 = x1.deps
         x1_val = x1.val
     except AttributeError:
-        der1 = {}
+        tangent1 = deps1 = None
         x1_val = x1
     try:
-        der2 = x2.der
+        tangent2 = x2.tangent
+        deps2 = x2.deps
         x2_val = x2.val
     except AttributeError:
-        der2 = {}
+        tangent2 = deps2 = None
         x2_val = x2
-    return x1_val, x2_val, der1, der2
+    return x1_val, x2_val, tangent1, tangent2, deps1, deps2
+
+def _scale(tangent, partial):
+    """multiplies a tangent by a partial derivative of the value's shape"""
+    if isinstance(partial, np.ndarray) and partial.ndim:
+        return tangent * partial[..., None]
+    return tangent * partial
+
+def _pad(tangent, deps, n):
+    """extends a tangent and its dependency mask with zeros up to n slots"""
+    extra = n - len(deps)
+    tangent = np.concatenate(
+        [tangent, np.zeros(tangent.shape[:-1] + (extra,), dtype=tangent.dtype)],
+        axis=-1)
+    deps = np.concatenate([deps, np.zeros(extra, dtype=bool)])
+    return tangent, deps
+
+def _node_name(deps):
+    # seeded tangents (e.g. compressed or directional) may have more slots
+    # than registered names
+    return 'f('+','.join([_NAMES[slot] for slot in deps.nonzero()[0]
+                          if slot < len(_NAMES)])+')'
+
+def _axes(axis, ndim):
+    """reduction axes of a value as a tuple of non-negative ints, which also
+    index the value axes of its tangent"""
+    if axis is None:
+        return tuple(range(ndim))
+    if np.ndim(axis) == 0:
+        axis = (axis,)
+    return tuple(ax % ndim for ax in axis)
+
+def _item(der):
+    """returns scalar derivatives as python numbers, arrays unchanged"""
+    if np.ndim(der):
+        return der
+    return der.item()
@@ -1,6 +1,6 @@
 import numpy as np
-import pandas as pd
-from .variables import Variable
+from .operators import SUM
+from .variables import Variable, _NAMES, _SLOTS
 
 class vector_Variable(object):
     def __init__(self, variable_vec):
@@ -10,16 +10,36 @@ class vector_Variable(object):
 
         self.variables = variable_vec
         self.val = np.array([i.val for i in variable_vec])
-        self.der = pd.concat([pd.DataFrame(i.jacobian(), index=[i.name]) for i in variable_vec],
-         sort=True, ignore_index=True).fillna(0)
-
-    def jacobian(self):
+        # the jacobian is only assembled the first time it is read
+        self._columns = self._der = None
+
+    @property
+    def columns(self):
+        """input names in the order of the columns of der"""
+        if self._columns is None:
+            self._columns, self._der = _jacobian_matrix(self.variables)
+        return self._columns
+
+    @property
+    def der(self):
+        """dense jacobian as a numpy array, columns ordered as columns"""
+        if self._der is None:
+            self._columns, self._der = _jacobian_matrix(self.variables)
+        return self._der
+
+    def jacobian(self, format='dataframe'):
         """Returns jacobian of variable
 
+        INPUTS
+        =======
+        format: str (optional), one of
+            - 'dataframe': pandas dataframe whose columns are the input names
+            - 'array': numpy array, columns ordered as self.columns
+            - 'csr': scipy.sparse.csr_matrix, columns ordered as self.columns
 
         RETURNS
         ========
-        value: pandas dataframe
+        value: pandas dataframe, numpy array or scipy.sparse.csr_matrix
 
         NOTES
         =====
@@ -43,8 +63,21 @@ class vector_Variable(object):
         >>> print(f.jacobian().values)
         [[ 3.          1.0100075  -0.90929743]
          [ 3.88051086  2.92034057  0.        ]]
+        >>> f.columns
+        ['a', 'b', 'c']
+        >>> f.jacobian('csr').nnz
+        5
         """
-        return self.der
+        if format == 'dataframe':
+            # pandas is only imported when a dataframe is requested
+            import pandas as pd
+            return pd.DataFrame(self.der, columns=self.columns)
+        elif format == 'array':
+            return self.der
+        elif format == 'csr':
+            from scipy.sparse import csr_matrix
+            return csr_matrix(self.der)
+        raise ValueError("{} is not a valid jacobian format".format(format))
 
     def partial_der(self, dep_var):
         """Returns partial derivative of a variable w.r.t. another variable.
@@ -87,12 +120,53 @@ class vector_Variable(object):
         array([0., 0.])
         """
         try:
-            if dep_var.name not in self.der.columns.values:
-                return np.zeros(self.der.shape[0])
-            else:
-                return self.der[dep_var.name].values
+            name = dep_var.name
         except AttributeError:
             print('input is not a Variable')
+            return
+        if name not in self.columns:
+            return np.zeros(self.der.shape[0])
+        return self.der[:, self.columns.index(name)]
+
+    def sparsity(self, columns=None):
+        """Returns the sparsity pattern of the jacobian, read from the inputs
+        each output depends on
+
+        INPUTS
+        =======
+        columns: list of str (optional), input names in the order of the
+            columns, defaults to self.columns
+
+        RETURNS
+        ========
+        pattern: scipy.sparse.csr_matrix of bools, True where an output
+            depends on an input
+
+        EXAMPLES
+        =========
+        >>> from automin.autodiff.variables import Variable
+        >>> from automin.autodiff.vector_variables import vectorize_variable
+        >>> f = vectorize_variable(lambda x, y, z: [x*y, 2*z, z-x])
+        >>> jac = f(Variable('x', 1), Variable('y', 2), Variable('z', 3))
+        >>> jac.sparsity().toarray()
+        array([[ True,  True, False],
+               [False, False,  True],
+               [ True, False,  True]])
+        """
+        from scipy.sparse import csr_matrix
+        if columns is None:
+            columns = self.columns
+        col_of_slot = {_SLOTS[name]: col for col, name in enumerate(columns)
+                       if name in _SLOTS}
+        indices = []
+        indptr = [0]
+        for v in self.variables:
+            cols = sorted(col_of_slot[slot] for slot in np.flatnonzero(v.deps)
+                          if slot in col_of_slot)
+            indices.extend(cols)
+            indptr.append(len(indices))
+        return csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr),
+                          shape=(len(self.variables), len(columns)))
 
     def __repr__(self):
         individual_variables = ["f{}: {}".format(idx, v.__repr__()) for idx, v in enumerate(self.variables)]
@@ -167,6 +241,197 @@ class vector_Variable(object):
         else:
             return True
 
+def _jacobian_matrix(variable_vec):
+    """Builds the dense jacobian of a vector of Variables in one pass over
+    their tangents, returns the sorted input names and the matrix"""
+    n_slots = max(len(v.deps) for v in variable_vec)
+    deps = np.zeros(n_slots, dtype=bool)
+    for v in variable_vec:
+        deps[:len(v.deps)] |= v.deps
+    slots = sorted(np.flatnonzero(deps), key=lambda slot: _NAMES[slot])
+    columns = [_NAMES[slot] for slot in slots]
+    slots = np.array(slots, dtype=int)
+    dtype = np.result_type(*[v.tangent for v in variable_vec])
+    jac = np.zeros((len(variable_vec), len(slots)), dtype=dtype)
+    for row, v in enumerate(variable_vec):
+        present = slots < len(v.deps)
+        jac[row, present] = v.tangent[slots[present]]
+    return columns, jac
+
+class _PatternVariable(Variable):
+    # deps is the frozenset of the columns (input positions) the value
+    # depends on, tangent is unused
+    __slots__ = ()
+
+    @property
+    def name(self):
+        return self._name
+
+    def _apply_unary(self, op):
+        """the result depends on the same inputs"""
+        return _PatternVariable._from_tangent(None, op.fn(self.val), None, self.deps)
+
+    @classmethod
+    def _apply_binary(cls, op, x1, x2):
+        """the result depends on the inputs of both operands"""
+        x1_node = isinstance(x1, cls)
+        x2_node = isinstance(x2, cls)
+        val = op.fn(x1.val if x1_node else x1, x2.val if x2_node else x2)
+        if not x2_node:
+            deps = x1.deps
+        elif not x1_node or x1.deps is x2.deps:
+            deps = x2.deps
+        else:
+            deps = x1.deps | x2.deps
+        return cls._from_tangent(None, val, None, deps)
+
+    def sum(self, axis=None, **kwargs):
+        return SUM(self)
+
+    def mean(self, axis=None, **kwargs):
+        return SUM(self) / np.size(self.val)
+
+def jacobian_sparsity(fn, x, var_names=None):
+    """Returns the sparsity pattern of the jacobian of a vector function from
+    one pass at x propagating only which inputs each value depends on
+
+    INPUTS
+    =======
+    fn: callable object, vector function of len(x) variables returning a list
+        of Variables or a vector_Variable
+    x: array-like, point at which fn is evaluated
+    var_names: list of str (optional), names of the input variables
+
+    RETURNS
+    ========
+    pattern: scipy.sparse.csr_matrix of bools, columns ordered as x
+
+    NOTES
+    =====
+    The pattern is structural: an output depends on an input if the input
+    appears in its expression, even if the derivative happens to be 0 at x.
+    Each value carries the set of the inputs it depends on instead of a
+    tangent, so the pass needs memory in proportion to the number of
+    nonzeros of the jacobian rather than to its size.
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.vector_variables import jacobian_sparsity
+    >>> jacobian_sparsity(lambda x, y, z: [x*y, 2*z, 3], [1., 2., 3.]).toarray()
+    array([[ True,  True, False],
+           [False, False,  True],
+           [False, False, False]])
+    """
+    from scipy.sparse import csr_matrix
+    if var_names is None:
+        var_names = ['x'+str(idx) for idx in range(len(x))]
+    out = fn(*[_PatternVariable._from_tangent(name, x_n, None, frozenset((col,)))
+               for col, (name, x_n) in enumerate(zip(var_names, x))])
+    out = getattr(out, 'variables', out)
+    indices = []
+    indptr = [0]
+    for v in out:
+        if isinstance(v, _PatternVariable):
+            indices.extend(sorted(v.deps))
+        indptr.append(len(indices))
+    return csr_matrix((np.ones(len(indices), dtype=bool), indices, indptr),
+                      shape=(len(indptr) - 1, len(x)))
+
+def color_columns(sparsity):
+    """Greedy coloring of the columns of a jacobian such that no two columns
+    of the same color have a nonzero in the same row
+
+    INPUTS
+    =======
+    sparsity: scipy.sparse matrix or numpy array, sparsity pattern
+
+    RETURNS
+    ========
+    colors: numpy array of ints, color of each column, from 0 to the number
+        of colors minus 1
+
+    NOTES
+    =====
+    Columns are colored in decreasing order of their number of nonzeros.
+    Columns of the same color can share one forward-mode pass, so a banded
+    jacobian needs as many passes as its bandwidth whatever its size.
+
+    EXAMPLES
+    =========
+    >>> import numpy as np
+    >>> from automin.autodiff.vector_variables import color_columns
+    >>> tridiagonal = np.eye(6) + np.eye(6, k=1) + np.eye(6, k=-1)
+    >>> color_columns(tridiagonal)
+    array([2, 0, 1, 2, 0, 1])
+    """
+    from scipy.sparse import csr_matrix
+    pattern = csr_matrix(sparsity, dtype=bool)
+    csc = pattern.tocsc()
+    n_cols = pattern.shape[1]
+    colors = np.full(n_cols, -1, dtype=int)
+    for col in np.argsort(-np.diff(csc.indptr), kind='stable'):
+        rows = csc.indices[csc.indptr[col]:csc.indptr[col+1]]
+        used = set()
+        for row in rows:
+            used.update(colors[pattern.indices[pattern.indptr[row]:pattern.indptr[row+1]]])
+        color = 0
+        while color in used:
+            color += 1
+        colors[col] = color
+    return colors
+
+def sparse_jacobian(fn, x, var_names=None, sparsity=None, colors=None):
+    """Returns the jacobian of a vector function as a sparse matrix, using one
+    forward pass whose tangents have one slot per column color instead of
+    one per input
+
+    INPUTS
+    =======
+    fn: callable object, vector function of len(x) variables returning a list
+        of Variables or a vector_Variable
+    x: array-like, point at which the jacobian is evaluated
+    var_names: list of str (optional), names of the input variables
+    sparsity: sparse matrix or array (optional), sparsity pattern of the
+        jacobian, detected with jacobian_sparsity if not given. Pass it (and
+        colors) to evaluate jacobians with the same pattern at many points.
+    colors: array of ints (optional), column colors from color_columns
+
+    RETURNS
+    ========
+    jac: scipy.sparse.csr_matrix, columns ordered as x
+
+    EXAMPLES
+    =========
+    >>> from automin.autodiff.vector_variables import sparse_jacobian
+    >>> f = lambda x, y, z: [x*y, 2*z, z-x]
+    >>> sparse_jacobian(f, [1., 2., 3.]).toarray()
+    array([[ 2.,  1.,  0.],
+           [ 0.,  0.,  2.],
+           [-1.,  0.,  1.]])
+    """
+    from scipy.sparse import csr_matrix
+    if sparsity is None:
+        sparsity = jacobian_sparsity(fn, x, var_names)
+    pattern = csr_matrix(sparsity, dtype=bool)
+    pattern.sort_indices()
+    if colors is None:
+        colors = color_columns(pattern)
+    if var_names is None:
+        var_names = ['x'+str(idx) for idx in range(len(x))]
+    n_colors = int(colors.max()) + 1 if len(colors) else 0
+    # every input is seeded with the unit vector of its color
+    seeds = np.eye(n_colors)[colors]
+    inputs = [Variable._from_tangent(name, x_n, seed, seed.astype(bool))
+              for name, x_n, seed in zip(var_names, x, seeds)]
+    out = fn(*inputs)
+    out = getattr(out, 'variables', out)
+    data = np.zeros(pattern.nnz)
+    for row, v in enumerate(out):
+        start, stop = pattern.indptr[row], pattern.indptr[row+1]
+        if isinstance(v, Variable) and start < stop:
+            data[start:stop] = v.tangent[colors[pattern.indices[start:stop]]]
+    return csr_matrix((data, pattern.indices, pattern.indptr), shape=pattern.shape)
+
 def vectorize_variable(fn):
     """Given a vector function of variables, returns a function that
     wraps the original function to return a new vector_Variable class
@@ -0,0 +1,137 @@
+"""Memoized evaluation of an objective and its gradient.
+
+The optimizers ask for the objective or its gradient at points they may have
+already visited (e.g. the step accepted by a line search, or points probed
+again after a fallback), or for the value at a point where they computed
+the gradient. EvalCache keeps the last few results of each, keyed by the
+exact bytes of the point, and counts how many evaluations were actually
+computed.
+"""
+from collections import OrderedDict
+import numpy as np
+
+
+class EvalCache(object):
+    def __init__(self, f, value_and_grad, value_and_directional=None, size=8):
+        """Objective and gradient of a point array, each memoized on the
+        last size distinct points
+
+        INPUTS
+        =======
+        f: callable object, f(x) returns the objective value at the point x
+        value_and_grad: callable object, value_and_grad(x) returns the
+            objective value and the gradient at the point x from one pass
+        value_and_directional: callable object (optional),
+            value_and_directional(x, s) returns the objective value and the
+            derivative along s at the point x from one pass. Defaults to
+            the gradient dotted with s.
+        size: int (optional), number of points kept by each cache
+
+        NOTES
+        =====
+        Points are keyed by the bytes of their float64 values, so only a
+        point equal to a cached one bit for bit is a hit. The value computed
+        along with a gradient is cached as well, so f(x) after grad(x) costs
+        nothing. n_f counts the values computed alone, n_grad the passes of
+        value_and_grad, n_directional the passes of value_and_directional,
+        and n_cached the calls answered from the caches. Directional
+        derivatives are not cached, but come from a cached gradient when
+        there is one.
+        The cached gradients are shared, callers must not modify them in
+        place.
+
+        EXAMPLES
+        =========
+        >>> import numpy as np
+        >>> from automin.cache import EvalCache
+        >>> cache = EvalCache(lambda x: x @ x, lambda x: (x @ x, 2*x))
+        >>> x = np.array([1., 2.])
+        >>> cache.grad(x), cache.f(x.copy())
+        (array([2., 4.]), 5.0)
+        >>> cache.evals
+        {'f': 0, 'grad': 1, 'directional': 0, 'cached': 1}
+        """
+        if size < 1:
+            raise ValueError('size must be positive')
+        self._f = f
+        self._value_and_grad = value_and_grad
+        self._value_and_directional = value_and_directional
+        self.size = size
+        self._f_cache = OrderedDict()
+        self._grad_cache = OrderedDict()
+        self.n_f = 0
+        self.n_grad = 0
+        self.n_directional = 0
+        self.n_cached = 0
+
+    def _store(self, cache, key, value):
+        cache[key] = value
+        cache.move_to_end(key)
+        if len(cache) > self.size:
+            cache.popitem(last=False)
+
+    def _get(self, cache, key):
+        """cached value of key, or None"""
+        value = cache.get(key)
+        if value is not None:
+            cache.move_to_end(key)
+        return value
+
+    def f(self, x):
+        """objective value at x"""
+        x = np.asarray(x, dtype=float)
+        key = x.tobytes()
+        value = self._get(self._f_cache, key)
+        if value is not None:
+            self.n_cached += 1
+            return value
+        value = self._f(x)
+        self.n_f += 1
+        self._store(self._f_cache, key, value)
+        return value
+
+    def value_and_grad(self, x):
+        """objective value and gradient at x"""
+        x = np.asarray(x, dtype=float)
+        key = x.tobytes()
+        grad = self._get(self._grad_cache, key)
+        if grad is not None:
+            value = self._get(self._f_cache, key)
+            if value is not None:
+                self.n_cached += 1
+                return value, grad
+        value, grad = self._value_and_grad(x)
+        self.n_grad += 1
+        self._store(self._f_cache, key, value)
+        self._store(self._grad_cache, key, grad)
+        return value, grad
+
+    def grad(self, x):
+        """gradient at x"""
+        return self.value_and_grad(x)[1]
+
+    def value_and_directional(self, x, s):
+        """objective value at x and derivative along s"""
+        if self._value_and_directional is None:
+            value, grad = self.value_and_grad(x)
+            return value, grad @ s
+        x = np.asarray(x, dtype=float)
+        key = x.tobytes()
+        grad = self._get(self._grad_cache, key)
+        if grad is not None:
+            value = self._get(self._f_cache, key)
+            if value is not None:
+                self.n_cached += 1
+                return value, grad @ s
+        value, slope = self._value_and_directional(x, s)
+        self.n_directional += 1
+        self._store(self._f_cache, key, value)
+        return value, slope
+
+    @property
+    def evals(self):
+        """dict of the numbers of values, of values with gradients and of
+        values with directional derivatives computed, and of the calls
+        answered from the caches"""
+        return {'f': self.n_f, 'grad': self.n_grad, 'directional': self.n_directional,
+                'cached': self.n_cached}
@@ -0,0 +1,407 @@
+"""Batches of training data handed to Model losses during stochastic
+optimization, and the sources they are read from.
+
+A source yields the rows of a data set as dicts of column arrays. Besides
+in-memory DataFrames, rows can be streamed from chunked CSV files, NumPy
+.npy memory-maps or any generator, so that an epoch only holds a few chunks
+in memory. Streaming sources read ahead on a background thread.
+"""
+import queue
+import threading
+import numpy as np
+
+
+class BatchArray(np.ndarray):
+    """Column of a batch of rows.
+
+    Behaves like a NumPy array, except that arithmetic with an AD node
+    (Variable, ReverseVariable, ...) is left to the node's reflected
+    operators. The loss then builds one array-valued node for the whole batch
+    instead of an object array holding one node per row.
+
+    EXAMPLES
+    =========
+    >>> import numpy as np
+    >>> from automin.data import BatchArray
+    >>> from automin.autodiff.variables import Variable
+    >>> col = np.array([1., 2., 3.]).view(BatchArray)
+    >>> x = col * Variable('a', 2.)
+    >>> x.val.tolist()
+    [2.0, 4.0, 6.0]
+    >>> np.sum(x).der
+    {'a': 6.0}
+    """
+
+
+def _defer(name):
+    """ndarray operator that returns NotImplemented for AD nodes, so Python
+    calls the node's reflected operator instead"""
+    method = getattr(np.ndarray, name)
+
+    def op(self, other):
+        if hasattr(other, '_apply_binary'):
+            return NotImplemented
+        return method(self, other)
+    op.__name__ = name
+    return op
+
+
+for _name in ('__add__', '__radd__', '__sub__', '__rsub__', '__mul__', '__rmul__',
+              '__truediv__', '__rtruediv__', '__pow__', '__rpow__'):
+    setattr(BatchArray, _name, _defer(_name))
+
+
+def columns(data):
+    """Returns the columns of a DataFrame (or of a dict of arrays) as a dict
+    of NumPy arrays, so that batches can be taken without going through
+    pandas indexing"""
+    return {name: np.asarray(data[name]) for name in data.keys()}
+
+
+def batch(cols, idx):
+    """Returns the rows idx of a dict of column arrays as a dict of
+    BatchArray columns"""
+    return {name: col[idx].view(BatchArray) for name, col in cols.items()}
+
+
+def n_rows(cols):
+    """Number of rows of a dict of column arrays"""
+    return len(next(iter(cols.values()))) if cols else 0
+
+
+class DataSource(object):
+    """Base class of the data a Model is trained on.
+
+    Subclasses implement chunks(shuffle, rng), which yields the rows of one
+    epoch as dicts of column arrays, and batches(batch_size, shuffle, rng)
+    cuts these chunks into batches, reading ahead on a background thread
+    when prefetch is positive. Shuffles draw from rng, a numpy RandomState, or
+    from the global numpy random state when rng is None.
+    """
+    prefetch = 0
+
+    def chunks(self, shuffle=False, rng=None):
+        raise NotImplementedError
+
+    def batches(self, batch_size, shuffle=False, rng=None):
+        """Iterates over the rows of one epoch in batches of batch_size rows
+        (the last one may be smaller), as dicts of BatchArray columns.
+
+        If shuffle is True, rows are shuffled within each chunk and chunks
+        come in the order the subclass gives them, so streaming sources
+        shuffle locally instead of over the whole data set.
+        """
+        batches = _rebatch(self.chunks(shuffle, rng), batch_size, shuffle, rng)
+        return prefetch(batches, self.prefetch) if self.prefetch else batches
+
+
+class ArraySource(DataSource):
+    """In-memory data, from a DataFrame or a dict of equal length arrays.
+
+    EXAMPLES
+    =========
+    >>> import pandas as pd
+    >>> from automin.data import ArraySource
+    >>> source = ArraySource(pd.DataFrame({'x': [1., 2., 3.], 'y': [0., 1., 0.]}))
+    >>> len(source)
+    3
+    >>> [b['x'].tolist() for b in source.batches(2)]
+    [[1.0, 2.0], [3.0]]
+    """
+    def __init__(self, data):
+        self.columns = columns(data)
+
+    def __len__(self):
+        return n_rows(self.columns)
+
+    def take(self, idx):
+        """Returns the rows idx as a dict of BatchArray columns"""
+        return batch(self.columns, idx)
+
+    def chunks(self, shuffle=False, rng=None):
+        yield self.columns
+
+    def batches(self, batch_size, shuffle=False, rng=None):
+        # rows are taken directly from the columns, without copying a chunk
+        n = len(self)
+        order = _rng(rng).permutation(n) if shuffle else np.arange(n)
+        for start in range(0, n, batch_size):
+            yield self.take(order[start:start+batch_size])
+
+
+class CSVSource(DataSource):
+    """Rows of a CSV file, read chunksize rows at a time with pandas.
+
+    INPUTS
+    =======
+    path: path or buffer of the CSV file, reopened every epoch
+    chunksize: int (optional), number of rows read at a time
+    prefetch: int (optional), number of batches read ahead on a background
+        thread, 0 to read in the calling thread
+    kwargs: passed to pandas.read_csv, e.g. usecols or dtype
+
+    NOTES
+    =====
+    The file is read in order, so shuffling only mixes rows within a chunk.
+    """
+    def __init__(self, path, chunksize=10000, prefetch=2, **kwargs):
+        self.path = path
+        self.chunksize = chunksize
+        self.prefetch = prefetch
+        self.kwargs = kwargs
+
+    def chunks(self, shuffle=False, rng=None):
+        import pandas as pd
+        reader = pd.read_csv(self.path, chunksize=self.chunksize, **self.kwargs)
+        # readers are only context managers from pandas 1.2
+        try:
+            for chunk in reader:
+                yield columns(chunk)
+        finally:
+            reader.close()
+
+
+class NpySource(DataSource):
+    """Rows of NumPy .npy files, opened as memory-maps so that only the
+    chunk being read is loaded.
+
+    INPUTS
+    =======
+    path: one of
+        - a dict {column name: path} of 1-d arrays of equal length
+        - the path of a structured array, whose fields are the columns
+        - the path of a 2-d array, whose columns are named by names
+    names: list of str (optional), column names of a 2-d array, by default
+        'x0', 'x1', ...
+    chunksize: int (optional), number of rows read at a time
+    prefetch: int (optional), number of batches read ahead on a background
+        thread, 0 to read in the calling thread
+
+    NOTES
+    =====
+    Shuffling visits the chunks in a random order and mixes the rows within
+    each chunk.
+    """
+    def __init__(self, path, names=None, chunksize=10000, prefetch=2):
+        if isinstance(path, dict):
+            arrays = {name: np.load(p, mmap_mode='r') for name, p in path.items()}
+            self._get = lambda name, rows: arrays[name][rows]
+            self.names = list(arrays)
+            lengths = {len(arr) for arr in arrays.values()}
+            if len(lengths) > 1:
+                raise ValueError('columns must have the same length')
+            self._len = lengths.pop() if lengths else 0
+        else:
+            array = np.load(path, mmap_mode='r')
+            if array.dtype.names is not None:
+                self.names = list(array.dtype.names)
+                self._get = lambda name, rows: array[rows][name]
+            elif array.ndim == 2:
+                self.names = list(names) if names is not None else \
+                    ['x'+str(idx) for idx in range(array.shape[1])]
+                if len(self.names) != array.shape[1]:
+                    raise ValueError('expected {} column names, got {}'
+                                     .format(array.shape[1], len(self.names)))
+                index = {name: idx for idx, name in enumerate(self.names)}
+                self._get = lambda name, rows: array[rows, index[name]]
+            else:
+                raise ValueError('expected a structured or 2-d array, got shape {}'
+                                 .format(array.shape))
+            self._len = len(array)
+        self.chunksize = chunksize
+        self.prefetch = prefetch
+
+    def __len__(self):
+        return self._len
+
+    def chunks(self, shuffle=False, rng=None):
+        starts = np.arange(0, len(self), self.chunksize)
+        if shuffle:
+            starts = _rng(rng).permutation(starts)
+        for start in starts:
+            rows = slice(start, start+self.chunksize)
+            yield {name: np.array(self._get(name, rows)) for name in self.names}
+
+
+class GeneratorSource(DataSource):
+    """Rows produced by a generator of chunks.
+
+    INPUTS
+    =======
+    chunks: function returning a new iterable of chunks at every call, one
+        per epoch, or an iterable used for a single epoch. Chunks are
+        DataFrames or dicts of equal length arrays.
+    prefetch: int (optional), number of batches read ahead on a background
+        thread, 0 to read in the calling thread
+
+    EXAMPLES
+    =========
+    >>> import numpy as np
+    >>> from automin.data import GeneratorSource
+    >>> def gen():
+    ...     for i in range(3):
+    ...         yield {'x': np.full(2, i)}
+    >>> [b['x'].tolist() for b in GeneratorSource(gen).batches(3)]
+    [[0, 0, 1], [1, 2, 2]]
+    """
+    def __init__(self, chunks, prefetch=2):
+        self._chunks = chunks
+        self._used = False
+        self.prefetch = prefetch
+
+    def chunks(self, shuffle=False, rng=None):
+        if callable(self._chunks):
+            chunks = self._chunks()
+        elif self._used:
+            raise RuntimeError('the iterable of this GeneratorSource was already used, '
+                               'pass a function returning a new one for every epoch')
+        else:
+            self._used = True
+            chunks = self._chunks
+        for chunk in chunks:
+            yield columns(chunk)
+
+
+def as_source(data):
+    """Returns data if it is a DataSource, else wraps it in an ArraySource"""
+    return data if isinstance(data, DataSource) else ArraySource(data)
+
+
+class EpochScheduler(object):
+    def __init__(self, source, batch_size=1, shuffle=True, seed=None):
+        """Orders the rows of a data source into the batches of successive
+        epochs
+
+        INPUTS
+        =======
+        source: DataSource, or data accepted by ArraySource
+        batch_size: int (optional), number of rows per batch
+        shuffle: bool (optional), whether each epoch visits the rows in a new
+            random order
+        seed: int (optional), seed of the shuffles, which are then the same
+            from one run to the next
+
+        NOTES
+        =====
+        Rows of an in-memory source are visited through a permutation index,
+        order, which is shuffled in place at the start of every epoch: the
+        data itself is never copied, only the rows of each batch are
+        gathered. Streaming sources shuffle within chunks, see DataSource.
+
+        EXAMPLES
+        =========
+        >>> import numpy as np
+        >>> from automin.data import EpochScheduler
+        >>> scheduler = EpochScheduler({'x': np.arange(5.)}, batch_size=2, shuffle=False)
+        >>> [idx.tolist() for idx in scheduler.indices()]
+        [[0, 1], [2, 3], [4]]
+        >>> [b['x'].tolist() for b in scheduler]
+        [[0.0, 1.0], [2.0, 3.0], [4.0]]
+        >>> scheduler.epoch
+        2
+        """
+        if batch_size < 1:
+            raise ValueError('batch_size must be positive')
+        self.source = as_source(source)
+        self.batch_size = batch_size
+        self.shuffle = shuffle
+        self.rng = np.random.RandomState(seed)
+        # number of epochs started
+        self.epoch = 0
+        self.order = np.arange(len(self.source)) if hasattr(self.source, 'take') else None
+
+    def indices(self):
+        """Iterates over the row indices of the batches of a new epoch, as
+        views of order. Only for in-memory sources."""
+        if self.order is None:
+            raise TypeError('{} does not support random access to its rows'
+                            .format(type(self.source).__name__))
+        self.epoch += 1
+        if self.shuffle:
+            self.rng.shuffle(self.order)
+        for start in range(0, len(self.order), self.batch_size):
+            yield self.order[start:start+self.batch_size]
+
+    def __iter__(self):
+        """Iterates over the batches of a new epoch, as dicts of BatchArray
+        columns"""
+        if self.order is None:
+            self.epoch += 1
+            return iter(self.source.batches(self.batch_size, self.shuffle, self.rng))
+        return (self.source.take(idx) for idx in self.indices())
+
+
+def _rng(rng):
+    """random generator to shuffle with, the global numpy state by default"""
+    return np.random if rng is None else rng
+
+
+def _rebatch(chunks, batch_size, shuffle=False, rng=None):
+    """Cuts a stream of chunks into batches of batch_size rows, carrying the
+    rows left at the end of a chunk over to the next one"""
+    rest = None
+    for chunk in chunks:
+        if shuffle:
+            order = _rng(rng).permutation(n_rows(chunk))
+            chunk = {name: col[order] for name, col in chunk.items()}
+        if rest is not None:
+            chunk = {name: np.concatenate([rest[name], col]) for name, col in chunk.items()}
+        n = n_rows(chunk)
+        stop = n - n % batch_size
+        for start in range(0, stop, batch_size):
+            yield batch(chunk, slice(start, start+batch_size))
+        rest = {name: col[stop:] for name, col in chunk.items()} if stop < n else None
+    if rest is not None:
+        yield batch(rest, slice(None))
+
+
+_DONE = object()
+
+
+def prefetch(iterable, depth=2):
+    """Iterates over iterable while a background thread reads up to depth
+    items ahead.
+
+    Exceptions raised by iterable are raised again in the calling thread, and
+    the background thread stops when the returned generator is closed.
+
+    EXAMPLES
+    =========
+    >>> from automin.data import prefetch
+    >>> list(prefetch(iter(range(5))))
+    [0, 1, 2, 3, 4]
+    """
+    items = queue.Queue(maxsize=depth)
+    stop = threading.Event()
+
+    def put(item):
+        # the consumer may be gone, so never block for good on a full queue
+        while not stop.is_set():
+            try:
+                items.put(item, timeout=0.05)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def worker():
+        try:
+            for item in iterable:
+                if not put((item, None)):
+                    return
+            put((_DONE, None))
+        except BaseException as err:
+            put((_DONE, err))
+
+    thread = threading.Thread(target=worker, daemon=True)
+    thread.start()
+    try:
+        while True:
+            item, err = items.get()
+            if err is not None:
+                raise err
+            if item is _DONE:
+                return
+            yield item
+    finally:
+        stop.set()
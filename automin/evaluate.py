@@ -1,18 +1,25 @@
 import sys
-from .optimizer import minimize
+from .optimizer import minimize_multistart
 from .autodiff.variables import Variable
 import numpy as np
-import matplotlib.pyplot as plt
-import matplotlib.colors as colors
+
+
+def _pyplot():
+    """imports matplotlib on first use, so that importing automin does not
+    pay its import time"""
+    import matplotlib.pyplot as plt
+    return plt
 
 
 def plot_path_2D(val_arr, x_grid, y_grid, fn):
+    plt = _pyplot()
+    from matplotlib.colors import LogNorm
     f_grid = fn(x_grid.reshape(1, -1),
                 y_grid.reshape(-1, 1))
     # f_grid=f_grid-f_grid.min()+1
 
     plt.contourf(x_grid, y_grid, f_grid, cmap='Blues',
-                 norm=colors.LogNorm(vmin=f_grid.min(), vmax=f_grid.max())
+                 norm=LogNorm(vmin=f_grid.min(), vmax=f_grid.max())
                  )
     plt.colorbar(orientation='horizontal')
 
@@ -47,6 +54,7 @@ def plot_path_2D(val_arr, x_grid, y_grid, fn):
 
 
 def plot_path_1D(val_arr, x_grid, fn):
+    plt = _pyplot()
     f_grid = fn(x_grid)
     plt.plot(x_grid, f_grid, label='F function', color='black', linewidth=3.0)
     v0 = val_arr[0]
@@ -73,6 +81,7 @@ def plot_path_1D(val_arr, x_grid, fn):
 
 
 def plot_path(fn, val_lists, title, dim=2, **kwargs):
+    plt = _pyplot()
     n = len(val_lists)
     if n >= 3:
         plt.figure(figsize=(7*3, 8*np.ceil(n/3)))
@@ -91,6 +100,7 @@ def plot_path(fn, val_lists, title, dim=2, **kwargs):
 
 
 def plot_conv(time_lists, label_lists, precision=1e-5):
+    plt = _pyplot()
     n = len(time_lists)
     for i in range(n):
         plt.plot(time_lists[i], label=label_lists[i])
@@ -156,6 +166,7 @@ def plot_accuracy(res, true, i=0, **kwargs):
 
 
 def plot_acc(val_lists, true, label_lists, norm='L2'):
+    plt = _pyplot()
     n = len(val_lists)
     for i in range(n):
         if norm == 'L1':
@@ -192,7 +203,7 @@ if __name__ == "__main__":
     def f1(x, y): return 100*(y-x**2)**2 + (1-x)**2
 
     v0_list = [[-1, 1], [0, 1], [2, 1]]
-    val_lists = [minimize(f1, vo, method="Steepest Descent") for vo in v0_list]
+    val_lists = minimize_multistart(f1, v0_list, method="Steepest Descent").results
     x_grid = np.linspace(-3, 3, 150)
     y_grid = np.linspace(-3, 4, 200)
     plot_path(f1, val_lists, "Steepest Descent", x_grid=x_grid, y_grid=y_grid)
@@ -205,6 +216,6 @@ if __name__ == "__main__":
 
     def f0(x): return x**2+(x-3)**2
     v0_list = [[-1], [0], [2]]
-    val_lists = [minimize(f0, vo, method="Steepest Descent") for vo in v0_list]
+    val_lists = minimize_multistart(f0, v0_list, method="Steepest Descent").results
     x_grid = np.linspace(-2, 4, 150)
     plot_path(f0, val_lists, "Steepest Descent", dim=1, x_grid=x_grid)
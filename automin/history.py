@@ -0,0 +1,116 @@
+"""Recording of the iterates visited by an optimizer.
+
+The iterates are written into preallocated arrays instead of growing Python
+lists, and the recorder can keep all of them, every k-th one, only the last
+N, or none at all.
+"""
+import time
+import numpy as np
+
+MODES = ('full', 'every', 'last', 'off')
+
+
+class History(object):
+    def __init__(self, mode='full', k=1, size=100, capacity=64):
+        """Records the iterates of an optimization and the time at which
+        each one was reached
+
+        INPUTS
+        =======
+        mode: str (optional), one of
+            - 'full'  : every iterate
+            - 'every' : every k-th iterate
+            - 'last'  : only the last size iterates, in a ring buffer
+            - 'off'   : nothing, val_rec and time_rec are empty
+        k: int (optional), recording interval of the 'every' mode
+        size: int (optional), number of iterates kept by the 'last' mode
+        capacity: int (optional), initial number of rows of the 'full' and
+            'every' buffers, which double in size when they fill up
+
+        NOTES
+        =====
+        The clock starts when the first iterate is recorded, so time_rec
+        starts at 0.
+
+        EXAMPLES
+        =========
+        >>> import numpy as np
+        >>> from automin.history import History
+        >>> h = History('last', size=2)
+        >>> for i in range(5):
+        ...     h.record(np.array([i, -i]))
+        >>> h.val_rec
+        array([[ 3., -3.],
+               [ 4., -4.]])
+        >>> h.iterations
+        5
+        """
+        if mode not in MODES:
+            raise ValueError(
+                "{} is not a valid history mode, should be one of {}".format(mode, MODES))
+        if k < 1 or size < 1:
+            raise ValueError('k and size must be positive')
+        self.mode = mode
+        self.k = k
+        self.size = size
+        self.capacity = size if mode == 'last' else capacity
+        # number of record calls, and number of stored rows
+        self.iterations = 0
+        self.count = 0
+        self._vals = None
+        self._times = None
+        self._start = None
+
+    def record(self, x):
+        """stores x if the mode asks for this iteration"""
+        it = self.iterations
+        self.iterations += 1
+        if self._start is None:
+            self._start = time.time()
+        if self.mode == 'off' or (self.mode == 'every' and it % self.k):
+            return
+        if self._vals is None:
+            self._vals = np.empty((self.capacity,) + np.shape(x))
+            self._times = np.empty(self.capacity)
+        if self.mode == 'last':
+            row = self.count % self.size
+        else:
+            row = self.count
+            if row == len(self._vals):
+                self._grow()
+        self._vals[row] = x
+        self._times[row] = time.time() - self._start
+        self.count += 1
+
+    def _grow(self):
+        self._vals = np.concatenate([self._vals, np.empty_like(self._vals)])
+        self._times = np.concatenate([self._times, np.empty_like(self._times)])
+
+    def _ordered(self, buf):
+        if self.mode == 'last' and self.count > self.size:
+            return np.roll(buf, -(self.count % self.size), axis=0)
+        return buf[:self.count].copy()
+
+    @property
+    def val_rec(self):
+        """recorded iterates, oldest first"""
+        if self._vals is None:
+            return np.empty((0,))
+        return self._ordered(self._vals)
+
+    @property
+    def time_rec(self):
+        """time elapsed since the first record at each recorded iterate"""
+        if self._times is None:
+            return np.empty((0,))
+        return self._ordered(self._times)
+
+
+def make_history(history):
+    """Returns a new History from a mode string, a History to copy the
+    settings of, or None for the default 'full' mode"""
+    if history is None:
+        return History()
+    if isinstance(history, History):
+        return History(history.mode, history.k, history.size, history.capacity)
+    return History(history)
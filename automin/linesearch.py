@@ -0,0 +1,175 @@
+"""Line searches shared by the descent methods of the optimizer module.
+
+Both searches work along x + alpha*p and return the values they computed at
+the accepted step, so the optimizers can reuse them instead of evaluating
+the objective or its gradient again.
+"""
+import numpy as np
+
+
+def backtracking(f, x, p, f0, slope, alpha_init=1., beta=0.5, c=1e-4, min_alpha=1e-10):
+    """Backtracking line search for the Armijo (sufficient decrease) condition
+
+    INPUTS
+    =======
+    f: callable object, f(x) returns the objective value at the point x
+    x: numpy array, current point
+    p: numpy array, descent direction
+    f0: float, f(x)
+    slope: float, directional derivative grad(x).p, must be negative
+    alpha_init: float (optional), first step tried
+    beta: float (optional), factor the step is shrunk by after each failure
+    c: float (optional), sufficient decrease constant
+    min_alpha: float (optional), smallest step tried
+
+    RETURNS
+    ========
+    alpha: float, accepted step
+    f_new: float, f(x + alpha*p)
+
+    NOTES
+    =====
+    POST:
+        - f(x + alpha*p) <= f0 + c*alpha*slope, unless alpha reached min_alpha
+
+    EXAMPLES
+    =========
+    >>> import numpy as np
+    >>> from automin.linesearch import backtracking
+    >>> f = lambda x: x @ x
+    >>> x, p = np.array([1.]), np.array([-4.])
+    >>> backtracking(f, x, p, f(x), -8.)
+    (0.25, 0.0)
+    """
+    alpha = alpha_init
+    f_new = f(x + alpha*p)
+    while f_new > f0 + c*alpha*slope and alpha > min_alpha:
+        alpha *= beta
+        f_new = f(x + alpha*p)
+    return alpha, f_new
+
+
+def strong_wolfe(f, grad, x, p, f0, g0, alpha_init=1., c1=1e-4, c2=0.9, max_iter=20, alpha_max=1e10, slope=None):
+    """Line search for the strong Wolfe conditions, by bracketing and then
+    zooming in with safeguarded quadratic interpolation (Nocedal & Wright, Algorithms 3.5
+    and 3.6)
+
+    INPUTS
+    =======
+    f: callable object, f(x) returns the objective value at the point x
+    grad: callable object, grad(x) returns the gradient at the point x
+    x: numpy array, current point
+    p: numpy array, descent direction
+    f0: float, f(x)
+    g0: numpy array, grad(x)
+    alpha_init: float (optional), first step tried
+    c1: float (optional), sufficient decrease constant
+    c2: float (optional), curvature constant, c1 < c2 < 1
+    max_iter: int (optional), maximum number of trial steps
+    alpha_max: float (optional), largest step tried
+    slope: callable object (optional), slope(x) returns the directional
+        derivative grad(x).p. When given, the trial steps after the first
+        one, which are often rejected, only compute slopes, and grad is
+        called at the returned step if its gradient is not known yet.
+
+    RETURNS
+    ========
+    alpha: float, accepted step
+    f_new: float, f(x + alpha*p)
+    g_new: numpy array, grad(x + alpha*p)
+
+    NOTES
+    =====
+    POST:
+        - f(x + alpha*p) <= f0 + c1*alpha*grad(x).p and
+          |grad(x + alpha*p).p| <= c2*|grad(x).p|, unless max_iter trial
+          steps were not enough, in which case the best step satisfying the
+          sufficient decrease condition found so far is returned
+
+    EXAMPLES
+    =========
+    >>> import numpy as np
+    >>> from automin.linesearch import strong_wolfe
+    >>> f = lambda x: x @ x
+    >>> grad = lambda x: 2*x
+    >>> x, p = np.array([1.]), np.array([-4.])
+    >>> alpha, f_new, g_new = strong_wolfe(f, grad, x, p, f(x), grad(x))
+    >>> alpha, f_new
+    (0.25, 0.0)
+    """
+    dphi0 = g0 @ p
+
+    def phi(alpha):
+        x_new = x + alpha*p
+        f_new = f(x_new)
+        return f_new, x_new
+
+    def dphi(x_new, first=False):
+        if slope is not None and not first:
+            # the gradient is only computed at the returned step
+            return None, slope(x_new)
+        g_new = grad(x_new)
+        return g_new, g_new @ p
+
+    # best step satisfying sufficient decrease, returned if the search fails
+    best = (0., f0, g0, x)
+
+    alpha_prev, f_prev, d_prev = 0., f0, dphi0
+    alpha = alpha_init
+    for i in range(max_iter):
+        f_new, x_new = phi(alpha)
+        if f_new > f0 + c1*alpha*dphi0 or (i > 0 and f_new >= f_prev):
+            best = _zoom(phi, dphi, f0, dphi0, alpha_prev, f_prev, d_prev,
+                         alpha, f_new, c1, c2, max_iter, best)
+            break
+        # the first trial step is usually accepted and needs the gradient
+        g_new, d_new = dphi(x_new, i == 0)
+        if abs(d_new) <= -c2*dphi0:
+            best = (alpha, f_new, g_new, x_new)
+            break
+        best = (alpha, f_new, g_new, x_new)
+        if d_new >= 0:
+            best = _zoom(phi, dphi, f0, dphi0, alpha, f_new, d_new,
+                         alpha_prev, f_prev, c1, c2, max_iter, best)
+            break
+        alpha_prev, f_prev, d_prev = alpha, f_new, d_new
+        alpha = min(2*alpha, alpha_max)
+    alpha, f_new, g_new, x_new = best
+    if g_new is None:
+        g_new = grad(x_new)
+    return alpha, f_new, g_new
+
+
+def _zoom(phi, dphi, f0, dphi0, alpha_lo, f_lo, d_lo, alpha_hi, f_hi, c1, c2, max_iter, best):
+    """shrinks the bracket [alpha_lo, alpha_hi] until a strong Wolfe step
+    is found, returns it as (alpha, f, gradient or None, point)"""
+    for i in range(max_iter):
+        alpha = _interpolate(alpha_lo, f_lo, d_lo, alpha_hi, f_hi)
+        f_new, x_new = phi(alpha)
+        if f_new > f0 + c1*alpha*dphi0 or f_new >= f_lo:
+            alpha_hi, f_hi = alpha, f_new
+        else:
+            g_new, d_new = dphi(x_new)
+            if abs(d_new) <= -c2*dphi0:
+                return alpha, f_new, g_new, x_new
+            best = (alpha, f_new, g_new, x_new)
+            if d_new*(alpha_hi-alpha_lo) >= 0:
+                alpha_hi, f_hi = alpha_lo, f_lo
+            alpha_lo, f_lo, d_lo = alpha, f_new, d_new
+    return best
+
+
+def _interpolate(a, f_a, d_a, b, f_b):
+    """minimizer of the quadratic through (a, f_a) with slope d_a and
+    (b, f_b), falling back to bisection when the interpolant is not convex
+    or its minimizer is too close to the ends of the bracket"""
+    lo, hi = min(a, b), max(a, b)
+    margin = 0.1*(hi-lo)
+    h = b - a
+    denom = 2*(f_b - f_a - d_a*h)
+    alpha = None
+    if denom > 0:
+        alpha = a - d_a*h*h/denom
+    if alpha is None or not (lo + margin <= alpha <= hi - margin) or not np.isfinite(alpha):
+        alpha = 0.5*(a+b)
+    return alpha
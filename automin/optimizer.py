@@ -1,9 +1,16 @@
 import sys
 import os
 import warnings
-import time
+from collections import deque
 import numpy as np
-from .autodiff.variables import Variable
+from .autodiff.variables import Variable, _scope, _NAMES, _item
+from .autodiff import reverse
+from .autodiff.hessian import hvp
+from .autodiff import compiler
+from . import linesearch
+from .history import make_history
+from .cache import EvalCache
+from . import data as _data
 
 # sys.path.append('../AutoDiff')
 #base_dir = os.path.dirname(__file__) or '.'
@@ -15,10 +22,11 @@ from .autodiff.variables import Variable
 PRECISION = 1e-3
 MAXITER = 5000
 NORM = 2
+MODE = 'auto'
 
 
 class Result:
-    def __init__(self, x, val_rec, time_rec, converge, convergence_warning = True):
+    def __init__(self, x, val_rec, time_rec, converge, convergence_warning = True, fun = None, evals = None):
         """Record the optimization results and performance
 
         INPUTS
@@ -27,11 +35,15 @@ class Result:
         val_rec array: stores the function inputs at each iteration, save for plotting the accuracy results.
         time_rec array: stores the cumulative time at each iteration.
         converge boolean: did the optimization procedure converge
+        fun float: objective value at x, None after stochastic training
+        evals dict: numbers of objective ('f') and gradient ('grad') evaluations computed, and of the calls answered from the cache ('cached'), see automin.cache.EvalCache
         """
         self.x = x
         self.val_rec = val_rec
         self.time_rec = time_rec
         self.converge = converge
+        self.fun = fun
+        self.evals = evals
         if (not converge) and convergence_warning:
             warnings.warn("optimization did not converge")
         # throw warning if not convergent
@@ -51,20 +63,41 @@ def minimize(fun, x0, method=None, **kwargs):
         - 'Gradient Descent'            :ref:`(see here) <optimizer.min_gradient_descent>`
         - 'Conjugate Gradient'          :ref:`(see here) <optimizer.min_conjugate_gradient>`
         - 'Steepest Descent'            :ref:`(see here) <optimizer.min_steepestdescent>`
-
-        If not specified, it will automatically choose 'Newton Method'.
-
+        - 'Newton' or 'Newton-CG'       :ref:`(see here) <optimizer.min_newton>`
+        - 'L-BFGS'                      :ref:`(see here) <optimizer.min_LBFGS>`
+
+        If not specified, it will automatically choose 'Newton Method',
+        or 'BFGS' if fun cannot be differentiated twice at x0. 'None'
+        chooses 'BFGS'.
+    mode: string (optional). Automatic differentiation mode used for the
+        gradients, one of 'auto' (default), 'compiled', 'forward' or
+        'reverse'. Reverse mode records a tape and recovers the whole
+        gradient in one backward sweep, which is cheaper for objectives
+        with many inputs. Compiled mode traces fun once at x0 into a flat
+        list of operations and replays it at every iterate (see
+        autodiff.compiler.compile). 'auto' uses compiled mode unless fun
+        branches on the value of its inputs, and forward mode otherwise.
+    history: string or History (optional). Which iterates are kept in
+        res.val_rec and res.time_rec: 'full' (default), 'off', or a History
+        such as History('every', k=10) or History('last', size=100).
 
 
     RETURNS
     ========
     res: OptimizationResult. Maybe a Variable or a normal value tuple, depends on the input object.
+        res.fun is the objective value at res.x, and res.evals counts the
+        objective and gradient evaluations (see automin.cache.EvalCache).
 
     NOTES
     =====
     PRE:
          - fun is normal function.
          - x0 are initial guess of the results
+         - for Newton's method, fun does not compare, convert or read the
+         value of its inputs: the Hessian-vector products evaluate it on
+         reverse-mode variables holding forward-mode ones in every mode
+         (see autodiff.hessian.hvp). The default method falls back to BFGS
+         when fun fails on them at x0.
 
     POST:
          - fun and x0 are not changed by this function
@@ -72,12 +105,26 @@ def minimize(fun, x0, method=None, **kwargs):
          returns a new Variable instance
          - if x0 is numeric, returns numeric
     """
+    if method is None:
+        x = np.array(x0, dtype=float)
+        try:
+            hvp(fun, x, np.zeros(len(x)))
+        except TypeError:
+            # e.g. fun branches on getattr(x, 'val', x), which only unwraps
+            # one of the nested variables
+            method = "BFGS"
+        else:
+            method = "Newton"
     if method == "Conjugate Gradient":
         return min_conjugate_gradient(fun, x0, **kwargs)
     elif method == "Steepest Descent":
         return min_steepestdescent(fun, x0, **kwargs)
-    elif method == "BFGS" or method=="None":
+    elif method in ("BFGS", "None"):
         return min_BFGS(fun, x0, **kwargs)
+    elif method == "L-BFGS":
+        return min_LBFGS(fun, x0, **kwargs)
+    elif method in ("Newton", "Newton-CG"):
+        return min_newton(fun, x0, **kwargs)
     elif method == "Gradient Descent":
         return min_gradientdescent(fun, x0, **kwargs)
     else:
@@ -85,27 +132,153 @@ def minimize(fun, x0, method=None, **kwargs):
             "{} is not a valid optimization method".format(method))
 
 
+class MultistartResult:
+    def __init__(self, results, values, x0_list):
+        """Record the results of a multi-start optimization
+
+        INPUTS
+        =======
+        results list: Result of each start, in the order of x0_list. Starts
+            cancelled after the target was reached are None.
+        values list: objective value at the final x of each start, None for
+            cancelled starts.
+        x0_list list: the initial guesses.
+        """
+        self.results = results
+        self.values = values
+        self.x0_list = x0_list
+        finished = [i for i, v in enumerate(values) if v is not None]
+        self.best_index = min(finished, key=lambda i: values[i]) if finished else None
+        self.best = results[self.best_index] if finished else None
+
+
+def _run_start(fun, x0, method, kwargs):
+    r = minimize(fun, x0, method, **kwargs)
+    return r, float(r.fun)
+
+
+def minimize_multistart(fun, x0_list, method=None, workers=None, target=None, **kwargs):
+    """Runs minimize from many initial guesses, in parallel across processes.
+
+    INPUTS
+    =======
+    fun: callable object. The objective function to be minimized. To run in
+        a process pool it must be picklable, i.e. defined at module level.
+    x0_list: list of initial guesses.
+    method: string (optional). Optimizer passed to minimize.
+    workers: int (optional). Number of worker processes, defaults to the
+        number of cores. With workers=1 the starts run one after the other in
+        the current process.
+    target: float (optional). Once a start reaches an objective value less
+        than or equal to target, the starts that have not begun are cancelled.
+    kwargs: passed to minimize for every start.
+
+    RETURNS
+    ========
+    res: MultistartResult, with the Result of every start and the best one
+
+    NOTES
+    =====
+    If fun cannot be pickled (e.g. a lambda), a warning is raised and the
+    starts run in the current process.
+
+    EXAMPLES
+    =========
+    >>> from automin.optimizer import minimize_multistart
+    >>> f = lambda x, y: (x-1)**2 + (y+2)**2
+    >>> res = minimize_multistart(f, [[0, 0], [3, 3], [-5, 2]], 'BFGS', workers=1)
+    >>> len(res.results)
+    3
+    >>> np.round(res.best.x, 3)
+    array([ 1., -2.])
+    """
+    # process pools are only imported when needed, they are slow to import
+    import pickle
+    from concurrent.futures import ProcessPoolExecutor, as_completed
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if workers > 1:
+        try:
+            pickle.dumps(fun)
+        except (pickle.PicklingError, AttributeError, TypeError):
+            warnings.warn("objective function cannot be pickled, "
+                          "running the starts sequentially")
+            workers = 1
+
+    results = [None] * len(x0_list)
+    values = [None] * len(x0_list)
+    if workers == 1:
+        for idx, x0 in enumerate(x0_list):
+            results[idx], values[idx] = _run_start(fun, x0, method, kwargs)
+            if target is not None and values[idx] <= target:
+                break
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(_run_start, fun, x0, method, kwargs): idx
+                       for idx, x0 in enumerate(x0_list)}
+            for future in as_completed(futures):
+                if future.cancelled():
+                    continue
+                idx = futures[future]
+                results[idx], values[idx] = future.result()
+                if target is not None and values[idx] <= target:
+                    for pending in futures:
+                        pending.cancel()
+    return MultistartResult(results, values, x0_list)
+
+
 class Model(object):
     def __init__(self, data):
         self.data = data
         self.all_data = data
-        self.row_idx = 0
-
-    def make_stochastic(self):
+        self.scheduler = None
+        self._epoch = None
+
+    def make_stochastic(self, batch_size=1, shuffle=True, seed=None):
+        """Switches to training on batches of rows of all_data, ordered by
+        an EpochScheduler (see automin.data). data is set to the first
+        batch of the first epoch, then to the next batch by step or while
+        iterating over batches."""
         self.stochastic = True
-        self.row_idx = 0
-        self.data = self.all_data.iloc[self.row_idx, :]
+        self.scheduler = _data.EpochScheduler(self.all_data, batch_size, shuffle, seed)
+        self._epoch = None
+        self.step()
 
     def make_deterministic(self):
+        self.stochastic = False
         self.data = self.all_data
+        self._epoch = None
+
+    def set_batch(self, idx):
+        """Sets data to the rows idx of an in-memory all_data, as a dict of
+        column arrays that the loss can use like the columns of a DataFrame"""
+        self.data = self.scheduler.source.take(idx)
+
+    def _new_epoch(self):
+        for batch in self.scheduler:
+            self.data = batch
+            yield batch
+
+    def batches(self):
+        """Iterates over the batches of an epoch, setting data to each batch
+        in turn. The epoch started by make_stochastic or step is finished
+        first, from the current batch on, then every call starts a new one."""
+        if self._epoch is not None:
+            epoch, self._epoch = self._epoch, None
+            yield self.data
+            for batch in epoch:
+                yield batch
+            return
+        for batch in self._new_epoch():
+            yield batch
 
     def step(self):
-        if self.row_idx < len(self.all_data) - 1:
-            self.row_idx += 1
-        else:
-            self.row_idx = 0
-            self.data = self.data.sample(frac=1)
-        self.data = self.all_data.iloc[self.row_idx, :]
+        """Sets data to the next batch, starting a new epoch after the last
+        batch of the current one"""
+        if self._epoch is None or next(self._epoch, None) is None:
+            self._epoch = self._new_epoch()
+            next(self._epoch)
 
     def predict(self):
         raise NotImplementedError
@@ -113,185 +286,628 @@ class Model(object):
     def loss(self):
         raise NotImplementedError
 
-def minimize_over_data(model, init_param, method, epochs, stochastic = False, **kwargs):
-    supported_stochastic_methods = ['Gradient Descent']
+
+STOCHASTIC_METHODS = ['Gradient Descent', 'Momentum', 'Adam']
+# keywords of each stochastic method, besides lr, seed and mode
+STOCHASTIC_OPTIONS = {'Gradient Descent': (), 'Momentum': ('momentum',),
+                      'Adam': ('beta1', 'beta2', 'eps')}
+
+
+def minimize_over_data(model, init_param, method, epochs, stochastic = False, batch_size=1, history=None, workers=None, **kwargs):
+    """Fits the parameters of a Model by minimizing its loss over its data.
+
+    INPUTS
+    =======
+    model: Model, whose loss(*params) is computed on model.data
+    init_param: initial guess of the parameters
+    method: string. Optimizer, see minimize. Stochastic training supports
+        'Gradient Descent', 'Momentum' and 'Adam'.
+    epochs: int. Number of passes over the data, or maximum number of
+        iterations when stochastic is False.
+    stochastic: bool (optional). If True, each step uses the gradient of the
+        loss on a mini-batch of rows, in a new random order every epoch.
+    batch_size: int (optional). Number of rows per mini-batch.
+    history: string or History (optional), see minimize.
+    workers: int (optional). When stochastic is False and workers > 1, the
+        rows are split into workers shards held in shared memory, and the
+        loss and its gradient are computed on each shard by its own process
+        and added up, see automin.parallel.ShardedLoss. Not available with
+        the Newton method, which differentiates the loss twice.
+    kwargs: passed to minimize, or for stochastic training
+        - lr: learning rate (default 1e-3)
+        - momentum: decay of the velocity of 'Momentum' (default 0.9)
+        - beta1, beta2, eps: parameters of 'Adam' (defaults 0.9, 0.999, 1e-8)
+        - seed: seed of the shuffles, for reproducible training
+        Other keywords raise TypeError in stochastic training.
+
+    RETURNS
+    ========
+    res: Result
+
+    NOTES
+    =====
+    During stochastic training model.data is a dict of the batch columns,
+    held in arrays that turn arithmetic with the parameters into a single
+    array-valued Variable. The loss should add up the losses of the rows,
+    e.g. with np.sum, or return one loss per row; steps use the average
+    gradient per row, so the learning rate does not depend on batch_size.
+
+    A model built on a DataSource (see automin.data) streams its rows from
+    disk or a generator, which needs stochastic training.
+    """
+    if isinstance(model.all_data, _data.DataSource) and not stochastic:
+        raise ValueError('a Model streaming its data from a DataSource can only be '
+                         'trained with stochastic=True')
     if stochastic:
-        if method not in supported_stochastic_methods:
+        if method not in STOCHASTIC_METHODS:
             raise ValueError("""{} is not supported for stochastic optimization.
                                 Supported methods are {}"""
-                                .format(method, supported_stochastic_methods))
-        x = np.array(init_param)
-        val_rec = [x]
-        model.make_stochastic()
-        time_rec = [0]
-        time_total = 0
-        for epoch in range(epochs):
-            start_time = time.time()
-            for rows in range(len(model.all_data)):
-                r = minimize(model.loss, x, method=method,
-                             max_iter=1, convergence_warning = False, **kwargs)
-                x = r.x
-                val_rec.append(r.x)
-                model.step()
-                time_total = time_total + time.time()-start_time
-                time_rec.append(time_total)
-        model.make_deterministic()
-        r = Result(x, val_rec, time_rec, None, convergence_warning = False)
-    else:
-        x = init_param
-        val_rec = [x]
-        r = minimize(model.loss, x, method=method, max_iter=epochs, **kwargs)
-    return r
+                                .format(method, STOCHASTIC_METHODS))
+        return _minimize_stochastic(model, init_param, method, epochs, batch_size,
+                                    history, **kwargs)
+    x = init_param
+    if workers is not None and workers > 1:
+        if method in (None, 'None', 'Newton', 'Newton-CG'):
+            raise ValueError('the Newton method is not supported with workers > 1')
+        # process pools are only imported when needed, like in minimize_multistart
+        from .parallel import ShardedLoss
+        with ShardedLoss(model, x, workers, kwargs.get('mode', MODE)) as loss:
+            return minimize(loss, x, method=method, max_iter=epochs, history=history, **kwargs)
+    return minimize(model.loss, x, method=method, max_iter=epochs, history=history, **kwargs)
+
+
+def _minimize_stochastic(model, x0, method, epochs, batch_size, history, **options):
+    unknown = sorted(set(options) - set(STOCHASTIC_OPTIONS[method]) - {'lr', 'seed', 'mode'})
+    if unknown:
+        raise TypeError("{} got unexpected keyword arguments {}"
+                        .format(method, ', '.join(unknown)))
+    lr = options.get('lr', 1e-3)
+    momentum = options.get('momentum', 0.9)
+    beta1, beta2, eps = options.get('beta1', 0.9), options.get('beta2', 0.999), options.get('eps', 1e-8)
+    seed = options.get('seed')
+    mode = options.get('mode', MODE)
+    x = np.array(x0, dtype=float)
+    var_names = ['x'+str(idx) for idx in range(len(x))]
+    history = make_history(history)
+    history.record(x)
+
+    velocity = np.zeros_like(x)
+    moment1 = np.zeros_like(x)
+    moment2 = np.zeros_like(x)
+    n_steps = 0
+
+    model.make_stochastic(batch_size, seed=seed)
+    for epoch in range(epochs):
+        for batch in model.batches():
+            g = _get_grad(model.loss, x, var_names, mode)
+            # a loss with one value per row gives one gradient row per row
+            g = np.reshape(g, (-1, len(x))).sum(axis=0) / _data.n_rows(batch)
+
+            if method == 'Momentum':
+                velocity = momentum*velocity - lr*g
+                x = x + velocity
+            elif method == 'Adam':
+                n_steps += 1
+                moment1 = beta1*moment1 + (1-beta1)*g
+                moment2 = beta2*moment2 + (1-beta2)*g**2
+                x = x - lr*(moment1/(1-beta1**n_steps)) / (np.sqrt(moment2/(1-beta2**n_steps)) + eps)
+            else:
+                x = x - lr*g
+            history.record(x)
+    model.make_deterministic()
+    return Result(x, history.val_rec, history.time_rec, None, convergence_warning = False)
+
+
+def min_conjugate_gradient(fn, x0, precision=PRECISION, max_iter=10000, c1=1e-4, c2=0.1, norm=NORM, mode=MODE, history=None, directional=False, **kwargs):
+    """Nonlinear conjugate gradient (Polak-Ribiere+), with steps chosen by
+    a strong Wolfe line search. The small curvature constant c2 keeps the
+    search close to exact, which the conjugacy of the directions relies on.
+
+    With directional=True and a gradient computed in forward mode, the
+    trial steps after the first one of each search only compute the
+    derivative along the search direction (see value_and_directional),
+    whose cost does not grow with the number of inputs. It pays off when
+    the gradient is much more expensive than a directional derivative (many
+    inputs) and the searches often reject their trial steps; since the
+    accepted step still needs its gradient, it costs an extra pass
+    otherwise.
+    """
+    x = np.array(x0, dtype=float)
+    var_names = ['x'+str(idx) for idx in range(len(x))]
+    cache = _cached_objective(fn, x, var_names, mode)
+    f, grad_fn = cache.f, cache.grad
+    probe = cache.value_and_directional if directional else None
 
+    history = make_history(history)
+    history.record(x)
 
-def min_conjugate_gradient(fn, x0, precision=PRECISION, max_iter=10000, sigma=0.01, norm=NORM, **kwargs):
-    # create initial variables
-    x = np.array(x0)
+    f_now, grad = cache.value_and_grad(x)
+    conj_direct = -grad
+    alpha = 1/max(np.linalg.norm(grad), 1.)
 
-    # create initial variables
-    var_names = ['x'+str(idx) for idx in range(len(x))]
+    for i in range(max_iter):
+        if np.linalg.norm(grad, norm) <= precision:
+            return Result(x, history.val_rec, history.time_rec, True, fun=cache.f(x), evals=cache.evals)
 
-    # initial gradient and steepest descent
-    val_rec = [x.copy()]
-    time_rec = [0]
-    time0 = time.time()
-    sgrad0 = -_get_grad(fn, x, var_names)
-
-    if np.linalg.norm(sgrad0, norm) <= precision:
-        # reshape val_rec
-        return Result(x, np.array(val_rec), time_rec, True)
-
-    gradsigma = _get_grad(fn, x+sigma*sgrad0, var_names)
-    # check this
-    alpha = (-sigma*sgrad0@sgrad0) / (gradsigma@sgrad0 - sgrad0@sgrad0)
-    x = x + alpha*sgrad0
-    conj_direct = sgrad0
-
-    val_rec.append(x.copy())
-    time_rec.append(time.time()-time0)
-    init_time = time.time()
-
-    for i in range(max_iter-1):
-        sgrad1 = -_get_grad(fn, x, var_names)
-
-        beta = min(0, (sgrad1 @ (sgrad0-sgrad1)) / (sgrad0 @ sgrad0))
-        conj_direct = sgrad1 + beta*conj_direct
-        gradsigma = _get_grad(fn, x+sigma*conj_direct, var_names)
-        # secant method
-        alpha = (sigma*sgrad1 @ conj_direct) / (gradsigma@conj_direct +  sgrad1@conj_direct)
+        alpha, f_now, grad1 = _wolfe_step(f, grad_fn, x, conj_direct, f_now, grad,
+                                          alpha_init=alpha, c1=c1, c2=c2,
+                                          directional=probe)
         x = x + alpha*conj_direct
 
         # store history of values
-        val_rec.append(x.copy())
-        time_rec.append(time.time()-init_time)
-
-        # update grad
-        sgrad0 = sgrad1
-
-        if np.linalg.norm(sgrad1, norm) <= precision:
-            # reshape val_rec
-            return Result(x, np.array(val_rec), time_rec, True)
-
-    return Result(x, np.array(val_rec), time_rec, False)
-
-def min_steepestdescent(fn, x0, precision=PRECISION, max_iter=MAXITER, sigma=0.01, norm=NORM, **kwargs):
-     # create initial variables
+        history.record(x)
+
+        beta = max(0, (grad1 @ (grad1-grad)) / (grad @ grad))
+        conj_new = -grad1 + beta*conj_direct
+        if grad1 @ conj_new >= 0:
+            # not a descent direction, restart
+            conj_new = -grad1
+        # first trial step of the next search expects the same decrease. Both
+        # slopes are negative, the new one is 0 when the search lands on the
+        # minimum
+        alpha = alpha * (grad @ conj_direct) / min(grad1 @ conj_new, -1e-300)
+        conj_direct = conj_new
+        grad = grad1
+
+    return Result(x, history.val_rec, history.time_rec, False, fun=cache.f(x), evals=cache.evals)
+
+def min_steepestdescent(fn, x0, precision=PRECISION, max_iter=MAXITER, c1=1e-4, c2=0.1, norm=NORM, mode=MODE, history=None, directional=False, **kwargs):
+    """Steepest descent, with steps chosen by a strong Wolfe line search.
+    directional=True probes the trial steps with directional derivatives,
+    see min_conjugate_gradient."""
     x = np.array(x0, dtype=float)
     var_names = ['x'+str(idx) for idx in range(len(x))]
+    cache = _cached_objective(fn, x, var_names, mode)
+    f, grad_fn = cache.f, cache.grad
+    probe = cache.value_and_directional if directional else None
+
+    history = make_history(history)
+    history.record(x)
 
-    val_rec = [x.copy()]
-    time_rec = [0]
-    init_time = time.time()
+    f_now, grad = cache.value_and_grad(x)
+    eta = 1/max(np.linalg.norm(grad), 1.)
 
     for i in range(max_iter):
-        grad1 = _get_grad(fn, x, var_names)
         # threshold stopping condition
-        # maximum norm
-
-        if np.linalg.norm(grad1, norm) <= precision:
-            # reshape val_rec
-            return Result(x, np.array(val_rec), time_rec, True)
-        s = -grad1
-        # secant method line search
-        eta = (-sigma*grad1 @ s) / (_get_grad(fn, x+sigma*s, var_names)@s - grad1@s)
-        #eta = scmin(lambda eta: fn(*(x+eta*s)), 0)
+        if np.linalg.norm(grad, norm) <= precision:
+            return Result(x, history.val_rec, history.time_rec, True, fun=cache.f(x), evals=cache.evals)
+        s = -grad
+        eta, f_now, grad1 = _wolfe_step(f, grad_fn, x, s, f_now, grad,
+                                        alpha_init=eta, c1=c1, c2=c2,
+                                        directional=probe)
+        x = x + eta*s
+
+        history.record(x)
+
+        # first trial step of the next search expects the same decrease
+        eta = eta * (grad @ grad) / max(grad1 @ grad1, 1e-300)
+        grad = grad1
+
+    return Result(x, history.val_rec, history.time_rec, False, fun=cache.f(x), evals=cache.evals)
+
+
+def _objective(fn, x0, var_names, mode=MODE):
+    """objective value, value and gradient together, and value and
+    directional derivative together, as functions of point arrays. In 'auto'
+    mode fn is compiled into a flat plan when it has no data-dependent
+    control flow, and differentiated in forward mode otherwise. Objectives
+    that carry their own fn.value_and_grad(x) or fn.grad(x), such as
+    compiled functions, are used as they are.
+
+    The directional derivative is None unless the gradient comes from
+    forward mode, whose cost grows with the number of inputs: compiled and
+    reverse gradients cost a few evaluations of fn, no more than the
+    directional derivative itself."""
+    f = lambda x: fn(*x)
+    if hasattr(fn, 'value_and_grad'):
+        return f, fn.value_and_grad, None
+    if hasattr(fn, 'grad'):
+        return f, (lambda x: (fn(*x), fn.grad(x))), None
+    if mode in ('auto', 'compiled'):
+        try:
+            plan = compiler.compile(fn, len(x0), x0)
+        except (TypeError, AttributeError):
+            # TraceError, or operations the trace does not support
+            if mode == 'compiled':
+                raise
+            mode = 'forward'
+        else:
+            return (lambda x: plan(*x)), plan.value_and_grad, None
+    directional = None
+    if mode in ('forward', 'auto'):
+        directional = lambda x, s: value_and_directional(fn, x, s, var_names, mode)
+    return f, (lambda x: value_and_grad(fn, x, var_names, mode)), directional
+
+
+def _cached_objective(fn, x0, var_names, mode=MODE):
+    """EvalCache of the objective value and gradient of _objective, so that
+    an optimizer never evaluates either twice at the same point"""
+    return EvalCache(*_objective(fn, x0, var_names, mode))
+
+
+def _wolfe_step(f, grad_fn, x, p, f_now, grad, alpha_init=1., c1=1e-4, c2=0.9, beta=0.5, directional=None):
+    """strong Wolfe step along p, falling back to Armijo backtracking when
+    the search finds no step. Returns the step with f and grad there. With
+    directional(x, s), which returns the value and the derivative along s,
+    the trial steps only compute derivatives along p."""
+    slope = None
+    if directional is not None:
+        slope = lambda x_new: directional(x_new, p)[1]
+    alpha, f_new, grad_new = linesearch.strong_wolfe(
+        f, grad_fn, x, p, f_now, grad, alpha_init=alpha_init, c1=c1, c2=c2, slope=slope)
+    if alpha == 0:
+        alpha, f_new = linesearch.backtracking(
+            f, x, p, f_now, grad @ p, alpha_init=alpha_init, beta=beta, c=c1)
+        grad_new = grad_fn(x + alpha*p)
+    return alpha, f_new, grad_new
+
+
+def value_and_grad(fn, x, var_names=None, mode=MODE):
+    """Value and gradient of a scalar function from one differentiation pass
 
-        dx = eta*s
-        x += dx
+    INPUTS
+    =======
+    fn: callable object. Scalar function of len(x) variables.
+    x: array-like. Point at which fn and its gradient are evaluated.
+    var_names: list of str (optional). Names of the input variables.
+    mode: string (optional). Automatic differentiation mode, one of 'auto'
+        (default, same as 'forward' here), 'forward', 'reverse' or
+        'compiled', see minimize.
 
-        val_rec.append(x.copy())
-        time_rec.append(time.time()-init_time)
+    RETURNS
+    ========
+    val: numeric, fn(*x)
+    grad: numpy array with the same length as x
 
+    NOTES
+    =====
+    Every mode computes the value on the way to the gradient, so optimizers
+    that need both get them without calling fn again.
+
+    EXAMPLES
+    =========
+    >>> from automin.optimizer import value_and_grad
+    >>> f = lambda x, y: x**2 * y
+    >>> value_and_grad(f, [3., 2.])
+    (18.0, array([12.,  9.]))
+    """
+    if var_names is None:
+        var_names = ['x'+str(idx) for idx in range(len(x))]
+    if mode == 'reverse':
+        return reverse.value_and_grad(fn, x, var_names)
+    elif mode == 'compiled':
+        return compiler.compile(fn, len(x), x).value_and_grad(x)
+    elif mode not in ('forward', 'auto'):
+        raise ValueError(
+            "{} is not a valid differentiation mode".format(mode))
+    # register every name once, first, so that all seeds share one tangent
+    # length, and seed the inputs from the rows of one identity block. The
+    # names only stay registered for this call
+    with _scope(var_names) as slots:
+        seeds = np.zeros(np.shape(x) + (len(_NAMES),))
+        seeds[np.arange(len(slots)), ..., slots] = 1
+        deps = seeds.astype(bool)
+        variables = [Variable._from_tangent(name, x_n, seed, dep)
+                     for name, x_n, seed, dep in zip(var_names, x, seeds, deps)]
+        out = fn(*variables)
+        if not isinstance(out, Variable):
+            # objective does not depend on its inputs
+            return out, np.zeros(np.shape(x[0]) + (len(x),))
+        return out.val, out.gradient(var_names)
+
+
+def value_and_directional(fn, x, s, var_names=None, mode=MODE):
+    """Value and directional derivative of a scalar function from one
+    forward pass
 
-    return Result(x, np.array(val_rec), time_rec, False)
+    INPUTS
+    =======
+    fn: callable object. Scalar function of len(x) variables.
+    x: array-like. Point at which fn is evaluated.
+    s: array-like. Direction, of the same length as x.
+    var_names: list of str (optional). Names of the input variables.
+    mode: string (optional). 'compiled' replays a compiled plan of fn (see
+        autodiff.compiler.CompiledFunction.value_and_directional), any
+        other mode evaluates fn on forward-mode Variables.
 
+    RETURNS
+    ========
+    val: numeric, fn(*x)
+    slope: numeric, the gradient of fn at x dotted with s
 
-def _get_grad(fn, x, var_names):
-    variables = [Variable(var_names[idx], x_n) for idx, x_n in enumerate(x)]
+    NOTES
+    =====
+    Every input is seeded with its component of s in one shared tangent
+    slot, so the pass carries a single derivative whatever the number of
+    inputs, where value_and_grad in forward mode carries len(x).
+
+    EXAMPLES
+    =========
+    >>> from automin.optimizer import value_and_directional
+    >>> f = lambda x, y: x**2 * y
+    >>> value_and_directional(f, [3., 2.], [1., -1.])
+    (18.0, 3.0)
+    """
+    if var_names is None:
+        var_names = ['x'+str(idx) for idx in range(len(x))]
+    if mode == 'compiled':
+        return compiler.compile(fn, len(x), x).value_and_directional(x, s)
+    elif mode not in ('forward', 'reverse', 'auto'):
+        raise ValueError(
+            "{} is not a valid differentiation mode".format(mode))
+    # all inputs share one forward slot holding their component of s. The
+    # tangents of scalar inputs are plain floats, so that the pass does
+    # float arithmetic instead of operations on one-element arrays
+    deps = np.ones(1, dtype=bool)
+    variables = [Variable._from_tangent(name, x_n, float(s_n) if np.ndim(x_n) == 0 else
+                                        np.full(np.shape(x_n) + (1,), s_n, dtype=float), deps)
+                 for name, x_n, s_n in zip(var_names, x, s)]
     out = fn(*variables)
-    jacobian = out.jacobian()
-    grad = np.array([jacobian[name] for name in var_names])
-    return grad
+    if not isinstance(out, Variable):
+        # objective does not depend on its inputs
+        return out, 0.
+    slope = out.tangent
+    if np.ndim(slope) > np.ndim(out.val):
+        slope = slope[..., 0]
+    return out.val, _item(np.asarray(slope))
+
+
+def _get_grad(fn, x, var_names, mode=MODE):
+    return value_and_grad(fn, x, var_names, mode)[1]
 
 
 def get_gradient(fn, x, var_names,**kwargs):
     return _get_grad(fn, x, var_names,**kwargs)
 
-def min_BFGS(fn, x0, precision=PRECISION, max_iter=MAXITER, beta=0.9, c=0.9, alpha_init=1, norm=NORM, **kwargs):
+
+def get_gradient_batch(fn, X, var_names=None, mode=MODE):
+    """Gradient of a scalar function at many points from one evaluation.
+
+    INPUTS
+    =======
+    fn: callable object. Scalar function of n variables built from Variable
+        arithmetic and AD_numpy functions, so that it also works element-wise
+        on arrays.
+    X: array-like of shape (B, n). Each row is a point at which the gradient
+        is evaluated.
+    var_names: list of str (optional). Names of the n input variables.
+    mode: string (optional). 'forward' (default) or 'reverse'.
+
+    RETURNS
+    ========
+    grad: numpy array of shape (B, n), grad[b] is the gradient at X[b]
+
+    NOTES
+    =====
+    Each input is seeded once with the whole column X[:, i], so fn is traced a
+    single time on length-B arrays instead of B times on scalars.
+
+    EXAMPLES
+    =========
+    >>> from automin.optimizer import get_gradient_batch
+    >>> f = lambda x, y: x**2 * y
+    >>> get_gradient_batch(f, [[1., 2.], [3., 1.], [0., 5.]])
+    array([[4., 1.],
+           [6., 9.],
+           [0., 0.]])
+    """
+    X = np.asarray(X, dtype=float)
+    if X.ndim != 2:
+        raise ValueError('X must be a 2-d array of shape (B, n)')
+    if var_names is None:
+        var_names = ['x'+str(idx) for idx in range(X.shape[1])]
+    grad = _get_grad(fn, X.T, var_names, mode)
+    return np.broadcast_to(grad, X.shape).copy()
+
+def _curvature_constant(c2, kwargs):
+    """c2, or the value of the former keyword c of min_BFGS, which was the
+    curvature constant, removed from kwargs"""
+    if 'c' not in kwargs:
+        return c2
+    warnings.warn("c is deprecated, use c2 for the curvature constant or c1 "
+                  "for the sufficient decrease constant", DeprecationWarning)
+    return kwargs.pop('c')
+
+def min_BFGS(fn, x0, precision=PRECISION, max_iter=MAXITER, beta=0.9, c1=1e-4, c2=0.9, alpha_init=1, norm=NORM, mode=MODE, history=None, **kwargs):
+    """BFGS quasi-Newton method.
+
+    Steps come from a strong Wolfe line search starting at alpha_init with
+    sufficient decrease constant c1 and curvature constant c2, which keeps
+    y.s > 0 so the Hessian approximation stays positive definite. If the
+    search finds no step, it backtracks by the factor beta instead. The
+    former keyword c is accepted as c2.
+    """
+    c2 = _curvature_constant(c2, kwargs)
     approx_hessian = np.eye(len(x0))
 
-    x = np.array(x0, dtype=np.float)
+    x = np.array(x0, dtype=float)
 
     var_names = ['x'+str(idx) for idx in range(len(x))]
+    cache = _cached_objective(fn, x, var_names, mode)
+    f, grad_fn = cache.f, cache.grad
 
-    val_rec = [x.copy()]
-    time_rec = [0]
-    init_time = time.time()
+    history = make_history(history)
+    history.record(x)
 
+    f_now, grad_now = cache.value_and_grad(x)
     for i in range(max_iter):
-        grad_now = _get_grad(fn, x, var_names)
-        s = np.linalg.solve(approx_hessian, -grad_now)
+        p = np.linalg.solve(approx_hessian, -grad_now)
+        if grad_now @ p >= 0:
+            # the approximation lost positive definiteness, restart
+            approx_hessian = np.eye(len(x))
+            p = -grad_now
+        alpha, f_now, grad1 = _wolfe_step(f, grad_fn, x, p, f_now, grad_now,
+                                          alpha_init=alpha_init, c1=c1, c2=c2, beta=beta)
+        s = alpha*p
         x += s
-        val_rec.append(x.copy())
+        history.record(x)
 
         # update matrix Hessian
-        grad1 = _get_grad(fn, x, var_names)
         y = grad1-grad_now
-        dH1 = np.outer(y, y)/np.dot(y, s)
-        Hs = np.dot(approx_hessian, s)
-        dH2 = -np.outer(Hs, Hs)/np.dot(Hs, s)
-        approx_hessian += dH1+dH2
+        if np.dot(y, s) > 1e-10:
+            dH1 = np.outer(y, y)/np.dot(y, s)
+            Hs = np.dot(approx_hessian, s)
+            dH2 = -np.outer(Hs, Hs)/np.dot(Hs, s)
+            approx_hessian += dH1+dH2
+        grad_now = grad1
 
-        time_rec.append(time.time()-init_time)
 
         if np.linalg.norm(grad1, norm) <= precision:
-            # reshape val_rec
-            return Result(x, np.array(val_rec), time_rec, True)
+            return Result(x, history.val_rec, history.time_rec, True, fun=cache.f(x), evals=cache.evals)
+
+    return Result(x, history.val_rec, history.time_rec, False, fun=cache.f(x), evals=cache.evals)
+
+
+def _lbfgs_direction(grad, history):
+    """two-loop recursion: returns -H grad, where H is the inverse Hessian
+    approximation defined by the stored (s, y, rho) pairs"""
+    q = grad.copy()
+    alphas = []
+    for s, y, rho in reversed(history):
+        alpha = rho * (s @ q)
+        q -= alpha*y
+        alphas.append(alpha)
+    if history:
+        s, y, _ = history[-1]
+        q *= (s @ y) / (y @ y)
+    for (s, y, rho), alpha in zip(history, reversed(alphas)):
+        beta = rho * (y @ q)
+        q += (alpha-beta)*s
+    return -q
+
+
+def min_LBFGS(fn, x0, precision=PRECISION, max_iter=MAXITER, m=10, c1=1e-4, c2=0.9, beta=0.5, norm=NORM, mode=MODE, history=None, **kwargs):
+    """Limited-memory BFGS.
+
+    Only the last m pairs s = x_{k+1}-x_k, y = g_{k+1}-g_k are kept, and the
+    inverse Hessian approximation is applied with the two-loop recursion, so
+    memory and work per iteration are O(m*n) instead of the O(n^2) storage
+    and O(n^3) solve of min_BFGS. Steps come from a strong Wolfe line search
+    with sufficient decrease constant c1 and curvature constant c2,
+    backtracking by the factor beta if the search finds no step. As in
+    min_BFGS, the keyword c is accepted as c2.
+    """
+    c2 = _curvature_constant(c2, kwargs)
+    x = np.array(x0, dtype=float)
+    var_names = ['x'+str(idx) for idx in range(len(x))]
+    cache = _cached_objective(fn, x, var_names, mode)
+    f, grad_fn = cache.f, cache.grad
+    pairs = deque(maxlen=m)
+
+    history = make_history(history)
+    history.record(x)
+
+    f_now, grad = cache.value_and_grad(x)
+    for i in range(max_iter):
+        if np.linalg.norm(grad, norm) <= precision:
+            return Result(x, history.val_rec, history.time_rec, True, fun=cache.f(x), evals=cache.evals)
+
+        p = _lbfgs_direction(grad, pairs)
+        slope = grad @ p
+        if slope >= 0:
+            # the approximation lost positive definiteness, restart
+            pairs.clear()
+            p = -grad
+            slope = grad @ p
 
-    return Result(x, np.array(val_rec), time_rec, False)
+        t, f_now, grad_new = _wolfe_step(f, grad_fn, x, p, f_now, grad, c1=c1, c2=c2, beta=beta)
+        s = t*p
+        x = x + s
+        y = grad_new - grad
+        grad = grad_new
 
+        # only keep pairs satisfying the curvature condition
+        sy = s @ y
+        if sy > 1e-10:
+            pairs.append((s, y, 1/sy))
 
-def min_gradientdescent(fn, x0, precision=1e-2, max_iter=30000, lr=1e-3, norm=NORM, **kwargs):
+        history.record(x)
+
+    return Result(x, history.val_rec, history.time_rec, False, fun=cache.f(x), evals=cache.evals)
+
+def min_gradientdescent(fn, x0, precision=1e-2, max_iter=30000, lr=1e-3, norm=NORM, mode=MODE, history=None, **kwargs):
     x = np.array(x0)
 
     var_names = ['x'+str(idx) for idx in range(len(x))]
 
-    val_rec = [x.copy()]
-    time_rec = [0]
-    initial_time = time.time()
-    g = _get_grad(fn, x, var_names)
+    cache = _cached_objective(fn, x, var_names, mode)
+    f, grad_fn = cache.f, cache.grad
+
+    history = make_history(history)
+    history.record(x)
+    g = grad_fn(x)
 
     for i in range(max_iter):
         x = x - lr*g
 
         # store history of values
-        val_rec.append(x)
-        time_rec.append(time.time()-initial_time)
-        g = _get_grad(fn, x, var_names)
+        history.record(x)
+        g = grad_fn(x)
 
         # threshold stopping condition
         if np.linalg.norm(g, norm) <= precision:
-            return Result(x, np.array(val_rec), time_rec, True)
+            return Result(x, history.val_rec, history.time_rec, True, fun=cache.f(x), evals=cache.evals)
 
         # iteration stopping condition
-    return Result(x, np.array(val_rec), time_rec, False)
+    return Result(x, history.val_rec, history.time_rec, False, fun=cache.f(x), evals=cache.evals)
+
+
+def _newton_cg_direction(hess_vec, grad, max_iter):
+    """Approximately solves H p = -grad by conjugate gradient using only
+    Hessian-vector products. Stops early on negative curvature."""
+    grad_norm = np.linalg.norm(grad)
+    tol = min(0.5, np.sqrt(grad_norm)) * grad_norm
+    p = np.zeros_like(grad)
+    r = -grad
+    d = r.copy()
+    rr = r @ r
+    for j in range(max_iter):
+        Hd = hess_vec(d)
+        dHd = d @ Hd
+        if dHd <= 0:
+            # not a descent model, fall back to steepest descent on the first step
+            return -grad if j == 0 else p
+        alpha = rr / dHd
+        p = p + alpha*d
+        r = r - alpha*Hd
+        rr_new = r @ r
+        if np.sqrt(rr_new) <= tol:
+            break
+        d = r + (rr_new/rr)*d
+        rr = rr_new
+    return p
+
+
+def min_newton(fn, x0, precision=PRECISION, max_iter=MAXITER, max_cg_iter=None, c1=1e-4, beta=0.5, norm=NORM, mode=MODE, history=None, **kwargs):
+    """Truncated Newton (Newton-CG) method.
+
+    Each Newton step solves H p = -g with conjugate gradient, where the
+    products H v come from forward-over-reverse automatic differentiation,
+    so the Hessian is never formed. The step is then shortened by
+    backtracking until the Armijo condition f(x+t*p) <= f(x) + c1*t*g.p holds.
+    The products H v evaluate fn on nested variables in every mode, so fn
+    must not compare, convert or read the value of its inputs.
+    """
+    x = np.array(x0, dtype=float)
+    var_names = ['x'+str(idx) for idx in range(len(x))]
+    cache = _cached_objective(fn, x, var_names, mode)
+    f, grad_fn = cache.f, cache.grad
+    if max_cg_iter is None:
+        max_cg_iter = 2*len(x)
+
+    history = make_history(history)
+    history.record(x)
+
+    for i in range(max_iter):
+        f_now, grad = cache.value_and_grad(x)
+        if np.linalg.norm(grad, norm) <= precision:
+            return Result(x, history.val_rec, history.time_rec, True, fun=cache.f(x), evals=cache.evals)
+
+        p = _newton_cg_direction(lambda v: hvp(fn, x, v, var_names)[1], grad, max_cg_iter)
+
+        t, f_now = linesearch.backtracking(f, x, p, f_now, grad @ p, beta=beta, c=c1)
+        x = x + t*p
+
+        history.record(x)
+
+    return Result(x, history.val_rec, history.time_rec, False, fun=cache.f(x), evals=cache.evals)
@@ -0,0 +1,199 @@
+"""Data-parallel evaluation of a Model loss across processes.
+
+The columns of the data are copied once into shared memory and every worker
+process attaches to a contiguous shard of rows, so that no data is pickled
+while optimizing: each evaluation only sends the point x to the workers and
+adds up the values or gradients they return.
+"""
+import copy
+import multiprocessing
+import numpy as np
+from . import data as _data
+
+
+def _shared_memory():
+    """multiprocessing.shared_memory, which is new in Python 3.8"""
+    try:
+        from multiprocessing import shared_memory
+    except ImportError:
+        raise ImportError('sharding a loss across processes needs '
+                          'multiprocessing.shared_memory, from Python 3.8') from None
+    return shared_memory
+
+
+def _shard_objective(model, x0, var_names, mode):
+    """objective, and objective and gradient together, of model.loss on its
+    shard, summed over rows for losses returning one value per row"""
+    # imported here, the optimizer imports this module lazily
+    from .optimizer import _objective
+    f, value_and_grad, _ = _objective(model.loss, x0, var_names, mode)
+    n = len(x0)
+
+    def shard_value_and_grad(x):
+        val, grad = value_and_grad(x)
+        return float(np.sum(val)), np.reshape(grad, (-1, n)).sum(axis=0)
+    return (lambda x: float(np.sum(f(x)))), shard_value_and_grad
+
+
+def _worker(conn, model, shared, pickled, rows, x0, var_names, mode):
+    """serves ('f', x) and ('value_and_grad', x) requests on a shard until
+    it receives None"""
+    shared_memory = _shared_memory()
+    blocks = []
+    cols = {}
+    for name, (block_name, shape, dtype) in shared.items():
+        block = shared_memory.SharedMemory(name=block_name)
+        blocks.append(block)
+        cols[name] = np.ndarray(shape, dtype, buffer=block.buf)[rows]
+    cols.update(pickled)
+    model.data = model.all_data = _data.batch(cols, slice(None))
+    try:
+        objective = dict(zip(('f', 'value_and_grad'),
+                             _shard_objective(model, x0, var_names, mode)))
+        conn.send(None)
+    except Exception as err:
+        conn.send(err)
+        objective = None
+    while True:
+        request = conn.recv()
+        if request is None:
+            break
+        kind, x = request
+        try:
+            conn.send(objective[kind](x))
+        except Exception as err:
+            conn.send(err)
+    del cols, model
+    for block in blocks:
+        block.close()
+    conn.close()
+
+
+class ShardedLoss(object):
+    def __init__(self, model, x0, workers=None, mode='auto'):
+        """Loss of a Model over its data, evaluated in parallel by worker
+        processes that each hold a shard of the rows
+
+        INPUTS
+        =======
+        model: Model, whose loss(*params) is evaluated on model.all_data. The
+            loss sees the columns of its shard as arrays, see
+            automin.data.BatchArray, and should add up the losses of the rows
+            (e.g. with np.sum) or return one loss per row.
+        x0: initial guess of the parameters, where the loss is compiled
+        workers: int (optional), number of processes, by default the number
+            of cores
+        mode: string (optional), differentiation mode used by the workers,
+            see minimize
+
+        NOTES
+        =====
+        Numeric columns are copied once into shared memory, other columns are
+        sent once to the worker holding their shard. Calls, grad(x) and
+        value_and_grad(x) then only send x to the workers. ShardedLoss is a
+        context manager, close stops the workers and frees the shared
+        memory. Shared memory needs Python 3.8 or later, ImportError is
+        raised on older versions, where only the serial loss is available.
+
+        EXAMPLES
+        =========
+        >>> import numpy as np
+        >>> from automin.optimizer import Model
+        >>> from automin.parallel import ShardedLoss
+        >>> class Mean(Model):
+        ...     def loss(self, m):
+        ...         return np.sum((self.data['y'] - m)**2)
+        >>> with ShardedLoss(Mean({'y': np.arange(10.)}), [0.], workers=2) as loss:
+        ...     loss(0.), loss.grad(np.array([0.]))
+        (285.0, array([-90.]))
+        """
+        shared_memory = _shared_memory()
+        cols = _data.columns(model.all_data)
+        n = _data.n_rows(cols)
+        if workers is None:
+            workers = multiprocessing.cpu_count() or 1
+        workers = max(1, min(workers, n))
+        x0 = np.array(x0, dtype=float)
+        var_names = ['x'+str(idx) for idx in range(len(x0))]
+        # the workers get the model without its data
+        model = copy.copy(model)
+        model.data = model.all_data = None
+
+        self.blocks = []
+        self.conns = []
+        self.processes = []
+        try:
+            shared = {}
+            for name, col in cols.items():
+                if col.dtype.hasobject:
+                    continue
+                block = shared_memory.SharedMemory(create=True, size=max(col.nbytes, 1))
+                self.blocks.append(block)
+                np.ndarray(col.shape, col.dtype, buffer=block.buf)[...] = col
+                shared[name] = (block.name, col.shape, col.dtype)
+            bounds = np.linspace(0, n, workers+1).astype(int)
+            for start, stop in zip(bounds[:-1], bounds[1:]):
+                rows = slice(start, stop)
+                pickled = {name: col[rows] for name, col in cols.items() if name not in shared}
+                conn, child = multiprocessing.Pipe()
+                process = multiprocessing.Process(
+                    target=_worker, daemon=True,
+                    args=(child, model, shared, pickled, rows, x0, var_names, mode))
+                process.start()
+                child.close()
+                self.conns.append(conn)
+                self.processes.append(process)
+            for conn in self.conns:
+                err = conn.recv()
+                if err is not None:
+                    raise err
+        except BaseException:
+            self.close()
+            raise
+
+    def _reduce(self, kind, x):
+        x = np.asarray(x, dtype=float)
+        for conn in self.conns:
+            conn.send((kind, x))
+        # every reply is read before raising, so that the pipes stay in sync
+        parts = [conn.recv() for conn in self.conns]
+        for part in parts:
+            if isinstance(part, Exception):
+                raise part
+        return parts
+
+    def __call__(self, *x):
+        """loss at the parameters x, summed over the shards"""
+        return sum(self._reduce('f', x))
+
+    def value_and_grad(self, x):
+        """loss and its gradient at x, summed over the shards, from one
+        pass of each worker"""
+        vals, grads = zip(*self._reduce('value_and_grad', x))
+        return sum(vals), sum(grads)
+
+    def grad(self, x):
+        """gradient of the loss at x, summed over the shards"""
+        return self.value_and_grad(x)[1]
+
+    def close(self):
+        for conn in self.conns:
+            try:
+                conn.send(None)
+                conn.close()
+            except OSError:
+                pass
+        for process in self.processes:
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        for block in self.blocks:
+            block.close()
+            block.unlink()
+        self.conns, self.processes, self.blocks = [], [], []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,53 @@
+"""Benchmark of the simplification passes run on compiled objectives.
+
+Compiles each objective with and without simplify_trace and reports the
+number of operations in the plan and the time of one value-and-gradient
+replay.
+
+Run from the repository root with ``python -m benchmarks.bench_compile``.
+"""
+import timeit
+import numpy as np
+from automin.autodiff.compiler import compile
+
+
+def rosenbrock(*x):
+    return sum(100*(x[i+1]-x[i]**2)**2 + (1-x[i])**2 for i in range(len(x)-1))
+
+
+def polynomial(x, y, z):
+    return (x**4 + 4*x**3*y + 6*x**2*y**2 + 4*x*y**3 + y**4
+            + 3*x**2*z - 2*y**2*z + x**2*y**2*z**2 - 5*x*y*z + z**2 + 1*x**1)
+
+
+def cases():
+    return [
+        ('rosenbrock-2', rosenbrock, np.array([-1.2, 1.])),
+        ('rosenbrock-50', rosenbrock, np.full(50, 0.5)),
+        ('polynomial', polynomial, np.array([0.3, -0.7, 1.1])),
+    ]
+
+
+def run(number=2000):
+    """Returns, for each objective, the number of operations and the time
+    in microseconds of value_and_grad for the raw and simplified plans"""
+    results = {}
+    for name, fn, x in cases():
+        result = {}
+        for simplify in (False, True):
+            plan = compile(fn, len(x), x, simplify=simplify)
+            key = 'simplified' if simplify else 'raw'
+            result[key+'_ops'] = len(plan)
+            result[key+'_us'] = 1e6*min(timeit.repeat(
+                lambda: plan.value_and_grad(x), number=number, repeat=5)) / number
+        results[name] = result
+    return results
+
+
+if __name__ == "__main__":
+    print('{:<15}{:>9}{:>9}{:>12}{:>12}{:>10}'.format(
+        'objective', 'raw ops', 'ops', 'raw (us)', 'time (us)', 'speedup'))
+    for name, r in run().items():
+        print('{:<15}{:>9}{:>9}{:>12.2f}{:>12.2f}{:>10.2f}'.format(
+            name, r['raw_ops'], r['simplified_ops'], r['raw_us'],
+            r['simplified_us'], r['raw_us']/r['simplified_us']))
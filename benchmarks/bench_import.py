@@ -0,0 +1,67 @@
+"""Startup benchmark: time of ``python -c "import automin.optimizer"``.
+
+Short-lived worker processes that only call minimize pay this import on
+every start, so heavy optional dependencies (pandas, matplotlib, scipy,
+process pools) must only be imported by the features that use them.
+
+Run from the repository root with ``python -m benchmarks.bench_import``.
+Pass ``--max-seconds`` to exit with an error when the median import time
+regresses above a threshold.
+"""
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+HEAVY_MODULES = ['pandas', 'matplotlib', 'scipy', 'concurrent.futures']
+
+
+def import_time(module='automin.optimizer', repeat=7):
+    """Returns the median wall time in seconds of importing module in a
+    fresh interpreter"""
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        subprocess.check_call([sys.executable, '-c', 'import ' + module], cwd=ROOT)
+        times.append(time.perf_counter() - start)
+    return sorted(times)[len(times)//2]
+
+
+def baseline_time(repeat=7):
+    """Returns the median wall time of starting an interpreter that only
+    imports numpy, the floor for importing automin"""
+    return import_time('numpy', repeat)
+
+
+def heavy_imports(module='automin.optimizer'):
+    """Returns the heavy optional modules loaded by importing module"""
+    code = ('import sys, {}; print(" ".join(m for m in {!r} if m in sys.modules))'
+            .format(module, HEAVY_MODULES))
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    return out.decode().split()
+
+
+def run(repeat=7):
+    return {
+        'numpy_s': baseline_time(repeat),
+        'automin.optimizer_s': import_time('automin.optimizer', repeat),
+        'heavy_modules': heavy_imports('automin.optimizer'),
+    }
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=7)
+    parser.add_argument('--max-seconds', type=float, default=None)
+    args = parser.parse_args()
+
+    res = run(args.repeat)
+    print('import numpy             : {:.3f} s'.format(res['numpy_s']))
+    print('import automin.optimizer : {:.3f} s'.format(res['automin.optimizer_s']))
+    print('heavy modules loaded     : {}'.format(', '.join(res['heavy_modules']) or 'none'))
+    if res['heavy_modules']:
+        sys.exit('automin.optimizer imports heavy optional dependencies')
+    if args.max_seconds is not None and res['automin.optimizer_s'] > args.max_seconds:
+        sys.exit('import time regressed above {} s'.format(args.max_seconds))
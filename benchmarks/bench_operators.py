@@ -0,0 +1,106 @@
+"""Micro-benchmark of the per-operation overhead of the AD primitives.
+
+Compares dispatching through the cached operator objects of
+automin.autodiff.operators with the former implementation, which rebuilt a
+user function (and its lambdas) on every call and kept the derivatives of
+each variable in a dict keyed by input name, and times one operation on a
+variable depending on n inputs for growing n.
+
+Run from the repository root with ``python -m benchmarks.bench_operators``.
+"""
+import timeit
+import numpy as np
+from automin.autodiff.variables import Variable
+import automin.autodiff.AD_numpy as anp
+
+
+class _DictVariable(object):
+    """the former Variable, with a dict of derivatives"""
+    def __init__(self, name, val, der=None, primitive=True):
+        self.val = val
+        self.name = name
+        self.der = {name: 1} if primitive else der
+
+
+def _former_unary(fn, fn_der):
+    """the former unary_user_function"""
+    def AD_fn(x):
+        try:
+            name = 'f('+','.join(x.der.keys())+')'
+            return _DictVariable(name, fn(x.val), {k: v*fn_der(x.val) for (k, v) in x.der.items()}, False)
+        except AttributeError:
+            return fn(x)
+    return AD_fn
+
+
+def _former_binary(fn, fn_der_x1, fn_der_x2):
+    """the former binary_user_function"""
+    def AD_fn(x1, x2):
+        der1, der2 = getattr(x1, 'der', {}), getattr(x2, 'der', {})
+        x1_val, x2_val = getattr(x1, 'val', x1), getattr(x2, 'val', x2)
+        der = {}
+        for dep_var in set(der1).union(der2):
+            dep_var_der1 = der1.get(dep_var, 0)
+            partial_x1 = fn_der_x1(x1_val, x2_val) * dep_var_der1 if dep_var_der1 != 0 else 0
+            dep_var_der2 = der2.get(dep_var, 0)
+            partial_x2 = fn_der_x2(x1_val, x2_val) * dep_var_der2 if dep_var_der2 != 0 else 0
+            der[dep_var] = partial_x1 + partial_x2
+        name = 'f('+','.join(der.keys())+')'
+        return _DictVariable(name, fn(x1_val, x2_val), der, False)
+    return AD_fn
+
+
+def _rebuilt_mul(x, y):
+    mul = _former_binary(lambda x,y: x*y, lambda x,y: y, lambda x,y: x)
+    return mul(x, y)
+
+
+def _rebuilt_sin(x):
+    return _former_unary(lambda x: np.sin(x), lambda x: np.cos(x))(x)
+
+
+def _time_per_call(fn, number):
+    return min(timeit.repeat(fn, number=number, repeat=5)) / number
+
+
+def run(number=20000):
+    """Returns the per-call time in microseconds of each primitive, both
+    rebuilt on every call as formerly and dispatched through the cached
+    operator"""
+    x = Variable('x', 0.5)
+    y = Variable('y', 1.5)
+    # the former implementation worked on the former variables
+    x_dict = _DictVariable('x', 0.5)
+    y_dict = _DictVariable('y', 1.5)
+    cases = [
+        ('mul', lambda: _rebuilt_mul(x_dict, y_dict), lambda: x*y),
+        ('sin', lambda: _rebuilt_sin(x_dict), lambda: anp.sin(x)),
+    ]
+    results = {}
+    for name, rebuilt, cached in cases:
+        results[name] = {
+            'rebuilt_us': 1e6*_time_per_call(rebuilt, number),
+            'cached_us': 1e6*_time_per_call(cached, number),
+        }
+    return results
+
+
+def run_inputs(sizes=(10, 100, 1000, 5000), number=2000):
+    """Returns, for each number of inputs n, the per-call time in
+    microseconds of one product of a variable depending on all n inputs"""
+    results = {}
+    for n in sizes:
+        s = sum(Variable('n'+str(idx), 1.) for idx in range(n))
+        results[n] = 1e6*_time_per_call(lambda: s*s, number)
+    return results
+
+
+if __name__ == "__main__":
+    print('{:<6}{:>14}{:>14}{:>10}'.format('op', 'rebuilt (us)', 'cached (us)', 'speedup'))
+    for name, r in run().items():
+        print('{:<6}{:>14.2f}{:>14.2f}{:>10.2f}'.format(
+            name, r['rebuilt_us'], r['cached_us'], r['rebuilt_us']/r['cached_us']))
+
+    print('\n{:<8}{:>14}'.format('inputs', 'op (us)'))
+    for n, us in run_inputs().items():
+        print('{:<8}{:>14.2f}'.format(n, us))
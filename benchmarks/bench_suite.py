@@ -0,0 +1,274 @@
+"""Benchmark suite of the AD core and the optimizers, saved as JSON.
+
+Sections:
+
+- ``ops``       : time of one Variable arithmetic operation and of one call
+                  of every AD_numpy function
+- ``gradients`` : time of one gradient of an n-input objective, for each
+                  differentiation mode and several n
+- ``jacobians`` : time of building a vector_Variable of n outputs and its
+                  Jacobian, dense and colored sparse
+- ``minimize``  : time, iterations and final error of every minimize method
+                  on Rosenbrock, Beale and quadratics of dimension 10 to 1000
+- ``compile``   : see benchmarks.bench_compile
+
+Run from the repository root with ``python -m benchmarks.bench_suite``.
+Results are written to ``--output`` (by default
+``benchmarks/results/<commit>.json``) together with the commit, the
+Python and NumPy versions and the platform. ``--compare old.json`` prints
+the ratio of every time to the one in old.json and exits with an error if
+any is slower than ``--threshold``. ``--quick`` runs smaller sizes.
+"""
+import argparse
+import json
+import os
+import platform
+import subprocess
+import sys
+import time
+import timeit
+import warnings
+import numpy as np
+from automin.autodiff.variables import Variable
+from automin.autodiff.vector_variables import vectorize_variable, sparse_jacobian
+from automin.autodiff.compiler import compile
+import automin.autodiff.AD_numpy as anp
+from automin.optimizer import minimize, _get_grad
+from benchmarks import bench_compile
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+METHODS = ['BFGS', 'L-BFGS', 'Newton', 'Conjugate Gradient', 'Steepest Descent',
+           'Gradient Descent']
+UNARY = ['negative', 'sin', 'cos', 'tan', 'arcsin', 'arccos', 'arctan', 'sinh', 'cosh',
+         'tanh', 'arcsinh', 'arccosh', 'arctanh', 'exp', 'log', 'exp2', 'log10', 'log2',
+         'sqrt', 'logistic']
+BINARY = ['add', 'subtract', 'multiply', 'divide', 'power']
+
+
+def _time(fn, min_time=0.05, repeat=3):
+    """Returns the best time in seconds of one call of fn, with the number
+    of calls per measurement chosen so that it lasts about min_time"""
+    start = time.perf_counter()
+    fn()
+    once = time.perf_counter() - start
+    number = max(1, int(min_time / max(once, 1e-9)))
+    return min(timeit.repeat(fn, number=number, repeat=repeat)) / number
+
+
+def rosenbrock(*x):
+    return sum(100*(x[i+1]-x[i]**2)**2 + (1-x[i])**2 for i in range(len(x)-1))
+
+
+def beale(x, y):
+    return (1.5 - x + x*y)**2 + (2.25 - x + x*y**2)**2 + (2.625 - x + x*y**3)**2
+
+
+def quadratic(n):
+    """f(x) = sum d_i x_i^2 / 2 with curvatures d from 1 to 10"""
+    d = np.linspace(1, 10, n)
+    return lambda *x: sum(d_i*x_i**2 for d_i, x_i in zip(d, x)) / 2
+
+
+def _tridiagonal(*x):
+    n = len(x)
+    return [(3-2*x[i])*x[i] - (x[i-1] if i > 0 else 0) - 2*(x[i+1] if i < n-1 else 0) + 1
+            for i in range(n)]
+
+
+def bench_ops(min_time=0.05):
+    """Returns the time in microseconds of each Variable operator and
+    AD_numpy function on scalar Variables"""
+    x = Variable('x', 0.5)
+    y = Variable('y', 1.5)
+    cases = {
+        'var+var': lambda: x + y,
+        'var-var': lambda: x - y,
+        'var*var': lambda: x * y,
+        'var/var': lambda: x / y,
+        'var**var': lambda: x ** y,
+        'var+2': lambda: x + 2,
+        '2*var': lambda: 2 * x,
+        'var**2': lambda: x ** 2,
+        '2**var': lambda: 2 ** x,
+        '-var': lambda: -x,
+    }
+    for name in UNARY:
+        fn = getattr(anp, name)
+        # arccosh is only defined above 1
+        arg = y if name == 'arccosh' else x
+        cases['anp.'+name] = (lambda fn, arg: lambda: fn(arg))(fn, arg)
+    for name in BINARY:
+        fn = getattr(anp, name)
+        cases['anp.'+name] = (lambda fn: lambda: fn(x, y))(fn)
+    return {name: 1e6*_time(fn, min_time) for name, fn in cases.items()}
+
+
+def bench_gradients(sizes=(2, 10, 100, 1000), min_time=0.05):
+    """Returns, for the Rosenbrock function of each size n, the time in
+    milliseconds of one gradient in forward and reverse mode, of compiling
+    it and of one compiled gradient"""
+    results = {}
+    for n in sizes:
+        x = np.linspace(-1, 1, n)
+        names = ['x'+str(idx) for idx in range(n)]
+        plan = compile(rosenbrock, n, x)
+        results[str(n)] = {
+            'forward_ms': 1e3*_time(lambda: _get_grad(rosenbrock, x, names, 'forward'), min_time),
+            'reverse_ms': 1e3*_time(lambda: _get_grad(rosenbrock, x, names, 'reverse'), min_time),
+            'compile_ms': 1e3*_time(lambda: compile(rosenbrock, n, x), min_time),
+            'compiled_ms': 1e3*_time(lambda: plan.grad(x), min_time),
+        }
+    return results
+
+
+def bench_jacobians(sizes=(10, 100, 1000), min_time=0.05):
+    """Returns, for a tridiagonal system of each size n, the time in
+    milliseconds of evaluating it on Variables into a vector_Variable, of
+    its dense Jacobian, and of the colored sparse Jacobian"""
+    results = {}
+    vec_fn = vectorize_variable(_tridiagonal)
+    for n in sizes:
+        x = np.linspace(-1, 1, n)
+        names = ['j'+str(idx) for idx in range(n)]
+        variables = [Variable(name, x_n) for name, x_n in zip(names, x)]
+        f = vec_fn(*variables)
+        results[str(n)] = {
+            'build_ms': 1e3*_time(lambda: vec_fn(*variables), min_time),
+            'dense_ms': 1e3*_time(lambda: f.jacobian('array'), min_time),
+            'sparse_ms': 1e3*_time(lambda: sparse_jacobian(_tridiagonal, x, names), min_time),
+        }
+    return results
+
+
+def problems(sizes=(10, 100, 1000)):
+    """(name, objective, x0, minimum value, kwargs by method) of the test
+    problems of bench_minimize"""
+    cases = [
+        ('rosenbrock-2', rosenbrock, [-1.2, 1.], 0., {'Gradient Descent': {'lr': 1e-3}}),
+        ('beale', beale, [1., 1.], 0., {'Gradient Descent': {'lr': 1e-2}}),
+    ]
+    for n in sizes:
+        cases.append(('quadratic-'+str(n), quadratic(n), np.ones(n), 0.,
+                      {'Gradient Descent': {'lr': 0.1}}))
+    return cases
+
+
+def bench_minimize(sizes=(10, 100, 1000), methods=METHODS, repeat=3):
+    """Returns, for each problem and method, the best time in seconds of
+    repeat runs, the number of iterations, whether it converged, and the
+    error f(x) - f(x*) at the returned point"""
+    results = {}
+    for name, fn, x0, f_min, method_kwargs in problems(sizes):
+        results[name] = {}
+        for method in methods:
+            kwargs = method_kwargs.get(method, {})
+            times = []
+            with warnings.catch_warnings():
+                warnings.simplefilter('ignore')
+                for _ in range(repeat):
+                    start = time.perf_counter()
+                    res = minimize(fn, x0, method, **kwargs)
+                    times.append(time.perf_counter() - start)
+            results[name][method] = {
+                'seconds': min(times),
+                'iterations': len(res.val_rec) - 1,
+                'converged': bool(res.converge),
+                'error': float(fn(*res.x) - f_min),
+            }
+    return results
+
+
+def _commit():
+    try:
+        out = subprocess.check_output(['git', 'rev-parse', '--short', 'HEAD'], cwd=ROOT,
+                                      stderr=subprocess.DEVNULL)
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    return out.decode().strip()
+
+
+def run(quick=False, min_time=0.05):
+    """Runs every section and returns the results with the environment
+    they were measured in"""
+    sizes = (10, 100) if quick else (10, 100, 1000)
+    return {
+        'meta': {
+            'commit': _commit(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'quick': quick,
+        },
+        'ops': bench_ops(min_time),
+        'gradients': bench_gradients((2,) + sizes, min_time),
+        'jacobians': bench_jacobians(sizes, min_time),
+        'minimize': bench_minimize(sizes),
+        'compile': bench_compile.run(number=200 if quick else 2000),
+    }
+
+
+_UNITS = {'seconds': 1, '_ms': 1e-3, '_us': 1e-6}
+
+
+def _timings(results):
+    """flattens the timings of results into {'section/.../key': seconds}"""
+    # op timings are in microseconds, keyed by the op alone
+    flat = {'ops/'+name: us*1e-6 for name, us in results.get('ops', {}).items()}
+
+    def walk(node, path):
+        for key, value in node.items():
+            if isinstance(value, dict):
+                walk(value, path + key + '/')
+                continue
+            for suffix, unit in _UNITS.items():
+                if key.endswith(suffix):
+                    flat[path + key] = value*unit
+    for section in ('gradients', 'jacobians', 'minimize', 'compile'):
+        walk(results.get(section, {}), section + '/')
+    return flat
+
+
+def compare(new, old, threshold=1.25):
+    """Returns [(name, new/old time ratio)] of the timings found in both
+    results, and the names of those slower than threshold times the old one"""
+    new_t = _timings(new)
+    old_t = _timings(old)
+    ratios = [(name, new_t[name]/old_t[name]) for name in sorted(new_t)
+              if name in old_t and old_t[name] > 0]
+    return ratios, [name for name, ratio in ratios if ratio > threshold]
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--output', default=None)
+    parser.add_argument('--compare', default=None)
+    parser.add_argument('--threshold', type=float, default=1.25)
+    parser.add_argument('--quick', action='store_true')
+    args = parser.parse_args()
+
+    results = run(quick=args.quick)
+    output = args.output or os.path.join(
+        ROOT, 'benchmarks', 'results', '{}.json'.format(results['meta']['commit'] or 'latest'))
+    os.makedirs(os.path.dirname(os.path.abspath(output)), exist_ok=True)
+    with open(output, 'w') as fh:
+        json.dump(results, fh, indent=2, sort_keys=True)
+    print('results written to', output)
+
+    print('\n{:<34}{:>10}{:>8}{:>10}'.format('minimize', 'seconds', 'iters', 'error'))
+    for problem, by_method in results['minimize'].items():
+        for method, r in by_method.items():
+            print('{:<34}{:>10.3f}{:>8}{:>10.1e}{}'.format(
+                problem + ' ' + method, r['seconds'], r['iterations'], r['error'],
+                '' if r['converged'] else '  (not converged)'))
+
+    if args.compare:
+        with open(args.compare) as fh:
+            old = json.load(fh)
+        ratios, slower = compare(results, old, args.threshold)
+        print('\n{:<60}{:>8}'.format('timing', 'new/old'))
+        for name, ratio in ratios:
+            print('{:<60}{:>8.2f}{}'.format(name, ratio, '  <-' if name in slower else ''))
+        if slower:
+            sys.exit('{} timings are more than {} times slower than in {}'
+                     .format(len(slower), args.threshold, args.compare))
@@ -0,0 +1,36 @@
+import copy
+import json
+from ..benchmarks import bench_suite
+
+
+def test_bench_suite_sections():
+    ops = bench_suite.bench_ops(min_time=1e-4)
+    assert {'var*var', 'anp.arccosh', 'anp.power'} <= set(ops)
+    grads = bench_suite.bench_gradients(sizes=(3,), min_time=1e-4)
+    assert set(grads['3']) == {'forward_ms', 'reverse_ms', 'compile_ms', 'compiled_ms'}
+    jacs = bench_suite.bench_jacobians(sizes=(4,), min_time=1e-4)
+    assert set(jacs['4']) == {'build_ms', 'dense_ms', 'sparse_ms'}
+    runs = bench_suite.bench_minimize(sizes=(3,), methods=['BFGS', 'Newton'], repeat=1)
+    assert set(runs) == {'rosenbrock-2', 'beale', 'quadratic-3'}
+    for by_method in runs.values():
+        for r in by_method.values():
+            assert r['converged'] and r['error'] < 1e-6 and r['iterations'] > 0
+
+
+def test_bench_suite_compare():
+    results = {'meta': {'commit': 'abc'},
+               'ops': {'var*var': 2.0},
+               'gradients': {'10': {'forward_ms': 1.0}},
+               'minimize': {'beale': {'BFGS': {'seconds': 0.5, 'iterations': 12,
+                                               'converged': True, 'error': 0.}}}}
+    old = json.loads(json.dumps(results))
+    ratios, slower = bench_suite.compare(results, old)
+    assert dict(ratios) == {'ops/var*var': 1.0, 'gradients/10/forward_ms': 1.0,
+                            'minimize/beale/BFGS/seconds': 1.0}
+    assert slower == []
+
+    new = copy.deepcopy(results)
+    new['ops']['var*var'] = 3.0
+    new['minimize']['beale']['BFGS']['iterations'] = 100
+    ratios, slower = bench_suite.compare(new, old, threshold=1.25)
+    assert slower == ['ops/var*var']
@@ -0,0 +1,61 @@
+import numpy as np
+import pytest
+from ..automin.cache import EvalCache
+from ..automin.optimizer import minimize, _wolfe_step
+
+
+def test_eval_cache_lru():
+    f = lambda x: float(x @ x)
+    cache = EvalCache(f, lambda x: (f(x), 2*x), size=2)
+    a, b, c = np.array([1., 0.]), np.array([0., 1.]), np.array([1., 1.])
+    assert cache.f(a) == 1. and cache.f(b) == 1.
+    # a hit refreshes the point, b is the least recently used
+    assert cache.f([1, 0]) == 1.
+    cache.f(c)
+    cache.f(a)
+    cache.f(b)
+    assert cache.evals == {'f': 4, 'grad': 0, 'directional': 0, 'cached': 2}
+    # keys are exact: a point differing in the last bit is evaluated
+    cache.f(np.nextafter(b, 2))
+    assert cache.n_f == 5
+    # the value computed with a gradient is cached too
+    np.testing.assert_array_equal(cache.grad(c), [2., 2.])
+    assert cache.f(c) == 2.
+    assert cache.evals == {'f': 5, 'grad': 1, 'directional': 0, 'cached': 3}
+    # directional derivatives come from a cached gradient, or fall back to
+    # the gradient without a directional function
+    assert cache.value_and_directional(c, np.array([1., -1.])) == (2., 0.)
+    assert cache.n_cached == 4
+    assert cache.value_and_directional(a, np.array([1., 0.])) == (1., 2.)
+    assert cache.n_grad == 2
+
+    probe = EvalCache(f, lambda x: (f(x), 2*x), lambda x, s: (f(x), 2*x @ s))
+    assert probe.value_and_directional(a, np.array([3., 0.])) == (1., 6.)
+    assert probe.evals == {'f': 0, 'grad': 0, 'directional': 1, 'cached': 0}
+    assert probe.f(a) == 1. and probe.n_f == 0
+
+    with pytest.raises(ValueError):
+        EvalCache(f, f, size=0)
+
+
+def test_wolfe_fallback_reuses_probes():
+    f = lambda x: float(np.sum(x**4))
+    cache = EvalCache(f, lambda x: (f(x), 4*x**3))
+    x = np.array([1., 1.])
+    # an ascent direction: the Wolfe search fails, and backtracking probes
+    # the same first steps again
+    _wolfe_step(cache.f, cache.grad, x, np.array([1e-12, 0.]), *cache.value_and_grad(x))
+    assert cache.n_cached > 0
+
+
+def test_result_counts_evaluations():
+    f = lambda x, y: (x-1)**2 + 10*(y+2)**2
+    for method in ['BFGS', 'L-BFGS', 'Newton', 'Conjugate Gradient', 'Steepest Descent']:
+        r = minimize(f, [0, 0], method, history='off')
+        assert set(r.evals) == {'f', 'grad', 'directional', 'cached'}
+        assert r.evals['grad'] >= 1 and r.evals['f'] >= 1
+    # gradient descent only needs gradients, its final value comes with the
+    # last one
+    r = minimize(f, [0, 0], 'Gradient Descent', lr=0.01, history='off')
+    assert r.evals['f'] == 0 and r.evals['grad'] > 1
+    assert r.fun == f(*r.x)
@@ -0,0 +1,134 @@
+import numpy as np
+import pytest
+from ..automin.autodiff import AD_numpy as anp
+from ..automin.autodiff.compiler import compile, TraceError
+from ..benchmarks.bench_compile import cases
+from ..automin.optimizer import minimize, _get_grad
+
+
+def test_compiled_matches_reverse():
+    fns = [
+        lambda x, y: 100*(y-x**2)**2 + (1-x)**2,
+        lambda x, y: anp.sin(x*y) + anp.exp(x)/anp.cos(y) - anp.log(x),
+        lambda x, y: anp.logistic(x) + anp.sqrt(y) + anp.arctan(x/y),
+        lambda x, y: x**y + anp.tanh(x-y) - 2/x + anp.log(y, 10),
+    ]
+    names = ['x0', 'x1']
+    for f in fns:
+        plan = compile(f, 2, [0.5, 0.5])
+        for point in ([1., 2.], [0.3, 0.7]):
+            val, grad = plan.value_and_grad(np.array(point))
+            assert np.isclose(val, f(*point))
+            np.testing.assert_allclose(grad, _get_grad(f, point, names, 'reverse'))
+
+
+def test_compiled_batch():
+    f = lambda x, y: x**2 * y + 3
+    plan = compile(f, 2)
+    X = np.array([[1., 2.], [3., 1.], [0., 5.]])
+    np.testing.assert_allclose(plan(*X.T), [5., 12., 3.])
+    np.testing.assert_allclose(plan.grad(X.T), [[4., 1.], [6., 9.], [0., 0.]])
+
+
+def test_compiled_constant_and_unused_inputs():
+    plan = compile(lambda x, y: 3, 2)
+    assert plan(1., 2.) == 3
+    np.testing.assert_array_equal(plan.grad([1., 2.]), [0., 0.])
+    plan = compile(lambda x, y: 2*x, 2)
+    np.testing.assert_array_equal(plan.grad([1., 2.]), [2., 0.])
+    with pytest.raises(ValueError):
+        plan.grad([1., 2., 3.])
+
+
+def test_compiled_sum_over_data():
+    data = np.linspace(-1, 1, 7)
+    fn = lambda a, b: np.sum((anp.tanh(a*data) - b)**2) + np.mean(a*data)
+    plan = compile(fn, 2, [0.5, 0.2])
+    x = np.array([0.3, -0.4])
+    assert np.isclose(plan(*x), fn(*x))
+    np.testing.assert_allclose(plan.grad(x), _get_grad(fn, x, ['a', 'b'], 'forward'))
+    s = np.array([1., -2.])
+    val, slope = plan.value_and_directional(x, s)
+    assert np.isclose(val, fn(*x))
+    assert np.isclose(slope, plan.grad(x) @ s)
+    with pytest.raises(TraceError):
+        compile(lambda a: np.sum(a*np.ones((2, 3)), axis=0), 1, [1.])
+
+
+def test_compile_data_dependent():
+    branches = [
+        lambda x: x if x > 0 else -x,
+        lambda x: x**2 if x else 0,
+        lambda x: float(x),
+        lambda x: [1, 2][x],
+        lambda x: x**2 if x.val > 0 else 0,
+    ]
+    for f in branches:
+        with pytest.raises(TraceError):
+            compile(f, 1)
+    # domain checks still run at the trace point
+    with pytest.raises(ValueError):
+        compile(lambda x: anp.log(x), 1, [-1.])
+
+
+def test_simplify_preserves_plan():
+    fns = [
+        # the sin terms cancel once y*x is found to be x*y
+        lambda x, y: (x*y)**2 + 3*(y*x) + anp.sin(x*y) - anp.sin(y*x),
+        lambda x, y: 0*anp.exp(x) + 1*y**1 + (x-x)*y + x**0 + (y+0)/1 - (2-2)*x,
+        lambda x, y: anp.cos(2*np.pi)*x + (3+4)*y**2 + anp.log(np.e)*x*y,
+    ] + [fn for _, fn, _ in cases()]
+    rng = np.random.RandomState(0)
+    for f in fns:
+        n = f.__code__.co_argcount or 50
+        raw = compile(f, n, np.full(n, 0.5), simplify=False)
+        plan = compile(f, n, np.full(n, 0.5))
+        assert len(plan) < len(raw)
+        for _ in range(3):
+            x = rng.uniform(0.1, 2, n)
+            val, grad = plan.value_and_grad(x)
+            raw_val, raw_grad = raw.value_and_grad(x)
+            assert np.isclose(val, raw_val)
+            np.testing.assert_allclose(grad, raw_grad)
+
+
+def test_simplify_folds_and_dedups():
+    # x*y is computed once
+    plan = compile(lambda x, y: (x*y)**2 + 3*(y*x), 2)
+    assert len(plan) == 4
+    # the whole objective folds to a constant
+    plan = compile(lambda x, y: (x-x)*anp.exp(y) + 2, 2)
+    assert len(plan) == 0
+    assert plan(3., 4.) == 2
+    np.testing.assert_array_equal(plan.grad([3., 4.]), [0., 0.])
+    # identities folded on data arrays keep their shape
+    data = np.array([1., 2., 3.])
+    for f in [lambda x: np.sum(x*data*0 + x), lambda x: np.sum(x*data - x*data + x),
+              lambda x: np.sum((x*data)**0 * x)]:
+        plan = compile(f, 1, [2.])
+        assert len(plan) < len(compile(f, 1, [2.], simplify=False))
+        assert plan(2.) == 6.
+        np.testing.assert_array_equal(plan.grad([2.]), [3.])
+    # the 0 + of sum is dropped
+    plan = compile(lambda *x: sum(x_i**2 for x_i in x), 3)
+    assert len(plan) == 5
+
+
+def test_optimizer_modes():
+    f = lambda x, y: (1-x)**2 + 100*(y-x**2)**2
+    # g branches on the value of x, auto falls back to forward mode
+    g = lambda x, y: ((x-1)**2 if getattr(x, 'val', x) > 1 else 2*(x-1)**2) + (y-2)**2
+    for method in ['BFGS', 'L-BFGS', 'Newton', 'Conjugate Gradient']:
+        r = minimize(f, [2, 2], method, mode='compiled')
+        assert r.converge
+        assert np.linalg.norm(r.x - np.array([1, 1])) < 1e-2
+        np.testing.assert_allclose(minimize(f, [2, 2], method).x, r.x)
+        np.testing.assert_allclose(minimize(f, [2, 2], method, mode='forward').x, r.x,
+                                   atol=1e-6)
+
+    for x0 in ([3, 0], [-3, 0]):
+        r = minimize(g, x0, 'BFGS')
+        assert r.converge
+        assert np.linalg.norm(r.x - np.array([1, 2])) < 1e-3
+    with pytest.raises(TraceError):
+        minimize(g, [3, 0], 'BFGS', mode='compiled')
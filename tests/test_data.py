@@ -0,0 +1,183 @@
+import threading
+import numpy as np
+import pandas as pd
+import pytest
+from ..automin.data import (ArraySource, CSVSource, NpySource, GeneratorSource,
+                            EpochScheduler, prefetch, n_rows)
+from ..automin.optimizer import Model, minimize_over_data
+
+
+def _frame(n=103):
+    rng = np.random.RandomState(0)
+    x = rng.normal(size=n)
+    return pd.DataFrame({'i': np.arange(n), 'x': x, 'y': 2*x + 1})
+
+
+def _sources(frame, tmp_path):
+    frame.to_csv(tmp_path / 'data.csv', index=False)
+    np.save(tmp_path / 'data.npy', frame.values)
+    np.save(tmp_path / 'records.npy', frame.to_records(index=False))
+    for name in frame:
+        np.save(tmp_path / (name + '.npy'), frame[name].values)
+    chunks = lambda: (frame.iloc[start:start+7] for start in range(0, len(frame), 7))
+    return [ArraySource(frame),
+            CSVSource(tmp_path / 'data.csv', chunksize=10),
+            NpySource(tmp_path / 'data.npy', names=list(frame), chunksize=10),
+            NpySource(tmp_path / 'records.npy', chunksize=10, prefetch=0),
+            NpySource({name: tmp_path / (name + '.npy') for name in frame}, chunksize=10),
+            GeneratorSource(chunks)]
+
+
+@pytest.mark.parametrize('shuffle', [False, True])
+def test_sources_visit_every_row_once(tmp_path, shuffle):
+    frame = _frame()
+    for source in _sources(frame, tmp_path):
+        for epoch in range(2):
+            batches = list(source.batches(4, shuffle))
+            assert [n_rows(b) for b in batches] == [4]*25 + [3]
+            rows = np.concatenate([b['i'] for b in batches]).astype(int)
+            assert sorted(rows) == list(range(len(frame)))
+            if not shuffle:
+                assert list(rows) == list(range(len(frame)))
+            for b in batches:
+                assert set(b) == {'i', 'x', 'y'}
+                np.testing.assert_allclose(b['x'], frame['x'].values[b['i'].astype(int)])
+
+
+def test_generator_source_single_use():
+    source = GeneratorSource(iter([{'x': np.arange(3)}]), prefetch=0)
+    assert len(list(source.batches(2))) == 2
+    with pytest.raises(RuntimeError):
+        list(source.batches(2))
+
+
+def test_npy_source_checks_columns(tmp_path):
+    np.save(tmp_path / 'a.npy', np.zeros((4, 2)))
+    np.save(tmp_path / 'b.npy', np.zeros(5))
+    with pytest.raises(ValueError):
+        NpySource(tmp_path / 'a.npy', names=['x'])
+    with pytest.raises(ValueError):
+        NpySource(tmp_path / 'b.npy')
+    with pytest.raises(ValueError):
+        NpySource({'x': tmp_path / 'b.npy', 'y': tmp_path / 'b.npy', 'z': tmp_path / 'a.npy'})
+
+
+def test_prefetch_errors_and_close():
+    def failing():
+        yield 1
+        raise KeyError('bad chunk')
+    it = prefetch(failing())
+    assert next(it) == 1
+    with pytest.raises(KeyError):
+        next(it)
+
+    # reads at most depth items ahead, and stops once closed
+    produced = []
+    def counting():
+        for i in range(1000):
+            produced.append(i)
+            yield i
+    before = threading.active_count()
+    it = prefetch(counting(), depth=2)
+    assert next(it) == 0
+    it.close()
+    for _ in range(100):
+        if threading.active_count() <= before:
+            break
+        threading.Event().wait(0.01)
+    assert threading.active_count() <= before
+    assert len(produced) <= 4
+
+
+def test_minimize_over_streamed_data(tmp_path):
+    frame = _frame(400)
+    frame.to_csv(tmp_path / 'data.csv', index=False)
+
+    class Linear(Model):
+        def loss(self, b0, b1):
+            return np.sum((b0 + b1*self.data['x'] - self.data['y'])**2)
+
+    model = Linear(CSVSource(tmp_path / 'data.csv', chunksize=50, usecols=['x', 'y']))
+    r = minimize_over_data(model, [0, 0], 'Adam', 20, stochastic=True, batch_size=16, lr=0.05)
+    np.testing.assert_allclose(r.x, [1, 2], atol=1e-2)
+    assert len(r.val_rec) == 1 + 20*25
+
+    with pytest.raises(ValueError):
+        minimize_over_data(model, [0, 0], 'BFGS', 10)
+
+
+def test_epoch_scheduler_shuffles_in_place():
+    frame = _frame(50)
+    scheduler = EpochScheduler(frame, batch_size=8, seed=3)
+    order = scheduler.order
+    epochs = []
+    for epoch in range(3):
+        idx = np.concatenate(list(scheduler.indices()))
+        assert sorted(idx) == list(range(50))
+        epochs.append(idx)
+        # the permutation index is reshuffled in place, never reallocated
+        assert scheduler.order is order
+    assert scheduler.epoch == 3
+    assert not np.array_equal(epochs[0], epochs[1])
+
+    # the same seed gives the same epochs, batches hold the indexed rows
+    again = EpochScheduler(frame, batch_size=8, seed=3)
+    for idx in epochs:
+        batches = list(again)
+        assert [n_rows(b) for b in batches] == [8]*6 + [2]
+        np.testing.assert_array_equal(np.concatenate([b['i'] for b in batches]), idx)
+
+    with pytest.raises(ValueError):
+        EpochScheduler(frame, batch_size=0)
+
+
+def test_epoch_scheduler_streaming(tmp_path):
+    frame = _frame(50)
+    np.save(tmp_path / 'data.npy', frame.to_records(index=False))
+    rows = []
+    for _ in range(2):
+        scheduler = EpochScheduler(NpySource(tmp_path / 'data.npy', chunksize=10),
+                                   batch_size=4, seed=0)
+        rows.append(np.concatenate([b['i'] for b in scheduler]))
+        assert sorted(rows[-1]) == list(range(50))
+    np.testing.assert_array_equal(rows[0], rows[1])
+    with pytest.raises(TypeError):
+        next(scheduler.indices())
+
+
+def test_model_step():
+    frame = _frame(5)
+    model = Model(frame)
+    model.make_stochastic(batch_size=2, seed=0)
+    # data starts at the first batch, before any step
+    seen = [list(model.data['i'])]
+    for _ in range(5):
+        model.step()
+        seen.append(list(model.data['i']))
+    # two epochs of three batches, each visiting every row once
+    assert sorted(sum(seen[:3], [])) == list(range(5))
+    assert sorted(sum(seen[3:], [])) == list(range(5))
+    assert [len(rows) for rows in seen] == [2, 2, 1]*2
+    assert model.scheduler.epoch == 2
+    # batches finishes the epoch started by step, from the current batch on
+    model.step()
+    current = list(model.data['i'])
+    rows = [list(b['i']) for b in model.batches()]
+    assert rows[0] == current and sorted(sum(rows, [])) == list(range(5))
+    assert model.scheduler.epoch == 3
+    assert sum(len(b['i']) for b in model.batches()) == 5
+    model.make_deterministic()
+    assert model.data is frame
+
+
+def test_seeded_training_is_reproducible():
+    frame = _frame(60)
+
+    class Linear(Model):
+        def loss(self, b0, b1):
+            return np.sum((b0 + b1*self.data['x'] - self.data['y'])**2)
+
+    runs = [minimize_over_data(Linear(frame), [0, 0], 'Gradient Descent', 2, stochastic=True,
+                               batch_size=7, lr=0.01, seed=seed) for seed in (1, 1, 2)]
+    np.testing.assert_array_equal(runs[0].val_rec, runs[1].val_rec)
+    assert not np.array_equal(runs[0].val_rec, runs[2].val_rec)
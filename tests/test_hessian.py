@@ -0,0 +1,62 @@
+import numpy as np
+from ..automin.autodiff import AD_numpy as anp
+from ..automin.autodiff.hessian import hessian, hvp
+from ..automin.optimizer import get_gradient, minimize
+
+
+def _numeric_hessian(f, x, eps=1e-5):
+    names = ['x'+str(i) for i in range(len(x))]
+    x = np.array(x, dtype=float)
+    return np.array([(get_gradient(f, x+eps*e, names) - get_gradient(f, x-eps*e, names))/(2*eps)
+                     for e in np.eye(len(x))])
+
+
+def test_hessian_matches_finite_differences():
+    fns = [
+        lambda x, y: 100*(y-x**2)**2 + (1-x)**2,
+        lambda x, y: anp.sin(x*y) + anp.exp(x)*anp.sqrt(y) + x**y,
+        lambda x, y: anp.logistic(x-y) + anp.log(x) / anp.cosh(y) + anp.arctan(x*y),
+    ]
+    x = [0.7, 1.3]
+    for f in fns:
+        H = hessian(f, x)
+        assert np.allclose(H, H.T)
+        assert np.allclose(H, _numeric_hessian(f, x), rtol=1e-5, atol=1e-6)
+
+
+def test_hvp():
+    f = lambda x, y, z: x**2*y + anp.exp(y*z) - 3*z
+    x = [1., 0.5, -1.]
+    H = hessian(f, x)
+    for v in np.eye(3).tolist() + [[0.3, -2., 1.5]]:
+        g, Hv = hvp(f, x, v)
+        assert np.allclose(g, get_gradient(f, x, ['x0', 'x1', 'x2']))
+        assert np.allclose(Hv, H @ v)
+
+
+def test_hessian_linear_and_constant_terms():
+    # gradient components that do not depend on the inputs
+    f = lambda x, y: 2*x + y**2
+    assert np.allclose(hessian(f, [1., 1.]), [[0, 0], [0, 2]])
+    g, Hv = hvp(f, [1., 1.], [1., 1.])
+    assert np.allclose(g, [2, 2])
+    assert np.allclose(Hv, [0, 2])
+
+
+def test_hessian_sum_over_data():
+    data = np.array([1., 2., 3.])
+    y = np.array([3., 5., 7.])
+    f = lambda a, b: np.sum((a*data + b - y)**2)
+    x = [0.5, -1.]
+    H = hessian(f, x)
+    assert np.allclose(H, 2*np.array([[data @ data, data.sum()], [data.sum(), 3.]]))
+    g, Hv = hvp(f, x, [1., -1.])
+    assert np.allclose(g, get_gradient(f, x, ['x0', 'x1']))
+    assert np.allclose(Hv, H @ [1., -1.])
+    # the data array is broadcast from the scalar input before the sum
+    g = lambda a, b: np.sum(a + data) * b
+    assert np.allclose(hessian(g, [1., 2.]), [[0., 3.], [3., 0.]])
+    for method in [None, 'Newton']:
+        r = minimize(f, [0., 0.], method)
+        assert r.converge
+        assert np.allclose(r.x, [2., 1.], atol=1e-4)
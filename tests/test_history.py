@@ -0,0 +1,76 @@
+import numpy as np
+import pytest
+from ..automin.history import History, make_history
+from ..automin.optimizer import minimize, minimize_over_data, Model
+
+
+def test_history_modes():
+    xs = [np.array([i, 2.*i]) for i in range(10)]
+
+    full = History('full', capacity=2)
+    every = History('every', k=3)
+    last = History('last', size=4)
+    off = History('off')
+    for h in (full, every, last, off):
+        for x in xs:
+            h.record(x)
+        assert h.iterations == 10
+        assert len(h.val_rec) == len(h.time_rec)
+        assert np.all(np.diff(h.time_rec) >= 0)
+
+    np.testing.assert_array_equal(full.val_rec, xs)
+    np.testing.assert_array_equal(every.val_rec, [xs[0], xs[3], xs[6], xs[9]])
+    np.testing.assert_array_equal(last.val_rec, xs[6:])
+    assert len(off.val_rec) == 0
+
+
+def test_history_record_copies():
+    h = History()
+    x = np.zeros(2)
+    h.record(x)
+    x += 1
+    h.record(x)
+    np.testing.assert_array_equal(h.val_rec, [[0, 0], [1, 1]])
+
+
+def test_make_history():
+    assert make_history(None).mode == 'full'
+    assert make_history('off').mode == 'off'
+    template = History('every', k=5)
+    h = make_history(template)
+    assert h is not template and (h.mode, h.k) == ('every', 5)
+    with pytest.raises(ValueError):
+        History('sometimes')
+    with pytest.raises(ValueError):
+        History('every', k=0)
+
+
+def test_optimizer_history():
+    f = lambda x, y: (1-x)**2 + 100*(y-x**2)**2
+    for method in ['BFGS', 'L-BFGS', 'Newton', 'Steepest Descent',
+                   'Conjugate Gradient', 'Gradient Descent']:
+        full = minimize(f, [0, 0], method, max_iter=200)
+        np.testing.assert_array_equal(full.val_rec[0], [0, 0])
+        np.testing.assert_array_equal(full.val_rec[-1], full.x)
+
+        last = minimize(f, [0, 0], method, max_iter=200, history=History('last', size=3))
+        np.testing.assert_array_equal(last.val_rec, full.val_rec[-3:])
+
+        off = minimize(f, [0, 0], method, max_iter=200, history='off')
+        assert len(off.val_rec) == 0 and len(off.time_rec) == 0
+        np.testing.assert_array_equal(off.x, full.x)
+
+
+def test_minimize_over_data_history():
+    import pandas as pd
+
+    class Mean(Model):
+        def loss(self, m):
+            return np.sum((self.data['y'] - m)**2)
+
+    data = pd.DataFrame({'y': [1., 2., 3.]})
+    r = minimize_over_data(Mean(data), [0.], 'Gradient Descent', epochs=2,
+                           stochastic=True, lr=0.1, history=History('every', k=2))
+    # 1 + 2 epochs * 3 rows iterates, every other one is kept
+    assert len(r.val_rec) == 4
+    np.testing.assert_array_equal(r.val_rec[-1], r.x)
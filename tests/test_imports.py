@@ -0,0 +1,22 @@
+import os
+import subprocess
+import sys
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def _loaded_after_import(module, candidates):
+    code = ('import sys, {}; print(" ".join(m for m in {!r} if m in sys.modules))'
+            .format(module, candidates))
+    out = subprocess.check_output([sys.executable, '-c', code], cwd=ROOT)
+    return out.decode().split()
+
+
+@pytest.mark.parametrize('module', ['automin.optimizer',
+                                    'automin.evaluate',
+                                    'automin.autodiff.vector_variables',
+                                    'automin.autodiff.AD_numpy'])
+def test_import_does_not_load_heavy_dependencies(module):
+    heavy = ['pandas', 'matplotlib', 'scipy', 'concurrent.futures']
+    assert _loaded_after_import(module, heavy) == []
@@ -0,0 +1,84 @@
+import numpy as np
+from ..automin.linesearch import backtracking, strong_wolfe
+from ..automin.optimizer import minimize
+from ..automin.autodiff.variables import Variable
+
+
+def rosen(x):
+    return 100*(x[1]-x[0]**2)**2 + (1-x[0])**2
+
+
+def rosen_grad(x):
+    return np.array([-400*x[0]*(x[1]-x[0]**2) - 2*(1-x[0]), 200*(x[1]-x[0]**2)])
+
+
+def test_backtracking_armijo():
+    x = np.array([-1.2, 1.])
+    p = -rosen_grad(x)
+    f0, slope = rosen(x), rosen_grad(x) @ p
+    alpha, f_new = backtracking(rosen, x, p, f0, slope, beta=0.5, c=1e-4)
+    assert f_new == rosen(x + alpha*p)
+    assert f_new <= f0 + 1e-4*alpha*slope
+    # the previous step was rejected
+    assert rosen(x + 2*alpha*p) > f0 + 2e-4*alpha*slope
+
+
+def test_strong_wolfe_conditions():
+    for x in (np.array([-1.2, 1.]), np.array([2., 2.]), np.array([0.3, -0.5])):
+        g0 = rosen_grad(x)
+        p = -g0
+        for c2 in (0.9, 0.1):
+            alpha, f_new, g_new = strong_wolfe(rosen, rosen_grad, x, p, rosen(x), g0, c2=c2)
+            assert alpha > 0
+            assert f_new == rosen(x + alpha*p)
+            np.testing.assert_array_equal(g_new, rosen_grad(x + alpha*p))
+            assert f_new <= rosen(x) + 1e-4*alpha*(g0 @ p)
+            assert abs(g_new @ p) <= c2*abs(g0 @ p)
+
+
+def test_strong_wolfe_expands_short_step():
+    f = lambda x: (x @ x)
+    grad = lambda x: 2*x
+    x = np.array([10.])
+    alpha, f_new, g_new = strong_wolfe(f, grad, x, np.array([-1.]), f(x), grad(x),
+                                       alpha_init=1e-3, c2=0.1)
+    assert abs(f_new) < 1
+
+
+def test_strong_wolfe_directional_probes():
+    n_grad = [0]
+
+    def grad(x):
+        n_grad[0] += 1
+        return rosen_grad(x)
+
+    slope = lambda x_new: rosen_grad(x_new) @ p
+    for x in (np.array([-1.2, 1.]), np.array([2., 2.]), np.array([0.3, -0.5])):
+        g0 = rosen_grad(x)
+        p = -g0
+        expected = strong_wolfe(rosen, rosen_grad, x, p, rosen(x), g0, c2=0.1)
+        n_grad[0] = 0
+        alpha, f_new, g_new = strong_wolfe(rosen, grad, x, p, rosen(x), g0, c2=0.1, slope=slope)
+        # same step, the gradient is computed at most at the first trial
+        # step and at the accepted one
+        assert alpha == expected[0] and f_new == expected[1]
+        np.testing.assert_array_equal(g_new, expected[2])
+        assert n_grad[0] <= 2
+
+
+def test_line_search_gradient_evaluations():
+    # the gradient at the accepted step is reused by the next iteration;
+    # the secant steps used before took 92, 2583 and 1006 gradients
+    max_grad = {'BFGS': 50, 'L-BFGS': 50, 'Steepest Descent': 2000, 'Conjugate Gradient': 50}
+    for method in max_grad:
+        n_grad = [0]
+
+        def f(x, y):
+            if isinstance(x, Variable):
+                n_grad[0] += 1
+            return (1-x)**2 + 100*(y-x**2)**2
+
+        r = minimize(f, [2, 2], method, mode='forward')
+        assert r.converge
+        assert np.linalg.norm(r.x - np.array([1, 1])) < 1e-2
+        assert n_grad[0] <= max_grad[method]
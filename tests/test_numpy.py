@@ -247,6 +247,78 @@ def test_variable_scalar_pow():
 
 
 
+def test_operator_registry():
+    from ..automin.autodiff.operators import OPERATORS, UnaryOperator
+    from ..automin.autodiff.reverse import Tape
+    from ..automin.autodiff.variables import unary_user_function
+
+    # every AD_numpy primitive is a registered, prebuilt operator
+    for name in ['sin', 'cos', 'exp', 'log', 'sqrt', 'logistic', 'add', 'pow']:
+        assert name in OPERATORS
+
+    # user functions are operator objects usable in both AD modes
+    square = unary_user_function(lambda x: x**2, lambda x: 2*x)
+    assert isinstance(square, UnaryOperator)
+    assert (square(Variable('x', 3)).jacobian() == {'x': 6})
+    assert (square(Tape().variable('x', 3)).jacobian() == {'x': 6})
+    assert (square(3) == 9)
+
+    # log with a base other than e
+    f = anp.log(Variable('x', 8.), base=2)
+    assert abs(f.val - 3) < 1e-12
+    assert abs(f.partial_der(Variable('x', 8.)) - 1/(8*np.log(2))) < 1e-12
+
+
+def test_domain_checks_on_arrays():
+    from ..automin.autodiff.reverse import grad
+    from ..automin.autodiff.compiler import compile
+    import warnings
+
+    vals = np.array([0.25, -0.5, 4.])
+    x = Variable('x', vals)
+    # arrays are checked element by element
+    with pytest.raises(ValueError, match='math domain error'):
+        anp.sqrt(x)
+    with pytest.raises(ValueError):
+        anp.log(vals)
+    assert np.allclose(anp.arcsin(Variable('x', np.array([-0.5, 0.5]))).val, np.arcsin([-0.5, 0.5]))
+    assert anp.get_domain_policy() == 'raise'
+
+    with anp.domain_policy('nan'):
+        y = anp.sqrt(x)
+        assert np.allclose(y.val, [0.5, np.nan, 2.], equal_nan=True)
+        assert np.allclose(y.partial_der(x), [1., np.nan, 0.25], equal_nan=True)
+        assert np.isnan(anp.log(-1.))
+    with anp.domain_policy('mask'):
+        y = anp.log(x)
+        assert np.allclose(y.val, [np.log(0.25), 0., np.log(4.)])
+        assert np.allclose(y.partial_der(x), [4., 0., 0.25])
+        assert np.allclose(anp.log10(vals), [np.log10(0.25), 0., np.log10(4.)])
+        # a masked batch loss ignores the bad rows, in every mode
+        fn = lambda a: np.sum(anp.log(a*vals))
+        assert np.isclose(grad(fn, [2.], ['a'])[0], 2/2.)
+        plan = compile(fn, 1, [2.])
+        assert np.isclose(plan(2.), np.log(0.5) + np.log(8.))
+        assert np.isclose(plan.grad([2.])[0], 1.)
+    assert anp.get_domain_policy() == 'raise'
+
+    # compiled plans check at every replay, unless trusted
+    plan = compile(lambda a: anp.sqrt(a), 1, [4.])
+    with pytest.raises(ValueError):
+        plan(-1.)
+    # with the policy they were traced with
+    with anp.domain_policy('nan'), pytest.raises(ValueError):
+        plan(-1.)
+    trusted = compile(lambda a: anp.sqrt(a), 1, [4.], trusted=True)
+    with warnings.catch_warnings():
+        warnings.simplefilter('ignore')
+        assert np.isnan(trusted(-1.))
+    assert len(trusted) == len(plan) == 1
+
+    with pytest.raises(ValueError):
+        anp.set_domain_policy('clip')
+
+
 test_numpy_scalar_add_minus()
 test_numpy_scalar_multiple_divide()
 test_variable_scalar_pow()
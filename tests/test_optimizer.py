@@ -1,10 +1,14 @@
 import pytest
 import pandas as pd
 import sys, os
+import warnings
 import numpy as np
 import sys
 from ..automin.autodiff import AD_numpy as anp
+from ..automin.autodiff.variables import _NAMES
 from ..automin.optimizer import minimize, PRECISION, Model, minimize_over_data
+from ..automin.optimizer import (get_gradient_batch, get_gradient, minimize_multistart, value_and_grad,
+                                 value_and_directional)
 
 def rosenbrock(method):
     a = 1
@@ -80,6 +84,13 @@ def test_conjugate_gradient():
     saddle(m)
     start_at_max(m)
 
+    # a line search landing exactly on the minimum leaves a zero slope
+    with warnings.catch_warnings():
+        warnings.simplefilter('error', RuntimeWarning)
+        r = minimize(lambda x,y: x**2 + y**2, [20,12], m)
+    assert r.converge
+    np.testing.assert_array_equal(r.x, [0., 0.])
+
 def test_steepest_descent():
     m = 'Steepest Descent'
     rosenbrock(m)
@@ -90,6 +101,61 @@ def test_steepest_descent():
     saddle(m)
     start_at_max(m)
 
+def test_newton():
+    m = 'Newton'
+    rosenbrock(m)
+    no_minimum(m)
+    parabola(m)
+    at_minimum(m)
+    parabola_univariate(m)
+    saddle(m)
+    start_at_max(m)
+
+    # the default method is Newton, and it needs far fewer iterations
+    f = lambda x,y: (1-x)**2 + 100*(y-x**2)**2
+    r = minimize(f, [2,2])
+    assert r.converge
+    assert len(r.val_rec) < 50
+    assert len(r.val_rec) < len(minimize(f, [2,2], 'BFGS').val_rec)
+
+    # 'None' is BFGS, and the default falls back to BFGS for objectives that
+    # read the value of their inputs, which Newton cannot differentiate twice
+    np.testing.assert_array_equal(minimize(f, [2,2], 'None').x, minimize(f, [2,2], 'BFGS').x)
+    g = lambda x,y: ((x-1)**2 if getattr(x, 'val', x) > 1 else 2*(x-1)**2) + (y-2)**2
+    with pytest.raises(TypeError):
+        minimize(g, [3,0], 'Newton')
+    r = minimize(g, [3,0])
+    assert r.converge
+    np.testing.assert_allclose(r.x, minimize(g, [3,0], 'BFGS').x)
+
+def test_LBFGS():
+    m = 'L-BFGS'
+    rosenbrock(m)
+    no_minimum(m)
+    parabola(m)
+    at_minimum(m)
+    parabola_univariate(m)
+    saddle(m)
+    start_at_max(m)
+
+    # large quadratic, solved with memory linear in the dimension
+    n = 200
+    scale = np.linspace(1, 10, n)
+    f = lambda *x: sum(a*(x_i-1)**2 for a, x_i in zip(scale, x))
+    r = minimize(f, np.zeros(n), m, m = 5, mode = 'reverse')
+    assert r.converge
+    assert np.allclose(r.x, 1, atol = 1e-3)
+
+    # both quasi-Newton methods name their line search constants c1 and c2,
+    # and take the former keyword c of BFGS as c2
+    f = lambda x,y: (1-x)**2 + 100*(y-x**2)**2
+    for method in ['BFGS', 'L-BFGS']:
+        r = minimize(f, [2,2], method, c1=1e-3, c2=0.5)
+        assert r.converge
+        with pytest.warns(DeprecationWarning):
+            legacy = minimize(f, [2,2], method, c=0.5, c1=1e-3)
+        np.testing.assert_array_equal(legacy.x, r.x)
+
 def test_minimize_over_data():
     indep_var = np.random.normal(size = (100,2))
     data = pd.DataFrame(data = indep_var, columns = ['indep_var1','indep_var2'])
@@ -116,5 +182,139 @@ def test_minimize_over_data():
     assert np.linalg.norm(r_stoch.x - np.array([2,3])) < 0.1
 
 
+def test_minimize_over_data_minibatch():
+    np.random.seed(1)
+    indep_var = np.random.normal(size = (500,2))
+    data = pd.DataFrame(data = indep_var, columns = ['indep_var1','indep_var2'])
+    data['dep_var'] = 2*data.indep_var1 - 3*data.indep_var2 + 1
+
+    class Linear(Model):
+        def predict(self, b0, b1, b2):
+            return b0 + self.data['indep_var1']*b1 + self.data['indep_var2']*b2
+
+        def loss(self, b0, b1, b2):
+            return np.sum((self.predict(b0, b1, b2) - self.data['dep_var'])**2)
+
+    class LinearPerRow(Linear):
+        def loss(self, b0, b1, b2):
+            # one loss per row, as an array-valued Variable
+            return (self.predict(b0, b1, b2) - self.data['dep_var'])**2
+
+    model = Linear(data)
+    for method, kwargs in [('Gradient Descent', {'lr': 0.1}),
+                           ('Momentum', {'lr': 0.01, 'momentum': 0.9}),
+                           ('Adam', {'lr': 0.1})]:
+        r = minimize_over_data(model, [0, 0, 0], method, 20, stochastic = True,
+                               batch_size = 32, **kwargs)
+        assert np.linalg.norm(r.x - np.array([1, 2, -3])) < 1e-2
+        # one step per batch, 16 batches per epoch
+        assert len(r.val_rec) == 1 + 20*16
+    # the full data is restored after training
+    assert model.data is data
+
+    r = minimize_over_data(LinearPerRow(data), [0, 0, 0], 'Gradient Descent', 20,
+                           stochastic = True, batch_size = 500, lr = 0.5)
+    assert np.linalg.norm(r.x - np.array([1, 2, -3])) < 1e-2
+
+    with pytest.raises(ValueError):
+        minimize_over_data(model, [0, 0, 0], 'BFGS', 1, stochastic = True)
+    # misspelled or foreign keywords are not ignored
+    for method, kwargs in [('Gradient Descent', {'learning_rate': 0.1}),
+                           ('Gradient Descent', {'momentum': 0.9}),
+                           ('Adam', {'momentum': 0.9})]:
+        with pytest.raises(TypeError):
+            minimize_over_data(model, [0, 0, 0], method, 1, stochastic = True, **kwargs)
+
+
+def test_gradient_batch():
+    f = lambda x,y: 100*(y-x**2)**2 + (1-x)**2 + anp.exp(x*y)
+    X = np.random.uniform(-2, 2, size = (50,2))
+    expected = np.array([get_gradient(f, x, ['x0','x1']) for x in X])
+    for mode in ['forward', 'reverse']:
+        G = get_gradient_batch(f, X, mode = mode)
+        assert G.shape == (50, 2)
+        assert np.allclose(G, expected)
+
+    # inputs the objective does not use get zero gradient
+    G = get_gradient_batch(lambda x,y: x**2, X)
+    assert np.allclose(G[:,0], 2*X[:,0])
+    assert np.all(G[:,1] == 0)
+
+    with pytest.raises(ValueError):
+        get_gradient_batch(f, [1., 2.])
+
+
+def test_value_and_grad():
+    f = lambda x,y: 100*(y-x**2)**2 + (1-x)**2 + anp.exp(x*y)
+    x = [0.5, -1.5]
+    expected = f(*x)
+    for mode in ['auto', 'forward', 'reverse', 'compiled']:
+        val, grad = value_and_grad(f, x, mode=mode)
+        assert np.isclose(val, expected)
+        assert np.allclose(grad, get_gradient(f, x, ['x0','x1']))
+
+    # every method reports the objective value at its result
+    for method in ['BFGS', 'L-BFGS', 'Newton', 'Conjugate Gradient', 'Steepest Descent']:
+        r = minimize(_shifted_parabola, [0, 0], method, history='off')
+        assert r.fun == _shifted_parabola(*r.x)
+        assert r.fun < 1e-6
+
+    # the names of a call are only registered during the call, tangents are
+    # as long as its inputs whatever the calls before
+    n_names = len(_NAMES)
+    value_and_grad(lambda *x: sum(x), np.ones(500))
+    assert len(_NAMES) == n_names
+    widths = []
+    g = lambda x, y: widths.append(x.tangent.shape[-1]) or x*y
+    assert np.array_equal(value_and_grad(g, [2., 3.])[1], [3., 2.])
+    assert widths == [n_names + 2]
+
+    with pytest.raises(ValueError):
+        value_and_grad(f, x, mode='symbolic')
+
+
+def test_value_and_directional():
+    f = lambda x,y: 100*(y-x**2)**2 + (1-x)**2 + anp.exp(x*y)
+    x, s = [0.5, -1.5], [2., 0.5]
+    val, grad = value_and_grad(f, x)
+    for mode in ['auto', 'forward', 'reverse', 'compiled']:
+        v, slope = value_and_directional(f, x, s, mode=mode)
+        assert np.isclose(v, val)
+        assert np.isclose(slope, grad @ s)
+
+    # batched inputs give one slope per point
+    X = np.random.uniform(-1, 1, size=(5, 2))
+    vals, slopes = value_and_directional(f, X.T, s)
+    assert np.allclose(slopes, get_gradient_batch(f, X) @ s)
+
+    # line searches probing with directional derivatives find the same minimum
+    for method in ['Steepest Descent', 'Conjugate Gradient']:
+        r = minimize(_shifted_parabola, [0, 0], method, mode='forward', directional=True, history='off')
+        assert r.converge and r.fun < 1e-6
+
+
+def _shifted_parabola(x, y):
+    return (x-1)**2 + (y+2)**2
+
+def test_minimize_multistart():
+    x0_list = [[0, 0], [3, 3], [-5, 2], [10, -10]]
+    res = minimize_multistart(_shifted_parabola, x0_list, 'BFGS', workers = 2)
+    assert len(res.results) == 4
+    assert all(r.converge for r in res.results)
+    assert np.allclose(res.best.x, [1, -2], atol = 1e-3)
+    assert res.values[res.best_index] == min(res.values)
+
+    # sequential run stops at the first start that reaches the target
+    res = minimize_multistart(_shifted_parabola, x0_list, 'BFGS', workers = 1, target = 1e-6)
+    assert res.results[0] is not None
+    assert res.results[1:] == [None, None, None]
+    assert res.best_index == 0
+
+    # lambdas cannot be sent to worker processes
+    with pytest.warns(UserWarning):
+        res = minimize_multistart(lambda x: x**2, [[1], [2]], 'BFGS', workers = 2)
+    assert len(res.results) == 2
+
+
 if __name__ == "__main__":
     test_optimization()
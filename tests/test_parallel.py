@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+from multiprocessing import shared_memory
+from ..automin.autodiff import AD_numpy as anp
+from ..automin.optimizer import Model, minimize_over_data, _objective
+from ..automin.parallel import ShardedLoss
+from ..automin.data import batch
+
+
+class Logistic(Model):
+    def loss(self, b0, b1, b2):
+        d = self.data
+        p = anp.logistic(b0 + b1*d['x1'] + b2*d['x2'])
+        return np.sum((p - d['label'])**2)
+
+
+def _frame(n=301):
+    rng = np.random.RandomState(0)
+    frame = pd.DataFrame({'x1': rng.normal(size=n), 'x2': rng.normal(size=n)})
+    frame['label'] = (frame.x1 - frame.x2 + 0.3*rng.normal(size=n) > 0).astype(float)
+    frame['tag'] = ['row'+str(i) for i in range(n)]
+    return frame
+
+
+def test_sharded_loss_matches_single_process():
+    frame = _frame()
+    x = np.array([0.1, 0.5, -0.2])
+    local = Logistic(batch({k: frame[k].values for k in ['x1', 'x2', 'label']}, slice(None)))
+    f, value_and_grad, _ = _objective(local.loss, x, ['x0', 'x1', 'x2'])
+    val, grad = value_and_grad(x)
+    for mode in ['auto', 'forward', 'reverse']:
+        with ShardedLoss(Logistic(frame), x, workers=3, mode=mode) as loss:
+            assert len(loss.processes) == 3
+            assert np.isclose(loss(*x), f(x))
+            np.testing.assert_allclose(loss.grad(x), grad)
+            sharded_val, sharded_grad = loss.value_and_grad(x)
+            assert np.isclose(sharded_val, val)
+            np.testing.assert_allclose(sharded_grad, grad)
+            names = [block.name for block in loss.blocks]
+        # the object column 'tag' is not placed in shared memory
+        assert len(names) == 3
+        # workers are stopped and the shared memory is released
+        for name in names:
+            with pytest.raises(FileNotFoundError):
+                shared_memory.SharedMemory(name=name)
+        assert loss.processes == []
+
+
+def test_sharded_loss_errors():
+    class Broken(Model):
+        def loss(self, b):
+            return np.sum(self.data['missing'] * b)
+
+    with pytest.raises(KeyError):
+        ShardedLoss(Broken(_frame()), [0.], workers=2)
+
+
+def test_minimize_over_data_workers():
+    frame = _frame()
+    cols = batch({k: frame[k].values for k in ['x1', 'x2', 'label']}, slice(None))
+    single = minimize_over_data(Logistic(cols), [0, 0, 0], 'BFGS', 200, history='off')
+    sharded = minimize_over_data(Logistic(frame), [0, 0, 0], 'BFGS', 200, workers=2, history='off')
+    assert sharded.converge
+    np.testing.assert_allclose(sharded.x, single.x, rtol=1e-6)
+
+    with pytest.raises(ValueError):
+        minimize_over_data(Logistic(frame), [0, 0, 0], 'Newton', 10, workers=2)
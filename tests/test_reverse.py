@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+from ..automin.autodiff import AD_numpy as anp
+from ..automin.autodiff.reverse import Tape, grad
+from ..automin.optimizer import minimize, _get_grad
+
+
+def test_reverse_scalar_ops():
+    tape = Tape()
+    x = tape.variable('x', 2)
+    y = tape.variable('y', -5)
+
+    f1 = 3-x-y-2
+    assert (f1.val == 4)
+    assert (f1.jacobian() == {'x':-1, 'y':-1})
+
+    f2 = x*y
+    assert (f2.jacobian() == {'x':-5, 'y':2})
+    assert (f2.partial_der(x) == -5)
+
+    f3 = x/y
+    assert (f3.jacobian() == {'x':-0.2, 'y':-0.08})
+
+    f4 = 2**x
+    assert (f4.jacobian() == {'x':4*np.log(2)})
+
+    f5 = -x + x
+    assert (f5.partial_der(x) == 0)
+    assert (f5.partial_der(y) == 0)
+
+    with pytest.raises(ZeroDivisionError):
+        x/0
+
+    with pytest.raises(ValueError):
+        x + Tape().variable('z', 1)
+
+
+def test_reverse_matches_forward():
+    fns = [
+        lambda x, y: 100*(y-x**2)**2 + (1-x)**2,
+        lambda x, y: anp.sin(x*y) + anp.exp(x)/anp.cos(y) - anp.log(x),
+        lambda x, y: anp.logistic(x) + anp.sqrt(y) + anp.arctan(x/y),
+        lambda x, y: x**y + anp.tanh(x-y),
+    ]
+    names = ['x0', 'x1']
+    for f in fns:
+        for point in ([1., 2.], [0.3, 0.7]):
+            np.testing.assert_allclose(_get_grad(f, point, names, 'reverse'),
+                                       _get_grad(f, point, names, 'forward'))
+
+
+def test_reverse_sum_over_data():
+    data = np.linspace(-1, 1, 7)
+    fn = lambda a, b: np.sum((a*data - b)**2) / np.mean(b + 0*data)
+    x = np.array([0.3, 2.])
+    np.testing.assert_allclose(grad(fn, x, ['a', 'b']), _get_grad(fn, x, ['a', 'b'], 'forward'))
+    # the sum spreads its adjoint over data broadcast from a scalar input
+    fn = lambda a, b: np.sum(a + data) * b
+    np.testing.assert_allclose(grad(fn, x, ['a', 'b']), [14., 0.3*7])
+
+
+def test_reverse_many_inputs():
+    n = 200
+    f = lambda *x: sum((x_i - i)**2 for i, x_i in enumerate(x))
+    x = np.zeros(n)
+    np.testing.assert_allclose(grad(f, x, ['x'+str(i) for i in range(n)]),
+                               -2*np.arange(n))
+
+
+def test_reverse_constant_objective():
+    f = lambda x, y: 3
+    assert np.array_equal(grad(f, [1, 2], ['x0', 'x1']), [0, 0])
+
+
+def test_reverse_optimizers():
+    f = lambda x, y: (1-x)**2 + 100*(y-x**2)**2
+    for method in ['BFGS', 'Steepest Descent', 'Conjugate Gradient']:
+        r = minimize(f, [2, 2], method, mode='reverse')
+        assert r.converge
+        assert np.linalg.norm(r.x - np.array([1, 1])) < 1e-2
+
+    with pytest.raises(ValueError):
+        minimize(f, [2, 2], 'BFGS', mode='sideways')
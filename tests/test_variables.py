@@ -274,6 +274,79 @@ def test_variable_scalar_pow():
     '''
 
 
+def test_variable_dense_tangent():
+    x = Variable('x', 2)
+    y = Variable('y', -5)
+
+    # every variable shares the registry slots, derivatives live in one array
+    f = x*y + 3*x
+    assert (f.tangent.ndim == 1)
+    assert (f.jacobian() == {'x': -2, 'y': 2})
+    assert np.array_equal(f.gradient(['y', 'x']), [2, -2])
+
+    # inputs registered after f was built are padded on demand
+    z = Variable('z_dense_tangent', 1.5)
+    g = f*z
+    assert (g.jacobian() == {'x': -3.0, 'y': 3.0, 'z_dense_tangent': -4.0})
+    assert np.array_equal(f.gradient(['z_dense_tangent']), [0])
+    assert (f.partial_der(z) == 0)
+
+    # array values keep element-wise derivatives
+    a = Variable('x', np.array([1., 2., 3.]))
+    h = a**2 + y
+    assert np.array_equal(h.partial_der(a), [2., 4., 6.])
+    assert np.array_equal(h.partial_der(y), [1., 1., 1.])
+    assert (h.gradient(['x', 'y']).shape == (3, 2))
+
+    # non-primitive construction from a dict of derivatives
+    v = Variable('v', 3, {'x': 2, 'y': 4}, False)
+    assert (v.jacobian() == {'x': 2, 'y': 4})
+
+
+def test_variable_array_reductions():
+    a = Variable('a', 2.)
+    b = Variable('b', -1.)
+    x = a*np.array([[1., 2., 3.], [4., 5., 6.]]) + b
+    s = np.sum(x)
+    assert s.val == 36.0
+    assert s.jacobian() == {'a': 21.0, 'b': 6.0}
+
+    cols = x.sum(axis=0)
+    assert np.array_equal(cols.val, [8., 12., 16.])
+    assert np.array_equal(cols.partial_der(a), [5., 7., 9.])
+
+    m = np.mean(x, axis=-1)
+    assert np.allclose(m.val, [3., 9.])
+    assert np.allclose(m.partial_der(a), [2., 5.])
+    assert np.allclose(m.partial_der(b), [1., 1.])
+
+    # b only reaches the array through broadcasting
+    c = np.mean(b + np.zeros(4))
+    assert c.val == -1.0
+    assert c.jacobian() == {'b': 1.0}
+
+
+def test_variable_lazy_names():
+    a = Variable('a', 2.)
+    b = Variable('b', 3.)
+    f = anp.sin(a*b) + a
+    # intermediate names are only built when read
+    assert f._name is None
+    assert f.name == 'f(a,b)'
+    assert repr(f).startswith('Variable name: f(a,b), Value:')
+    assert (+a).name == 'a'
+    f.name = 'g'
+    assert f.name == 'g'
+
+
+def test_variable_nodes_have_no_dict():
+    a = Variable('a', 2.)
+    f = a*a + 1
+    assert not hasattr(f, '__dict__')
+    with pytest.raises(AttributeError):
+        f.label = 'loss'
+
+
 test_variable_scalar_add_minus()
 test_variable_scalar_multiple_divide()
 test_variable_scalar_pow()
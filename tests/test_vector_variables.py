@@ -0,0 +1,103 @@
+import numpy as np
+import pytest
+from ..automin.autodiff import AD_numpy as anp
+from ..automin.autodiff.variables import Variable
+from ..automin.autodiff.vector_variables import (vectorize_variable, jacobian_sparsity,
+                                                  color_columns, sparse_jacobian)
+
+
+@vectorize_variable
+def vec_fn(x, y, z):
+    f1 = x * y + anp.sin(y)
+    f2 = x + anp.exp(z)
+    f3 = 2 * z
+    return [f1, f2, f3]
+
+
+def test_vector_jacobian_formats():
+    x = Variable('x', 2.)
+    y = Variable('y', 3.)
+    z = Variable('z', 0.)
+    f = vec_fn(x, y, z)
+
+    expected = np.array([[3., 2+np.cos(3.), 0.],
+                         [1., 0., 1.],
+                         [0., 0., 2.]])
+    assert f.columns == ['x', 'y', 'z']
+    assert np.allclose(f.jacobian('array'), expected)
+    assert np.allclose(f.jacobian().values, expected)
+    assert list(f.jacobian().columns) == ['x', 'y', 'z']
+    csr = f.jacobian('csr')
+    assert csr.nnz == 5
+    assert np.allclose(csr.toarray(), expected)
+
+    assert np.allclose(f.partial_der(y), [2+np.cos(3.), 0., 0.])
+    assert np.array_equal(f.partial_der(Variable('w', 1.)), [0., 0., 0.])
+
+    with pytest.raises(ValueError):
+        f.jacobian('coo')
+
+
+def test_vector_jacobian_many_outputs():
+    n = 40
+    xs = [Variable('v'+str(i), float(i+1)) for i in range(n)]
+    f = vectorize_variable(lambda *x: [x_i**2 for x_i in x])(*xs)
+    # columns are sorted by name like the former dataframe jacobian
+    assert f.columns == sorted('v'+str(i) for i in range(n))
+    order = [int(name[1:]) for name in f.columns]
+    assert np.allclose(f.jacobian('array')[order, range(n)], 2*(np.array(order)+1))
+    assert f.jacobian('csr').nnz == n
+
+
+def _tridiagonal(*x):
+    n = len(x)
+    return [(3-2*x[i])*x[i] - (x[i-1] if i > 0 else 0) - 2*(x[i+1] if i < n-1 else 0) + 1
+            for i in range(n)]
+
+
+def test_jacobian_sparsity_and_coloring():
+    n = 50
+    x = np.linspace(-1, 1, n)
+    pattern = jacobian_sparsity(_tridiagonal, x)
+    expected = np.eye(n) + np.eye(n, k=1) + np.eye(n, k=-1)
+    assert np.array_equal(pattern.toarray(), expected.astype(bool))
+
+    # the pattern pass carries sets of inputs, not tangents; vector_Variable
+    # outputs, constant outputs and inputs appearing with a zero derivative
+    # are supported
+    f = vectorize_variable(lambda x, y, z: [x*y, anp.exp(z), 0*x + 1])
+    assert np.array_equal(jacobian_sparsity(f, [1., 2., 3.]).toarray(),
+                          [[True, True, False], [False, False, True], [True, False, False]])
+    assert jacobian_sparsity(lambda x, y: [x*y, 3], [1., 2.]).toarray().tolist() == \
+        [[True, True], [False, False]]
+
+    colors = color_columns(pattern)
+    assert colors.max() + 1 == 3
+    # no two columns of a color share a row
+    for row in expected:
+        cols = np.flatnonzero(row)
+        assert len(set(colors[cols])) == len(cols)
+
+
+def test_sparse_jacobian():
+    n = 50
+    names = ['s'+str(i) for i in range(n)]
+    x = np.linspace(-1, 1, n)
+    dense = vectorize_variable(_tridiagonal)(*[Variable(name, x_i) for name, x_i in zip(names, x)])
+    order = [dense.columns.index(name) for name in names]
+    jac = sparse_jacobian(_tridiagonal, x, names)
+    assert jac.nnz == 3*n - 2
+    assert np.allclose(jac.toarray(), dense.jacobian('array')[:, order])
+
+    # the pattern and colors can be reused at another point
+    pattern = jacobian_sparsity(_tridiagonal, x, names)
+    colors = color_columns(pattern)
+    jac2 = sparse_jacobian(_tridiagonal, 2*x, names, sparsity=pattern, colors=colors)
+    assert np.allclose(jac2.diagonal(), 3-8*x)
+
+    # vector_Variable outputs and constant outputs are supported
+    f = vectorize_variable(lambda x, y: [x*y, anp.exp(y), 2*x + 0*y])
+    assert np.allclose(sparse_jacobian(f, [1., 2.]).toarray(),
+                       [[2., 1.], [0., np.exp(2.)], [2., 0.]])
+    g = lambda x, y: [x*y, 3]
+    assert np.allclose(sparse_jacobian(g, [1., 2.]).toarray(), [[2., 1.], [0., 0.]])